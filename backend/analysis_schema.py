@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import re
+from typing import Any
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# Le modèle entoure parfois le JSON d'un bloc ```json malgré la consigne
+JSON_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+
+class _Schema(BaseModel):
+    # additionalProperties: false, exigé par le mode "strict" des structured outputs
+    model_config = ConfigDict(extra="forbid")
+
+
+class Keywords(_Schema):
+    hard_skills: list[str] = Field(description="Hard skills de l'offre à ajouter au CV")
+    to_reinforce: list[str] = Field(description="Compétences déjà présentes à mettre davantage en avant")
+    soft_skills: list[str] = Field(description="Soft skills pertinents pour le poste")
+    tools: list[str] = Field(description="Outils, technologies, environnements à mentionner")
+    other: list[str] = Field(description="Autres mots-clés de l'offre absents du CV")
+
+
+class AnalysisResult(_Schema):
+    """Analyse CV / offre, au format renvoyé par le modèle en mode JSON."""
+
+    score: int = Field(description="Score global d'adéquation, entier de 0 à 100")
+    summary: str = Field(description="Résumé du fit global, 3 à 5 phrases")
+    strengths: list[str] = Field(description="5 à 7 points forts du candidat pour ce poste")
+    weaknesses: list[str] = Field(description="5 à 7 points faibles ou risques de non-sélection")
+    action_plan: list[str] = Field(description="Actions concrètes sur le CV, dans l'ordre")
+    titles: list[str] = Field(description="2 ou 3 titres de CV, une ligne chacun")
+    hooks: list[str] = Field(description="2 ou 3 paragraphes d'accroche de 3 à 5 phrases")
+    keywords: Keywords
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _clamp_score(cls, value: Any) -> int:
+        # ValueError (et non TypeError) : pydantic la convertit en ValidationError
+        try:
+            score = int(value)
+        except (TypeError, ValueError, OverflowError) as exc:
+            raise ValueError(f"score non numérique : {value!r}") from exc
+        return max(0, min(score, 100))
+
+    def to_markdown(self, note: str | None = None) -> str:
+        """Même rendu que l'analyse markdown historique (score en tête, 6 sections)."""
+        lines = [f"Score global : {self.score}/100", ""]
+        if note:
+            lines += [note, ""]
+        lines += ["## 1. Résumé du fit global", self.summary, ""]
+        lines += ["## 2. Forces principales pour ce poste", *_bullets(self.strengths), ""]
+        lines += ["## 3. Points faibles / risques de non-sélection", *_bullets(self.weaknesses), ""]
+        lines += ["## 4. Plan d'action pour améliorer le CV", *_numbered(self.action_plan), ""]
+        lines += ["## 5. Titre de CV + accroche optimisée"]
+        lines += _bullets(f"Titre : {title}" for title in self.titles)
+        lines += _bullets(f"Accroche : {hook}" for hook in self.hooks)
+        lines += ["", "## 6. Compétences et mots-clés à ajouter ou renforcer"]
+        keyword_lines = [
+            _keyword_line("Hard skills à ajouter", self.keywords.hard_skills),
+            _keyword_line("À renforcer (déjà présents, à mettre en avant)", self.keywords.to_reinforce),
+            _keyword_line("Soft skills attendus", self.keywords.soft_skills),
+            _keyword_line("Outils / environnements à mentionner", self.keywords.tools),
+            _keyword_line("Autres mots-clés de l'offre", self.keywords.other),
+        ]
+        lines += _bullets(line for line in keyword_lines if line) or ["- Aucun mot-clé manquant détecté."]
+        return "\n".join(lines)
+
+
+class RewrittenExperience(_Schema):
+    title: str = Field(description="Intitulé du poste et entreprise")
+    context: str = Field(description="Contexte de l'expérience, 1 à 2 lignes")
+    bullets: list[str] = Field(description="4 à 7 bullet points réécrits, orientés résultats")
+
+
+class RewriteKeywords(_Schema):
+    title: list[str] = Field(description="Mots-clés à insérer dans le titre")
+    hook: list[str] = Field(description="Mots-clés à insérer dans l'accroche")
+    experiences: list[str] = Field(description="Mots-clés à insérer dans les expériences")
+
+
+class RewriteResult(_Schema):
+    """Réécriture Pro, au format renvoyé par le modèle en mode JSON."""
+
+    titles: list[str] = Field(description="3 titres de CV, une ligne chacun")
+    hooks: list[str] = Field(description="3 paragraphes d'accroche de 3 à 5 phrases")
+    experiences: list[RewrittenExperience] = Field(description="1 ou 2 expériences les plus pertinentes")
+    keywords: RewriteKeywords
+
+    def to_markdown(self) -> str:
+        lines = ["## 1. Titre de CV – 3 variantes", *_bullets(self.titles), ""]
+        lines += ["## 2. Paragraphe d'accroche – 3 variantes", *_numbered(self.hooks), ""]
+        lines += ["## 3. Expériences à réécrire"]
+        for experience in self.experiences:
+            lines += ["", f"### {experience.title}", experience.context, "", *_bullets(experience.bullets)]
+        lines += ["", "## 4. Mots-clés à insérer dans le CV"]
+        keyword_lines = [
+            _keyword_line("**Titre**", self.keywords.title),
+            _keyword_line("**Accroche**", self.keywords.hook),
+            _keyword_line("**Expériences**", self.keywords.experiences),
+        ]
+        lines += _bullets(line for line in keyword_lines if line)
+        return "\n".join(lines)
+
+
+SCHEMAS: dict[str, type[AnalysisResult] | type[RewriteResult]] = {
+    "analyze": AnalysisResult,
+    "rewrite": RewriteResult,
+}
+
+
+def _bullets(items: Any) -> list[str]:
+    return [f"- {item}" for item in items]
+
+
+def _numbered(items: list[str]) -> list[str]:
+    return [f"{number}. {item}" for number, item in enumerate(items, start=1)]
+
+
+def _keyword_line(label: str, values: list[str]) -> str:
+    return f"{label} : {', '.join(values)}." if values else ""
+
+
+def response_format(kind: str) -> dict[str, Any]:
+    """`response_format` de l'API chat (structured outputs, schéma strict)."""
+    model = SCHEMAS[kind]
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": model.__name__, "strict": True, "schema": model.model_json_schema()},
+    }
+
+
+def parse_result(kind: str, content: str) -> AnalysisResult | RewriteResult:
+    """Valide la réponse JSON du modèle (lève pydantic.ValidationError si elle est invalide)."""
+    fenced = JSON_FENCE_RE.match(content)
+    return SCHEMAS[kind].model_validate_json(fenced.group(1) if fenced else content)
+
+
+def looks_like_json(content: str) -> bool:
+    stripped = content.lstrip()
+    return stripped.startswith("{") or stripped.startswith("```")
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from fastapi import HTTPException, UploadFile
+
+from .embedding_index import CV, JOB, get_embedding_service
+from .llm_client import analyze_profile
+from .parse_cv import extract_text_from_validated_upload
+from .parse_engine import parse_engine
+from .settings import settings
+from .skill_matcher import SkillMatch, get_skill_matcher, score_skills
+from .upload_guard import new_file_hasher, validate_and_read_upload
+
+logger = logging.getLogger("fmp.batch")
+
+
+@dataclass
+class BatchCV:
+    """CV d'un batch, parsé une seule fois quel que soit le nombre d'offres."""
+
+    index: int
+    filename: str
+    text: str = ""
+    error: str | None = None
+
+
+def item_id(cv_index: int, job_index: int) -> str:
+    return f"cv{cv_index}-job{job_index}"
+
+
+async def parse_cvs(uploads: list[UploadFile]) -> list[BatchCV]:
+    """
+    Valide et parse chaque CV une fois. Le nombre de parsings simultanés est limité
+    au nombre de workers, pour ne pas saturer la file de `parse_engine` (503).
+    """
+    semaphore = asyncio.Semaphore(max(parse_engine.max_workers, 1))
+
+    async def parse_one(index: int, upload: UploadFile) -> BatchCV:
+        cv = BatchCV(index=index, filename=upload.filename or "")
+        async with semaphore:
+            try:
+                hasher = new_file_hasher()
+                file_bytes = await validate_and_read_upload(upload, hasher=hasher)
+                cv.text = await extract_text_from_validated_upload(
+                    upload, file_bytes, hasher.hexdigest()
+                )
+            except HTTPException as exc:
+                cv.error = str(exc.detail)
+                return cv
+        if not cv.text:
+            cv.error = "Aucun texte n'a pu être extrait de ce CV."
+        return cv
+
+    return list(await asyncio.gather(*(parse_one(i, upload) for i, upload in enumerate(uploads))))
+
+
+async def rank_pairs(cvs: list[BatchCV], job_texts: list[str]) -> dict[tuple[int, int], float] | None:
+    """
+    Similarité (cosinus des embeddings) de chaque couple (CV, offre) exploitable.
+    Rien n'est ajouté à l'index partagé (les CV d'un partenaire ne doivent pas remonter dans
+    les recherches des autres) : seuls les vecteurs déjà indexés sont réutilisés.
+    None si l'index d'embeddings est désactivé.
+    """
+    service = get_embedding_service()
+    if service is None:
+        return None
+    usable = [cv for cv in cvs if not cv.error]
+    if not usable:
+        return {}
+
+    cv_vectors = await service.vectors_for(CV, [cv.text for cv in usable])
+    job_vectors = await service.vectors_for(JOB, job_texts)
+    similarity = cv_vectors @ job_vectors.T
+    return {
+        (cv.index, job_index): float(similarity[row, job_index])
+        for row, cv in enumerate(usable)
+        for job_index in range(len(job_texts))
+    }
+
+
+def select_pairs(ranking: dict[tuple[int, int], float], top_k: int) -> set[tuple[int, int]]:
+    """Pour chaque offre, les `top_k` CV les plus proches : seuls couples envoyés à l'IA."""
+    by_job: dict[int, list[tuple[float, int]]] = {}
+    for (cv_index, job_index), score in ranking.items():
+        by_job.setdefault(job_index, []).append((score, cv_index))
+    selected: set[tuple[int, int]] = set()
+    for job_index, candidates in by_job.items():
+        candidates.sort(reverse=True)
+        selected.update((cv_index, job_index) for _, cv_index in candidates[:top_k])
+    return selected
+
+
+def find_skills(
+    cvs: list[BatchCV], job_texts: list[str]
+) -> tuple[dict[int, Counter[int]], list[Counter[int]]] | None:
+    """
+    Compétences du dictionnaire trouvées dans chaque CV et chaque offre, une seule fois
+    par texte (et non une fois par couple). None si le matching est désactivé.
+    """
+    if not settings.SKILLS_ENABLED:
+        return None
+    matcher = get_skill_matcher()
+    cv_skills = {cv.index: matcher.find(cv.text) for cv in cvs if not cv.error}
+    return cv_skills, [matcher.find(job_text) for job_text in job_texts]
+
+
+async def run_batch(
+    cvs: list[BatchCV],
+    job_texts: list[str],
+    concurrency: int,
+    ranking: dict[tuple[int, int], float] | None = None,
+    selected: set[tuple[int, int]] | None = None,
+) -> AsyncIterator[dict[str, Any]]:
+    """
+    Analyse chaque couple (CV, offre), au plus `concurrency` appels IA à la fois,
+    et renvoie les résultats dans leur ordre d'arrivée. Si le client se déconnecte,
+    les analyses restantes sont annulées.
+
+    Avec `ranking` (similarité par couple), les couples les plus proches partent en
+    premier ; avec `selected`, les autres ne sont pas analysés (statut "skipped").
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+    # Scan CPU des textes hors de la boucle d'événements, avant de lancer les analyses
+    found = await asyncio.to_thread(find_skills, cvs, job_texts)
+
+    def pair_skills(cv: BatchCV, job_index: int) -> SkillMatch | None:
+        if found is None or not found[1][job_index]:
+            return None
+        cv_skills, job_skills = found
+        return score_skills(get_skill_matcher(), cv_skills[cv.index], job_skills[job_index])
+
+    async def analyze_one(cv: BatchCV, job_index: int, job_text: str) -> dict[str, Any]:
+        item: dict[str, Any] = {
+            "type": "item",
+            "id": item_id(cv.index, job_index),
+            "cv": cv.index,
+            "job": job_index,
+        }
+        if cv.error:
+            return {**item, "status": "error", "error": cv.error}
+        if ranking is not None:
+            item["similarity"] = round(ranking[(cv.index, job_index)], 4)
+        if selected is not None and (cv.index, job_index) not in selected:
+            return {**item, "status": "skipped"}
+
+        skills = pair_skills(cv, job_index)
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                analysis = await analyze_profile(cv.text, job_text, raise_errors=True, skills=skills)
+            except Exception as exc:  # noqa: BLE001
+                logger.warning("Analyse %s en échec : %s", item["id"], exc)
+                return {**item, "status": "error", "error": type(exc).__name__}
+
+        return {
+            **item,
+            "status": "ok",
+            "skills_score": skills.score if skills else None,
+            "analysis": analysis,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000),
+        }
+
+    pairs = [(cv, job_index) for cv in cvs for job_index in range(len(job_texts))]
+    if ranking:
+        # Les tâches prennent le sémaphore dans leur ordre de création
+        pairs.sort(key=lambda pair: ranking.get((pair[0].index, pair[1]), float("-inf")), reverse=True)
+    tasks = [
+        asyncio.create_task(analyze_one(cv, job_index, job_texts[job_index]))
+        for cv, job_index in pairs
+    ]
+    try:
+        for next_result in asyncio.as_completed(tasks):
+            yield await next_result
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,378 @@
+from __future__ import annotations
+
+import array
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul process écrit dans l'index
+    fcntl = None  # type: ignore[assignment]
+
+try:
+    import numpy as np
+except ImportError:
+    np = None  # type: ignore[assignment]
+
+from .metrics import timed_stage
+from .prompt_compaction import terms
+from .settings import settings
+
+logger = logging.getLogger("fmp.embeddings")
+
+CV = "cv"
+JOB = "job"
+KIND_CODES = {CV: 0, JOB: 1}
+# Au-delà, le texte est tronqué avant l'appel au provider (limite d'entrée des modèles)
+MAX_INPUT_CHARS = 24_000
+# Lignes de la matrice multipliées à la fois : borne la mémoire temporaire d'une recherche
+CHUNK_ROWS = 65_536
+
+
+def content_id(kind: str, text: str, model: str) -> str:
+    """Identifiant d'un document : hash de son contenu (un même texte n'est indexé qu'une fois)."""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (kind, model, text):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class HashingEmbedder:
+    """
+    Embeddings locaux, sans modèle ni réseau : hachage des mots significatifs du texte
+    (fréquence sous-linéaire, signe aléatoire) dans un vecteur de taille fixe, normalisé.
+    Moins fin qu'un modèle sémantique, mais gratuit et déterministe.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimensions: int) -> None:
+        self.dimensions = dimensions
+
+    @staticmethod
+    @lru_cache(maxsize=65_536)
+    def _slot(term: str, dimensions: int) -> tuple[int, float]:
+        value = int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+        return value % dimensions, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts: list[str]) -> Any:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term, count in Counter(terms(text)).items():
+                slot, sign = self._slot(term, self.dimensions)
+                vectors[row, slot] += sign * (1 + math.log(count))
+        return vectors
+
+
+@dataclass
+class IndexedDocument:
+    id: str
+    kind: str
+    label: str
+    row: int
+
+
+@dataclass
+class Match:
+    id: str
+    kind: str
+    label: str
+    score: float
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"id": self.id, "kind": self.kind, "label": self.label, "score": round(self.score, 4)}
+
+
+class EmbeddingIndex:
+    """
+    Index de vecteurs sur disque, partagé entre les workers :
+
+    - `vectors.f32` : matrice float32 (une ligne par document), en ajout seul et lue
+      via `numpy.memmap` (pages partagées entre process, rien n'est chargé d'avance)
+    - `documents.jsonl` : id, type (cv / job) et libellé de chaque ligne, dans le même ordre
+
+    Les ajouts se font sans reconstruction (verrou de fichier entre process) ; les autres
+    workers voient les nouvelles lignes au prochain accès. Les vecteurs sont normalisés :
+    le produit scalaire est la similarité cosinus.
+    """
+
+    def __init__(self, directory: str | Path, dimensions: int) -> None:
+        self.directory = Path(directory)
+        self.dimensions = dimensions
+        self.vectors_path = self.directory / "vectors.f32"
+        self.documents_path = self.directory / "documents.jsonl"
+        self.lock_path = self.directory / "index.lock"
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._documents: list[IndexedDocument] = []
+        self._rows: dict[str, int] = {}
+        self._kinds = array.array("b")
+        self._documents_offset = 0
+        self._matrix: Any = None
+        self.searches = 0
+        self.appends = 0
+
+        with self._lock, self._file_lock():
+            self._repair()
+            self._refresh()
+
+    @property
+    def row_bytes(self) -> int:
+        return self.dimensions * 4
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Verrou entre process (workers uvicorn) autour des écritures."""
+        with open(self.lock_path, "a") as handle:
+            if fcntl is not None:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+            yield  # la fermeture du fichier libère le verrou
+
+    def _repair(self) -> None:
+        """Après un arrêt brutal : vecteurs sans métadonnées ou ligne JSON incomplète."""
+        self.vectors_path.touch()
+        self.documents_path.touch()
+        raw = self.documents_path.read_bytes()
+        if raw and not raw.endswith(b"\n"):
+            raw = raw[: raw.rfind(b"\n") + 1]
+            self.documents_path.write_bytes(raw)
+        rows = raw.count(b"\n")
+        expected = rows * self.row_bytes
+        size = self.vectors_path.stat().st_size
+        if size < expected:
+            raise RuntimeError(f"Index d'embeddings incohérent ({self.directory}) : vecteurs manquants")
+        if size > expected:
+            logger.warning("Index d'embeddings : %d octets de vecteurs orphelins retirés.", size - expected)
+            with open(self.vectors_path, "r+b") as handle:
+                handle.truncate(expected)
+
+    def _refresh(self) -> None:
+        """Lit les documents ajoutés depuis le dernier accès (par ce process ou un autre)."""
+        with open(self.documents_path, "rb") as handle:
+            handle.seek(self._documents_offset)
+            data = handle.read()
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return
+        for line in data[:end].splitlines():
+            entry = json.loads(line)
+            document = IndexedDocument(entry["id"], entry["kind"], entry.get("label", ""), len(self._documents))
+            self._documents.append(document)
+            self._rows[document.id] = document.row
+            self._kinds.append(KIND_CODES[document.kind])
+        self._documents_offset += end
+
+    def _mapped(self) -> Any:
+        rows = len(self._documents)
+        if not rows:
+            return None
+        if self._matrix is None or self._matrix.shape[0] != rows:
+            self._matrix = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dimensions)
+            )
+        return self._matrix
+
+    def contains(self, document_id: str) -> bool:
+        with self._lock:
+            self._refresh()
+            return document_id in self._rows
+
+    def document(self, document_id: str) -> IndexedDocument | None:
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(document_id)
+            return self._documents[row] if row is not None else None
+
+    def vector(self, document_id: str) -> Any:
+        with self._lock:
+            self._refresh()
+            row = self._rows.get(document_id)
+            return None if row is None else np.array(self._mapped()[row])
+
+    def add(self, entries: list[tuple[str, str, str]], vectors: Any) -> int:
+        """Ajoute (id, type, libellé) + vecteurs ; les ids déjà présents sont ignorés."""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(entries), self.dimensions)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = vectors / np.where(norms > 0, norms, 1)
+
+        with self._lock, self._file_lock():
+            self._refresh()
+            # Première occurrence de chaque id absent de l'index
+            first: dict[str, int] = {}
+            for index, (doc_id, _, _) in enumerate(entries):
+                if doc_id not in self._rows:
+                    first.setdefault(doc_id, index)
+            keep = list(first.values())
+            if not keep:
+                return 0
+            # Vecteurs d'abord : une ligne de métadonnées n'existe jamais sans son vecteur
+            with open(self.vectors_path, "ab") as handle:
+                handle.write(np.ascontiguousarray(vectors[keep]).tobytes())
+            with open(self.documents_path, "ab") as handle:
+                for index in keep:
+                    doc_id, kind, label = entries[index]
+                    line = json.dumps({"id": doc_id, "kind": kind, "label": label}, ensure_ascii=False)
+                    handle.write(line.encode("utf-8") + b"\n")
+            self._refresh()
+            self.appends += len(keep)
+            return len(keep)
+
+    @timed_stage("embedding_search")
+    def search(self, queries: Any, k: int, kind: str | None = None) -> list[list[Match]]:
+        """Top-k par requête (produits scalaires par blocs), éventuellement filtré par type."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            matrix = self._mapped()
+            # Copie : un ajout concurrent ne peut pas redimensionner un buffer exporté
+            kinds = np.array(self._kinds, dtype=np.int8)
+            documents = self._documents
+        self.searches += len(queries)
+        if matrix is None or k <= 0:
+            return [[] for _ in queries]
+
+        code = KIND_CODES[kind] if kind is not None else None
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, matrix.shape[0], CHUNK_ROWS):
+            block = matrix[start : start + CHUNK_ROWS]
+            scores = queries @ block.T
+            if code is not None:
+                scores[:, kinds[start : start + len(block)] != code] = -np.inf
+            take = min(k, scores.shape[1])
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        results: list[list[Match]] = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            matches = []
+            for position in order:
+                if not np.isfinite(scores[position]):
+                    continue
+                document = documents[rows[position]]
+                matches.append(Match(document.id, document.kind, document.label, float(scores[position])))
+            results.append(matches)
+        return results
+
+    def stats(self) -> dict[str, Any]:
+        counts = Counter(document.kind for document in self._documents)
+        return {
+            "documents": len(self._documents),
+            "cvs": counts.get(CV, 0),
+            "jobs": counts.get(JOB, 0),
+            "dimensions": self.dimensions,
+            "size_mb": round(len(self._documents) * self.row_bytes / 1024 / 1024, 2),
+            "appends": self.appends,
+            "searches": self.searches,
+        }
+
+
+class EmbeddingService:
+    """Calcul des embeddings (provider ou local) et accès à l'index, pour les endpoints et le batch."""
+
+    def __init__(self, index: EmbeddingIndex, provider: str, model: str, dimensions: int) -> None:
+        self.index = index
+        self.provider = provider
+        self.model = model if provider == "api" else HashingEmbedder.name
+        self.dimensions = dimensions
+        self._hashing = HashingEmbedder(dimensions)
+        self.embedded = 0
+
+    def document_id(self, kind: str, text: str) -> str:
+        return content_id(kind, text, self.model)
+
+    async def embed(self, texts: list[str]) -> Any:
+        if not texts:
+            return np.empty((0, self.dimensions), dtype=np.float32)
+        self.embedded += len(texts)
+        if self.provider != "api":
+            return await asyncio.to_thread(self._hashing.embed, texts)
+
+        from .llm_client import embed_texts
+
+        vectors: list[list[float]] = []
+        for batch in _batches([text[:MAX_INPUT_CHARS] for text in texts], settings.EMBEDDINGS_BATCH_SIZE):
+            vectors += await embed_texts(batch, self.model, self.dimensions)
+        return np.asarray(vectors, dtype=np.float32)
+
+    async def add(self, kind: str, items: list[tuple[str, str]]) -> list[tuple[str, bool]]:
+        """
+        Indexe des (libellé, texte) ; renvoie (id, nouveau) pour chacun.
+        Un texte déjà indexé (même hash) n'est pas ré-embeddé.
+        """
+        ids = [self.document_id(kind, text) for _, text in items]
+        known = await asyncio.to_thread(lambda: {doc_id for doc_id in ids if self.index.contains(doc_id)})
+        first: dict[str, int] = {}
+        for index, doc_id in enumerate(ids):
+            if doc_id not in known:
+                first.setdefault(doc_id, index)
+        missing = list(first.values())
+        if missing:
+            vectors = await self.embed([items[index][1] for index in missing])
+            entries = [(ids[index], kind, items[index][0]) for index in missing]
+            await asyncio.to_thread(self.index.add, entries, vectors)
+        return [(doc_id, doc_id not in known) for doc_id in ids]
+
+    async def vectors_for(self, kind: str, texts: list[str]) -> Any:
+        """Vecteurs de textes (depuis l'index s'ils y sont déjà, sans les y ajouter sinon)."""
+        ids = [self.document_id(kind, text) for text in texts]
+        cached = await asyncio.to_thread(lambda: [self.index.vector(doc_id) for doc_id in ids])
+        missing = [index for index, vector in enumerate(cached) if vector is None]
+        if missing:
+            computed = await self.embed([texts[index] for index in missing])
+            norms = np.linalg.norm(computed, axis=1, keepdims=True)
+            computed = computed / np.where(norms > 0, norms, 1)
+            for position, index in enumerate(missing):
+                cached[index] = computed[position]
+        return np.vstack(cached) if cached else np.empty((0, self.dimensions), dtype=np.float32)
+
+    async def search(self, vectors: Any, k: int, kind: str | None = None) -> list[list[Match]]:
+        return await asyncio.to_thread(self.index.search, vectors, k, kind)
+
+    def stats(self) -> dict[str, Any]:
+        return {"provider": self.provider, "model": self.model, "embedded": self.embedded, **self.index.stats()}
+
+
+def _batches(items: list[str], size: int) -> Iterator[list[str]]:
+    size = max(size, 1)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+@lru_cache(maxsize=1)
+def get_embedding_service() -> EmbeddingService | None:
+    """Service d'embeddings du process ; None si désactivé ou si numpy est absent."""
+    if not settings.EMBEDDINGS_ENABLED:
+        return None
+    if np is None:
+        logger.warning("EMBEDDINGS_ENABLED mais numpy est absent (pip install numpy) : index désactivé.")
+        return None
+
+    provider = settings.EMBEDDINGS_PROVIDER
+    model = settings.EMBEDDINGS_MODEL if provider == "api" else HashingEmbedder.name
+    # Un sous-dossier par modèle et dimension : changer de modèle ne mélange pas les vecteurs
+    directory = Path(settings.EMBEDDINGS_DIR) / f"{model.replace('/', '_')}-{settings.EMBEDDINGS_DIMENSIONS}"
+    index = EmbeddingIndex(directory, settings.EMBEDDINGS_DIMENSIONS)
+    logger.info("Index d'embeddings ouvert : %d documents (%s)", len(index), directory)
+    return EmbeddingService(index, provider, model, settings.EMBEDDINGS_DIMENSIONS)
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+
+from .prompt_compaction import dedupe_segments, split_segments
+
+# Découpage de l'analyse markdown : ligne de score, puis sections "## N. Titre"
+SCORE_LINE_RE = re.compile(r"^\s*\**\s*Score global\s*:?\s*\d{1,3}\s*/\s*100.*$", re.IGNORECASE | re.MULTILINE)
+SECTION_RE = re.compile(r"^##\s*(\d+)\.", re.MULTILINE)
+SCORE = "score"
+
+
+@dataclass
+class TextDiff:
+    """Passages retirés / ajoutés entre deux versions d'un texte (découpé en phrases / puces)."""
+
+    removed: list[str] = field(default_factory=list)
+    added: list[str] = field(default_factory=list)
+    # Part du texte (en caractères, ancienne + nouvelle version) touchée par la modification
+    changed_ratio: float = 0.0
+
+    @property
+    def unchanged(self) -> bool:
+        return not self.removed and not self.added
+
+    def describe(self) -> str:
+        """Bloc lisible par le modèle, pour le prompt de mise à jour."""
+        if self.unchanged:
+            return "(aucune modification)"
+        lines = [f"- retiré : {segment}" for segment in self.removed]
+        lines += [f"+ ajouté : {segment}" for segment in self.added]
+        return "\n".join(lines)
+
+
+def diff_texts(old: str, new: str) -> TextDiff:
+    """Compare deux versions d'un CV ou d'une offre, phrase par phrase."""
+    old_segments = dedupe_segments(split_segments(old or ""))
+    new_segments = dedupe_segments(split_segments(new or ""))
+    if old_segments == new_segments:
+        return TextDiff()
+
+    diff = TextDiff()
+    matcher = SequenceMatcher(None, old_segments, new_segments, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        diff.removed += old_segments[i1:i2]
+        diff.added += new_segments[j1:j2]
+
+    total = sum(map(len, old_segments)) + sum(map(len, new_segments))
+    touched = sum(map(len, diff.removed)) + sum(map(len, diff.added))
+    diff.changed_ratio = touched / total if total else 1.0
+    return diff
+
+
+def split_analysis_sections(analysis_md: str) -> dict[str, str]:
+    """
+    Découpe une analyse markdown en {"score": ligne de score, "1": section 1, …}.
+    Le texte éventuel entre la ligne de score et la première section est rattaché au score.
+    """
+    sections: dict[str, str] = {}
+    headings = list(SECTION_RE.finditer(analysis_md))
+    head = analysis_md[: headings[0].start()] if headings else analysis_md
+    if SCORE_LINE_RE.search(head):
+        sections[SCORE] = head.strip()
+    for index, heading in enumerate(headings):
+        end = headings[index + 1].start() if index + 1 < len(headings) else len(analysis_md)
+        sections[heading.group(1)] = analysis_md[heading.start() : end].strip()
+    return sections
+
+
+def merge_sections(previous_md: str, update_md: str) -> str | None:
+    """
+    Remplace dans l'analyse précédente les sections réécrites par le modèle.
+    Renvoie None si la mise à jour est inexploitable (pas de score, section inconnue) :
+    l'appelant relance alors une analyse complète.
+    """
+    previous = split_analysis_sections(previous_md)
+    update = split_analysis_sections(update_md)
+    if SCORE not in previous or SCORE not in update:
+        return None
+    if any(name not in previous for name in update):
+        return None
+    merged = {**previous, **update}
+    return "\n\n".join(merged[name] for name in previous)
@@ -0,0 +1,348 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+from .llm_cache import make_key
+from .settings import settings
+
+logger = logging.getLogger("fmp.jobs")
+
+Handler = Callable[[str, str], Awaitable[str]]
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+
+def job_id(kind: str, cv_text: str, job_text: str) -> str:
+    """Id d'un job = hash du contenu : soumettre deux fois la même demande ne crée qu'un job."""
+    return make_key(kind, cv_text, job_text, "job", "", 0.0)[:32]
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str
+    result: str | None = None
+    error: str | None = None
+    created_at: float = 0.0
+    updated_at: float = 0.0
+    cv_text: str = ""
+    job_text: str = ""
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, ERROR)
+
+
+class JobQueue:
+    """
+    File de jobs (analyse / réécriture) persistée dans SQLite, traitée par un pool
+    de workers asyncio dans le process : pas de broker externe.
+
+    - les jobs sont idempotents (id = hash du contenu) : un job en cours ou terminé
+      est renvoyé tel quel, seul un job en erreur est relancé
+    - un job "running" dont le worker a disparu (crash, redéploiement) est repris
+      après `lease_seconds` ; l'exécution elle-même est bornée en deçà du bail, pour
+      qu'un job lent ne soit jamais repris (et exécuté deux fois) pendant qu'il tourne
+    - plusieurs workers uvicorn peuvent partager le même fichier
+    """
+
+    PURGE_EVERY = 300.0  # secondes entre deux purges des vieux jobs
+    # Part du bail laissée au handler : le résultat doit être écrit avant qu'un autre
+    # worker ne considère le job comme abandonné
+    EXECUTE_SHARE = 0.9
+
+    def __init__(
+        self,
+        path: str = settings.JOB_DB_PATH,
+        workers: int = settings.JOB_WORKERS,
+        lease_seconds: float = settings.JOB_LEASE_SECONDS,
+        ttl_seconds: float = settings.JOB_TTL_SECONDS,
+        poll_seconds: float = settings.JOB_POLL_SECONDS,
+    ) -> None:
+        self.path = path
+        self.workers = max(workers, 1)
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self.poll_seconds = poll_seconds
+        self._handlers: dict[str, Handler] = {}
+        self._lock = threading.Lock()
+        self._conn: sqlite3.Connection | None = None
+        self._tasks: list[asyncio.Task[None]] = []
+        self._wakeup: asyncio.Event | None = None
+        # Événements gardés en vie par les seuls `wait()` en cours : rien ne s'accumule
+        # pour les jobs terminés dans un autre process
+        self._finished: weakref.WeakValueDictionary[str, asyncio.Event] = weakref.WeakValueDictionary()
+        self.completed = 0
+        self.failed = 0
+        self.deduplicated = 0
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    # --- accès SQLite (synchrone, appelé via asyncio.to_thread) -------------------------
+
+    def _open(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None, timeout=5.0
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    cv_text TEXT,
+                    job_text TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+                """
+            )
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _row_to_job(row: tuple) -> Job:
+        return Job(
+            id=row[0],
+            kind=row[1],
+            status=row[2],
+            result=row[3],
+            error=row[4],
+            created_at=row[5],
+            updated_at=row[6],
+        )
+
+    def _get(self, job_id_: str) -> Job | None:
+        with self._lock:
+            row = self._open().execute(
+                "SELECT id, kind, status, result, error, created_at, updated_at "
+                "FROM jobs WHERE id = ?",
+                (job_id_,),
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def _submit(self, kind: str, cv_text: str, job_text: str) -> tuple[Job, bool]:
+        identifier = job_id(kind, cv_text, job_text)
+        now = time.time()
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, kind, status, result, error, created_at, updated_at "
+                    "FROM jobs WHERE id = ?",
+                    (identifier,),
+                ).fetchone()
+                if row is not None and row[2] != ERROR:
+                    conn.execute("COMMIT")
+                    return self._row_to_job(row), False
+                conn.execute(
+                    "INSERT OR REPLACE INTO jobs "
+                    "(id, kind, status, cv_text, job_text, result, error, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, NULL, NULL, ?, ?)",
+                    (identifier, kind, QUEUED, cv_text, job_text, now, now),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return Job(identifier, kind, QUEUED, created_at=now, updated_at=now), True
+
+    def _claim(self) -> Job | None:
+        now = time.time()
+        with self._lock:
+            conn = self._open()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs abandonnés par un worker disparu : on les remet dans la file
+                conn.execute(
+                    "UPDATE jobs SET status = ?, updated_at = ? WHERE status = ? AND updated_at < ?",
+                    (QUEUED, now, RUNNING, now - self.lease_seconds),
+                )
+                row = conn.execute(
+                    "SELECT id, kind, cv_text, job_text, created_at FROM jobs "
+                    "WHERE status = ? ORDER BY created_at LIMIT 1",
+                    (QUEUED,),
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, now, row[0]),
+                    )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+        return Job(
+            id=row[0],
+            kind=row[1],
+            status=RUNNING,
+            cv_text=row[2] or "",
+            job_text=row[3] or "",
+            created_at=row[4],
+            updated_at=now,
+        )
+
+    def _finish(self, job_id_: str, status: str, result: str | None, error: str | None) -> None:
+        # Le contenu (CV, offre) n'est plus utile une fois le job terminé
+        with self._lock:
+            self._open().execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, cv_text = NULL, "
+                "job_text = NULL, updated_at = ? WHERE id = ?",
+                (status, result, error, time.time(), job_id_),
+            )
+
+    def _purge(self) -> None:
+        with self._lock:
+            self._open().execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND updated_at < ?",
+                (DONE, ERROR, time.time() - self.ttl_seconds),
+            )
+
+    def _count(self) -> dict[str, int]:
+        with self._lock:
+            rows = self._open().execute(
+                "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+            ).fetchall()
+        return {status: count for status, count in rows}
+
+    # --- API asynchrone --------------------------------------------------------------
+
+    async def submit(self, kind: str, cv_text: str, job_text: str) -> Job:
+        """Ajoute un job (ou renvoie le job identique existant) sans attendre son exécution."""
+        if kind not in self._handlers:
+            raise ValueError(f"Type de job inconnu : {kind}")
+        job, created = await asyncio.to_thread(self._submit, kind, cv_text, job_text)
+        if created:
+            if self._wakeup is not None:
+                self._wakeup.set()
+        else:
+            self.deduplicated += 1
+            logger.debug("Job %s déjà connu (%s), non dupliqué", job.id, job.status)
+        return job
+
+    async def get(self, job_id_: str) -> Job | None:
+        return await asyncio.to_thread(self._get, job_id_)
+
+    async def wait(self, job_id_: str, timeout: float) -> Job | None:
+        """Attend la fin d'un job (au plus `timeout` secondes) et renvoie son état."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = await self.get(job_id_)
+            remaining = deadline - time.monotonic()
+            if job is None or job.finished or remaining <= 0:
+                return job
+            # Réveil immédiat si le job tourne dans ce process, sinon on repasse lire la base
+            event = self._finished.get(job_id_)
+            if event is None:
+                event = self._finished[job_id_] = asyncio.Event()
+            try:
+                await asyncio.wait_for(event.wait(), timeout=min(self.poll_seconds, remaining))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job: Job) -> None:
+        started = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(
+                self._handlers[job.kind](job.cv_text, job.job_text),
+                timeout=self.lease_seconds * self.EXECUTE_SHARE,
+            )
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:  # noqa: BLE001
+            logger.warning("Job %s (%s) en échec : %s", job.id, job.kind, str(exc) or type(exc).__name__)
+            await asyncio.to_thread(self._finish, job.id, ERROR, None, type(exc).__name__)
+            self.failed += 1
+        else:
+            await asyncio.to_thread(self._finish, job.id, DONE, result, None)
+            self.completed += 1
+            logger.info(
+                "Job %s (%s) terminé en %.0f ms",
+                job.id,
+                job.kind,
+                (time.perf_counter() - started) * 1000,
+            )
+        event = self._finished.pop(job.id, None)
+        if event is not None:
+            event.set()
+
+    async def _worker(self) -> None:
+        assert self._wakeup is not None
+        while True:
+            try:
+                self._wakeup.clear()
+                job = await asyncio.to_thread(self._claim)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                # D'autres jobs attendent peut-être : on réveille un autre worker
+                self._wakeup.set()
+                await self._execute(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception:  # noqa: BLE001 - un worker ne doit jamais mourir
+                logger.exception("Erreur inattendue dans un worker de jobs")
+                await asyncio.sleep(self.poll_seconds)
+
+    async def _purger(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self._purge)
+            except sqlite3.Error as exc:
+                logger.warning("Purge des jobs impossible: %s", exc)
+            await asyncio.sleep(self.PURGE_EVERY)
+
+    def start(self) -> None:
+        """Démarre les workers (hook lifespan)."""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._purger()))
+        logger.info("File de jobs démarrée (%d workers, %s)", self.workers, self.path)
+
+    async def stop(self) -> None:
+        """Arrête les workers ; les jobs interrompus seront repris après expiration du bail."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    async def stats(self) -> dict[str, object]:
+        return {
+            "workers": len(self._tasks) and self.workers,
+            "jobs": await asyncio.to_thread(self._count),
+            "completed": self.completed,
+            "failed": self.failed,
+            "deduplicated": self.deduplicated,
+        }
+
+
+job_queue = JobQueue()
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.llm.cache")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def make_key(
+    kind: str,
+    cv_text: str,
+    job_text: str,
+    model: str,
+    prompt_version: str,
+    temperature: float,
+) -> str:
+    """Clé de cache : hash du CV + offre normalisés, du modèle, du prompt et de la température."""
+    h = hashlib.sha256()
+    for part in (
+        kind,
+        model,
+        prompt_version,
+        f"{temperature:.3f}",
+        _normalize(cv_text),
+        _normalize(job_text),
+    ):
+        h.update(part.encode("utf-8"))
+        h.update(b"\x00")
+    return h.hexdigest()
+
+
+class _DiskTier:
+    """
+    Tier SQLite optionnel : survit aux redémarrages. Borné en taille (les plus anciens
+    accès sont supprimés en premier) ; les entrées expirées sont purgées périodiquement.
+    """
+
+    PURGE_EVERY = 50  # écritures entre deux purges (expiration + taille totale)
+
+    def __init__(self, path: str, ttl_seconds: float, max_bytes: int) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, "
+                "size INTEGER NOT NULL DEFAULT 0, used_at REAL NOT NULL DEFAULT 0)"
+            )
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(llm_cache)")}
+            # Fichier créé avant l'ajout de la taille et de la date d'accès
+            if "size" not in columns:
+                self._conn.execute("ALTER TABLE llm_cache ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE llm_cache SET size = length(CAST(value AS BLOB))")
+            if "used_at" not in columns:
+                self._conn.execute("ALTER TABLE llm_cache ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE llm_cache SET used_at = created_at")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_used ON llm_cache (used_at)")
+        with self._lock, self._conn:
+            self._purge()
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] < now - self.ttl_seconds:
+                return None
+            self._conn.execute("UPDATE llm_cache SET used_at = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created_at, size, used_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, value, now, len(value.encode("utf-8")), now),
+            )
+            self._writes += 1
+            if self._writes % self.PURGE_EVERY == 0:
+                self._purge()
+
+    def _purge(self) -> None:
+        expired = self._conn.execute(
+            "DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        ).rowcount
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        removed = 0
+        if total > self.max_bytes:
+            for key, size in self._conn.execute(
+                "SELECT key, size FROM llm_cache ORDER BY used_at"
+            ).fetchall():
+                if total <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                total -= size
+                removed += 1
+        if expired or removed:
+            logger.debug("Cache LLM sur disque : %d entrées expirées, %d évincées", expired, removed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class LLMCache:
+    """
+    Cache des réponses LLM, adressé par contenu.
+
+    - tier mémoire : LRU avec TTL, borné en nombre d'entrées et en taille totale
+    - tier disque (optionnel) : SQLite, interrogé en cas de miss mémoire
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.LLM_CACHE_MAX_ENTRIES,
+        max_bytes: int = settings.LLM_CACHE_MAX_MB * 1024 * 1024,
+        ttl_seconds: float = settings.LLM_CACHE_TTL_SECONDS,
+        db_path: str | None = settings.LLM_CACHE_DB_PATH,
+        disk_max_bytes: int = settings.LLM_CACHE_DISK_MAX_MB * 1024 * 1024,
+        enabled: bool = settings.LLM_CACHE_ENABLED,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        # clé -> (expiration monotonic, réponse, taille en octets)
+        self._entries: OrderedDict[str, tuple[float, str, int]] = OrderedDict()
+        self._bytes = 0
+        self._disk = _DiskTier(db_path, ttl_seconds, disk_max_bytes) if (enabled and db_path) else None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _remember(self, key: str, value: str) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        size = len(value.encode("utf-8"))
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, value, size)
+        self._bytes += size
+
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._bytes > self.max_bytes
+        ):
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    async def get(self, key: str) -> str | None:
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, value, size = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+            self._bytes -= size
+
+        if self._disk is not None:
+            try:
+                value = await asyncio.to_thread(self._disk.get, key)
+            except sqlite3.Error as exc:
+                # Base verrouillée ou corrompue : un simple miss, pas une erreur 500
+                logger.warning("Lecture du cache LLM sur disque impossible: %s", exc)
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                self.disk_hits += 1
+                return value
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: str) -> None:
+        if not self.enabled or not value:
+            return
+        self._remember(key, value)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, value)
+            except sqlite3.Error as exc:
+                logger.warning("Écriture du cache LLM sur disque impossible: %s", exc)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+
+llm_cache = LLMCache()
@@ -1,18 +1,45 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import json
 import logging
+from typing import Any, AsyncIterator
+
+import httpx
+import openai
 from openai import AsyncOpenAI
 
+from pydantic import ValidationError
+
+from .analysis_schema import AnalysisResult, looks_like_json, parse_result, response_format
+from .incremental import diff_texts, merge_sections
+from .llm_cache import llm_cache, make_key
+from .llm_resilience import CircuitOpen, llm_resilience
+from .llm_scheduler import FREE_LANE, PRO_LANE, SchedulerTimeout, llm_scheduler
+from .llm_transport import build_http_client, pool_stats, warm_up
+from .local_analysis import analyze_locally, analyze_locally_structured
 from .logging_conf import log_exception
+from .metrics import record_llm_usage, timed_stage
+from .prompt_compaction import compact_inputs, count_tokens
 from .settings import settings
+from .skill_matcher import SkillMatch, match_skills
+
+ANALYZE_MODEL = "gpt-4o-mini"
+REWRITE_MODEL = "gpt-4o"
+ANALYZE_TEMPERATURE = 0.3
+REWRITE_TEMPERATURE = 0.4
+# À incrémenter à chaque modification des prompts : invalide le cache LLM.
+PROMPT_VERSION = "2"
 
 _client_cache: AsyncOpenAI | None = None
+_http_client: httpx.AsyncClient | None = None
 
 logger = logging.getLogger("fmp.llm")
 
 
 def _get_client() -> AsyncOpenAI | None:
-    global _client_cache
+    global _client_cache, _http_client
 
     api_key = settings.OPENAI_API_KEY
     if not api_key:
@@ -21,6 +48,10 @@ def _get_client() -> AsyncOpenAI | None:
         return None
 
     if _client_cache is None:
+        # Un seul pool de connexions HTTP pour tous les appels LLM.
+        # Les retries sont gérés par llm_resilience (max_retries=0 côté SDK).
+        _http_client = build_http_client()
+
         # Support OpenRouter si OPENROUTER_BASE_URL est défini
         base_url = settings.OPENROUTER_BASE_URL
         if base_url:
@@ -36,40 +67,306 @@ def _get_client() -> AsyncOpenAI | None:
                 api_key=api_key,
                 base_url=base_url,
                 default_headers=default_headers,
+                http_client=_http_client,
+                max_retries=0,
             )
         else:
             logger.info("Utilisation d'OpenAI standard")
-            _client_cache = AsyncOpenAI(api_key=api_key)
+            _client_cache = AsyncOpenAI(api_key=api_key, http_client=_http_client, max_retries=0)
 
     return _client_cache
 
 
-def _build_messages(cv_text: str, job_text: str):
+async def start_client() -> None:
+    """Crée le client LLM au démarrage et préchauffe sa connexion (hook lifespan)."""
+    client = _get_client()
+    if client is not None and _http_client is not None and settings.LLM_WARMUP:
+        await warm_up(_http_client, str(client.base_url))
+
+
+async def close_client() -> None:
+    """Ferme proprement le pool de connexions LLM (hook lifespan)."""
+    global _client_cache, _http_client
+    if _client_cache is not None:
+        await _client_cache.close()
+    if _http_client is not None:
+        await _http_client.aclose()
+    _client_cache = None
+    _http_client = None
+
+
+def http_pool_stats() -> dict[str, int]:
+    return pool_stats(_http_client)
+
+
+def _lane(kind: str) -> str:
+    # La réécriture est réservée aux clients Pro : elle passe devant l'analyse gratuite
+    return PRO_LANE if kind == "rewrite" else FREE_LANE
+
+
+def _model_chain(model: str) -> list[str]:
+    return [model, *settings.LLM_FALLBACK_MODELS.get(model, [])]
+
+
+def _estimate_tokens(messages: list[dict[str, str]], max_tokens: int = 0) -> int:
+    """Tokens du prompt (comptés localement) + plafond de la réponse, pour réserver le budget."""
+    return sum(count_tokens(message["content"]) for message in messages) + max_tokens
+
+
+class _Flight:
     """
-    Construit les messages pour le LLM.
+    Appel LLM en cours, partagé par toutes les requêtes identiques (single-flight).
 
-    Objectif : produire une analyse exploitable pour Fit My Profile,
-    avec un format stable et actionnable.
+    L'appel tourne dans sa propre tâche : un client qui se déconnecte n'annule pas
+    l'appel des autres, et la réponse finit quand même dans le cache.
     """
-    system = (
-        "Tu es un expert en recrutement et en optimisation de candidatures. "
-        "Tu aides un candidat à adapter son profil (CV, expérience, compétences) "
-        "à une offre précise. Réponds en français, de façon claire, directe et utile. "
-        "Ton but est que la personne sache quoi CHANGER concrètement dans son CV."
+
+    def __init__(self) -> None:
+        self.parts: list[str] = []
+        self.task: asyncio.Task[str] | None = None
+        self.finished = False
+        self._changed = asyncio.Condition()
+
+    async def push(self, delta: str) -> None:
+        async with self._changed:
+            self.parts.append(delta)
+            self._changed.notify_all()
+
+    async def finish(self) -> None:
+        async with self._changed:
+            self.finished = True
+            self._changed.notify_all()
+
+    async def result(self) -> str:
+        assert self.task is not None
+        return await asyncio.shield(self.task)
+
+    async def follow(self) -> AsyncIterator[str]:
+        """Rejoue les morceaux déjà reçus puis suit le flux jusqu'à la fin de l'appel."""
+        assert self.task is not None
+        sent = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: len(self.parts) > sent or self.finished)
+                chunk = "".join(self.parts[sent:])
+                sent = len(self.parts)
+            if chunk:
+                yield chunk
+            elif self.finished:
+                content = await self.result()  # relève l'erreur éventuelle de l'appel
+                if not self.parts and content:
+                    # appel non streamé : tout arrive d'un coup
+                    yield content
+                return
+
+
+_flights: dict[str, _Flight] = {}
+_coalesced = 0
+
+
+def inflight_stats() -> dict[str, int]:
+    return {"inflight": len(_flights), "coalesced": _coalesced}
+
+
+async def _call_model(
+    flight: _Flight,
+    key: str,
+    client: AsyncOpenAI,
+    kind: str,
+    model: str,
+    messages: list[dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    stream: bool,
+    response_format: dict[str, Any] | None = None,
+) -> str:
+    # Structured outputs (JSON validé par un schéma) si demandé
+    extra = {"response_format": response_format} if response_format else {}
+    try:
+        async with llm_scheduler.slot(
+            _lane(kind), _estimate_tokens(messages, max_tokens)
+        ) as ticket:
+            models = _model_chain(model)
+            if stream:
+                logger.debug("Appel API OpenAI/OpenRouter (streaming) avec modèle: %s", model)
+                # Seule l'ouverture du flux est rejouable : une coupure en cours de route remonte
+                response, used_model = await llm_resilience.call(
+                    models,
+                    lambda name: client.chat.completions.create(
+                        model=name,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        stream=True,
+                        **extra,
+                    ),
+                    hedge=False,
+                )
+                async for chunk in response:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        await flight.push(delta)
+                content = "".join(flight.parts).strip()
+                # Pas d'usage renvoyé en streaming : on l'estime sur le texte produit
+                prompt_tokens = _estimate_tokens(messages)
+                ticket.record_usage(prompt_tokens + count_tokens(content))
+                record_llm_usage(used_model, prompt_tokens, count_tokens(content))
+            else:
+                logger.debug("Appel API OpenAI/OpenRouter avec modèle: %s", model)
+                completion, used_model = await llm_resilience.call(
+                    models,
+                    lambda name: client.chat.completions.create(
+                        model=name,
+                        messages=messages,
+                        temperature=temperature,
+                        max_tokens=max_tokens,
+                        **extra,
+                    ),
+                )
+                content = (completion.choices[0].message.content or "").strip()
+                usage = completion.usage
+                ticket.record_usage(getattr(usage, "total_tokens", None))
+                record_llm_usage(
+                    used_model,
+                    getattr(usage, "prompt_tokens", None),
+                    getattr(usage, "completion_tokens", None),
+                )
+
+        logger.debug("Réponse API reçue (%d caractères)", len(content))
+        if used_model == model and (response_format is None or _valid_result(kind, content)):
+            # Une réponse d'un modèle de repli n'est pas gardée sous la clé du modèle principal,
+            # ni un JSON hors schéma (le prochain appel a sa chance)
+            await llm_cache.set(key, content)
+        return content
+    finally:
+        if _flights.get(key) is flight:
+            del _flights[key]
+        await flight.finish()
+
+
+def _join_or_start(
+    key: str,
+    client: AsyncOpenAI,
+    kind: str,
+    model: str,
+    messages: list[dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    stream: bool,
+    response_format: dict[str, Any] | None = None,
+) -> _Flight:
+    """Rejoint l'appel identique déjà en cours, ou en lance un nouveau."""
+    global _coalesced
+
+    flight = _flights.get(key)
+    if flight is not None:
+        _coalesced += 1
+        logger.debug("Requête %s identique à un appel en cours, mutualisée (%s)", kind, key[:12])
+        return flight
+
+    flight = _Flight()
+    flight.task = asyncio.create_task(
+        _call_model(
+            flight, key, client, kind, model, messages, temperature, max_tokens, stream, response_format
+        )
     )
+    # Évite l'avertissement "exception never retrieved" si tous les clients sont partis
+    flight.task.add_done_callback(lambda task: task.cancelled() or task.exception())
+    _flights[key] = flight
+    return flight
 
-    user = f"""
-Voici le CV (texte brut) :
 
-----
-{cv_text}
-----
+def _valid_result(kind: str, content: str) -> bool:
+    try:
+        parse_result(kind, content)
+    except ValidationError:
+        return False
+    return True
 
-Voici l'offre d'emploi :
 
-----
-{job_text}
-----
+def _prompt_version(response_format: dict[str, Any] | None) -> str:
+    # Réponses JSON et markdown ne partagent pas les mêmes entrées de cache
+    return f"{PROMPT_VERSION}-json" if response_format else PROMPT_VERSION
+
+
+async def _cached_completion(
+    client: AsyncOpenAI,
+    kind: str,
+    cv_text: str,
+    job_text: str,
+    model: str,
+    messages: list[dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    response_format: dict[str, Any] | None = None,
+    prompt_version: str | None = None,
+    lookup: bool = True,
+) -> str:
+    """
+    Appelle le modèle, sauf si une réponse identique est en cache ou déjà en cours.
+    `lookup=False` : l'appelant vient de constater le miss, inutile de relire le cache.
+    """
+    if prompt_version is None:
+        prompt_version = _prompt_version(response_format)
+    key = make_key(kind, cv_text, job_text, model, prompt_version, temperature)
+    cached = await llm_cache.get(key) if lookup else None
+    if cached is not None:
+        logger.debug("Réponse %s servie depuis le cache (%s)", kind, key[:12])
+        return cached
+
+    flight = _join_or_start(
+        key, client, kind, model, messages, temperature, max_tokens, False, response_format
+    )
+    return await flight.result()
+
+
+async def _stream_completion(
+    client: AsyncOpenAI,
+    kind: str,
+    cv_text: str,
+    job_text: str,
+    model: str,
+    messages: list[dict[str, str]],
+    temperature: float,
+    max_tokens: int,
+    response_format: dict[str, Any] | None = None,
+    lookup: bool = True,
+) -> AsyncIterator[str]:
+    """Version streaming de `_cached_completion` : renvoie les tokens au fil de l'eau."""
+    key = make_key(kind, cv_text, job_text, model, _prompt_version(response_format), temperature)
+    cached = await llm_cache.get(key) if lookup else None
+    if cached is not None:
+        logger.debug("Réponse %s servie depuis le cache (%s)", kind, key[:12])
+        yield cached
+        return
+
+    flight = _join_or_start(
+        key, client, kind, model, messages, temperature, max_tokens, True, response_format
+    )
+    async for delta in flight.follow():
+        yield delta
+
+
+# Prompts : les parties fixes (système + consignes) viennent en premier et ne changent
+# jamais d'un appel à l'autre (octet pour octet), pour profiter du cache de préfixe du
+# provider ; le CV, l'offre et l'indice éventuel sont ajoutés à la fin.
+ANALYZE_SYSTEM = (
+    "Tu es un expert en recrutement et en optimisation de candidatures. "
+    "Tu aides un candidat à adapter son profil (CV, expérience, compétences) "
+    "à une offre précise. Réponds en français, de façon claire, directe et utile. "
+    "Ton but est que la personne sache quoi CHANGER concrètement dans son CV."
+)
+
+REWRITE_SYSTEM = (
+    "Tu es un expert en optimisation de CV et en recrutement. "
+    "Tu aides un candidat à adapter son CV à une offre précise. "
+    "Tu écris en français, de façon claire, concise et impactante. "
+    "Tu produis du texte prêt à copier-coller dans un CV moderne."
+)
+
+ANALYZE_MARKDOWN_FORMAT = """Tu vas recevoir un CV et une offre d'emploi (à la fin de ce message).
 
 Tu dois IMPÉRATIVEMENT structurer ta réponse en suivant ce format :
 
@@ -112,77 +409,41 @@ Tu dois IMPÉRATIVEMENT structurer ta réponse en suivant ce format :
 Respecte bien la structure, les titres et l'ordre des sections.
 """
 
-    return [
-        {"role": "system", "content": system},
-        {"role": "user", "content": user},
-    ]
-
-
-async def analyze_profile(cv_text: str, job_text: str) -> str:
-    """
-    Analyse CV + offre via OpenAI.
-    Si pas de clé API ou erreur, renvoie un texte explicatif + mock.
-    """
-    cv_text = (cv_text or "").strip()
-    job_text = (job_text or "").strip()
-
-    # Cas où on n'a pas de matière
-    if not cv_text or not job_text:
-        return (
-            "Analyse IA indisponible : CV ou offre vides.\n"
-            "Vérifie que ton fichier est bien lisible et que tu as collé l'offre."
-        )
-
-    client = _get_client()
-    if client is None:
-        # Mode mock si pas de clé
-        return (
-            "Analyse IA (mode mock – aucune clé API configurée).\n\n"
-            f"CV détecté (~{len(cv_text)} caractères) et offre (~{len(job_text)} caractères).\n"
-            "Quand tu auras configuré OPENAI_API_KEY, je générerai ici une analyse complète "
-            "(score, forces, faiblesses, suggestions)."
-        )
+ANALYZE_JSON_FORMAT = """Tu vas recevoir un CV et une offre d'emploi (à la fin de ce message).
 
-    try:
-        logger.debug("Appel API OpenAI/OpenRouter avec modèle: gpt-4o-mini")
-        completion = await client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=_build_messages(cv_text, job_text),
-            temperature=0.3,
-            max_tokens=900,
-        )
-        content = completion.choices[0].message.content or ""
-        logger.debug("Réponse API reçue (%d caractères)", len(content))
-        return content.strip()
-    except Exception as exc:  # noqa: BLE001
-        logger.error("Erreur lors de l'appel API: %s", exc, exc_info=True)
-        log_exception(exc, logger_name="fmp.llm")
-        return f"Une erreur est survenue lors de l'appel à l'IA. Détails techniques : {type(exc).__name__}"
+Réponds UNIQUEMENT avec un objet JSON conforme au schéma demandé, sans texte autour :
+- score : entier entre 0 et 100
+- summary : résumé du fit global en 3 à 5 phrases, honnête mais constructif
+- strengths : 5 à 7 points forts (expériences, compétences, résultats, mots-clés déjà alignés)
+- weaknesses : 5 à 7 points concrets qui peuvent poser problème (expérience, mots-clés absents, séniorité…)
+- action_plan : actions concrètes sur le CV, dans l'ordre (ajouter une ligne précise, reformuler une expérience…)
+- titles : 2 ou 3 titres de CV en une ligne ; hooks : 2 ou 3 paragraphes d'accroche de 3 à 5 phrases
+- keywords : hard skills à ajouter, compétences à renforcer, soft skills, outils / environnements, autres mots-clés
+"""
 
+ANALYZE_UPDATE_FORMAT = """Tu as déjà analysé une version précédente de ce CV pour cette offre. Le candidat
+vient de modifier son CV et/ou l'offre. Tu vas recevoir (à la fin de ce message) ton analyse
+précédente, puis les passages retirés et ajoutés de chaque texte.
 
-def _build_rewrite_messages(cv_text: str, job_text: str) -> list[dict[str, str]]:
-    system = (
-        "Tu es un expert en optimisation de CV et en recrutement. "
-        "Tu aides un candidat à adapter son CV à une offre précise. "
-        "Tu écris en français, de façon claire, concise et impactante. "
-        "Tu produis du texte prêt à copier-coller dans un CV moderne."
-    )
+Mets à jour l'analyse en tenant compte UNIQUEMENT de ces modifications :
 
-    user = f"""
-Voici le CV du candidat (texte brut) :
+1. Commence par une ligne unique de la forme :
+   "Score global : XX/100"
+   avec le score mis à jour (entier entre 0 et 100).
 
-----
-{cv_text}
-----
+2. Puis réécris en markdown, avec leur titre exact (ex. "## 2. Forces principales pour ce poste"),
+   SEULEMENT les sections dont le contenu doit changer. Chaque section réécrite est complète
+   et garde le format de l'analyse précédente. N'écris pas les sections inchangées.
 
-Voici l'offre d'emploi ciblée :
+Ne fais pas de blabla autour, respecte uniquement cette structure.
+"""
 
-----
-{job_text}
-----
+REWRITE_MISSION = """Tu vas recevoir le CV d'un candidat et une offre d'emploi ciblée (à la fin de ce message).
 
 Ta mission : produire une RÉÉCRITURE PRO de certaines parties du CV, adaptée à cette offre.
+"""
 
+REWRITE_MARKDOWN_FORMAT = """
 Réponds STRICTEMENT en markdown avec les sections suivantes :
 
 ## 1. Titre de CV – 3 variantes
@@ -211,42 +472,602 @@ Réponds STRICTEMENT en markdown avec les sections suivantes :
 Ne fais pas de blabla autour, respecte uniquement cette structure.
 """
 
+REWRITE_JSON_FORMAT = """
+Réponds UNIQUEMENT avec un objet JSON conforme au schéma demandé, sans texte autour :
+- titles : 3 titres de CV percutants en une ligne, alignés avec l'offre (niveau, scope, secteur)
+- hooks : 3 paragraphes d'accroche de 3 à 5 phrases, clairs et orientés résultats, prêts à coller
+- experiences : 1 ou 2 expériences les plus pertinentes, avec intitulé, contexte (1–2 lignes)
+  et 4 à 7 bullets réécrits qui mettent en avant résultats, responsabilités et éléments de l'offre
+- keywords : mots-clés techniques et business à insérer dans le titre, l'accroche et les expériences
+"""
+
+
+def _documents(cv_label: str, cv_text: str, job_label: str, job_text: str) -> str:
+    return f"""
+{cv_label} :
+
+----
+{cv_text}
+----
+
+{job_label} :
+
+----
+{job_text}
+----
+"""
+
+
+def _build_messages(
+    cv_text: str, job_text: str, hint: str | None = None, structured: bool = False
+) -> list[dict[str, str]]:
+    """
+    Construit les messages pour le LLM.
+
+    Objectif : produire une analyse exploitable pour Fit My Profile,
+    avec un format stable et actionnable. `hint` : résultat du matching local
+    des mots-clés, donné au modèle comme indice (optionnel). `structured` :
+    réponse en JSON (AnalysisResult) au lieu du markdown.
+    """
+    hint_block = (
+        f"\nIndice (matching automatique des mots-clés, à vérifier) :\n{hint}\n" if hint else ""
+    )
+    instructions = ANALYZE_JSON_FORMAT if structured else ANALYZE_MARKDOWN_FORMAT
+    documents = _documents("Voici le CV (texte brut)", cv_text, "Voici l'offre d'emploi", job_text)
     return [
-        {"role": "system", "content": system},
+        {"role": "system", "content": ANALYZE_SYSTEM},
+        {"role": "user", "content": instructions + documents + hint_block},
+    ]
+
+
+def _build_update_messages(previous: str, cv_changes: str, job_changes: str) -> list[dict[str, str]]:
+    """Mise à jour d'une analyse existante à partir des seuls passages modifiés (analyse incrémentale)."""
+    user = f"""{ANALYZE_UPDATE_FORMAT}
+Ton analyse précédente :
+
+----
+{previous}
+----
+
+Modifications du CV :
+
+----
+{cv_changes}
+----
+
+Modifications de l'offre :
+
+----
+{job_changes}
+----
+"""
+    return [
+        {"role": "system", "content": ANALYZE_SYSTEM},
         {"role": "user", "content": user},
     ]
 
 
-async def rewrite_profile(cv_text: str, job_text: str) -> str:
-    cv_text = (cv_text or "").strip()
-    job_text = (job_text or "").strip()
+def _build_rewrite_messages(
+    cv_text: str, job_text: str, structured: bool = False
+) -> list[dict[str, str]]:
+    instructions = REWRITE_MISSION + (REWRITE_JSON_FORMAT if structured else REWRITE_MARKDOWN_FORMAT)
+    documents = _documents(
+        "Voici le CV du candidat (texte brut)", cv_text, "Voici l'offre d'emploi ciblée", job_text
+    )
+    return [
+        {"role": "system", "content": REWRITE_SYSTEM},
+        {"role": "user", "content": instructions + documents},
+    ]
 
-    if not cv_text or not job_text:
+
+def _empty_message(kind: str) -> str:
+    if kind == "rewrite":
         return (
             "Réécriture IA indisponible : CV ou offre vides.\n"
             "Vérifie que ton fichier est bien lisible et que tu as collé l'offre."
         )
+    return (
+        "Analyse IA indisponible : CV ou offre vides.\n"
+        "Vérifie que ton fichier est bien lisible et que tu as collé l'offre."
+    )
 
-    client = _get_client()
-    if client is None:
+
+def _mock_message(kind: str, cv_text: str, job_text: str) -> str:
+    if kind == "rewrite":
         return (
             "Réécriture IA (mode mock – aucune clé API configurée).\n\n"
             f"CV détecté (~{len(cv_text)} caractères) et offre (~{len(job_text)} caractères).\n"
             "Quand tu auras configuré OPENAI_API_KEY, je proposerai ici une réécriture optimisée."
         )
+    return (
+        "Analyse IA (mode mock – aucune clé API configurée).\n\n"
+        f"CV détecté (~{len(cv_text)} caractères) et offre (~{len(job_text)} caractères).\n"
+        "Quand tu auras configuré OPENAI_API_KEY, je générerai ici une analyse complète "
+        "(score, forces, faiblesses, suggestions)."
+    )
+
+
+def _degraded_message(kind: str, cv_text: str, job_text: str) -> str:
+    label = "Réécriture IA" if kind == "rewrite" else "Analyse IA"
+    return (
+        f"{label} (mode dégradé – le service IA est momentanément indisponible).\n\n"
+        f"CV détecté (~{len(cv_text)} caractères) et offre (~{len(job_text)} caractères).\n"
+        "Merci de réessayer dans quelques minutes pour obtenir une analyse complète."
+    )
+
+
+def _busy_message(kind: str) -> str:
+    logger.warning("File d'attente LLM saturée, requête %s refusée.", kind)
+    label = "La réécriture IA" if kind == "rewrite" else "L'analyse IA"
+    return (
+        f"{label} est momentanément saturée (trop de demandes en cours).\n"
+        "Merci de réessayer dans quelques instants."
+    )
+
+
+def _error_message(exc: Exception) -> str:
+    logger.error("Erreur lors de l'appel API: %s", exc, exc_info=True)
+    log_exception(exc, logger_name="fmp.llm")
+    return f"Une erreur est survenue lors de l'appel à l'IA. Détails techniques : {type(exc).__name__}"
+
+
+def _failure_message(kind: str, cv_text: str, job_text: str, exc: Exception) -> str:
+    if isinstance(exc, SchedulerTimeout):
+        return _busy_message(kind)
+    if isinstance(exc, CircuitOpen):
+        # Provider en panne : on bascule tout de suite sur le mode dégradé
+        return _degraded_message(kind, cv_text, job_text)
+    return _error_message(exc)
+
+
+# Erreurs après lesquelles l'analyse bascule sur le moteur local (provider lent, saturé, hors quota)
+LOCAL_FALLBACK_ERRORS = (SchedulerTimeout, CircuitOpen, openai.RateLimitError, openai.APITimeoutError)
+
+
+def _local_analysis_for(kind: str, reason: str) -> bool:
+    """Vrai si cette requête doit être servie par le moteur local (analyse uniquement)."""
+    if kind != "analyze":
+        return False
+    if reason == "engine":
+        return settings.ANALYSIS_ENGINE == "local"
+    return settings.LOCAL_ANALYSIS_FALLBACK
+
+
+async def _local_message(
+    cv_text: str, job_text: str, reason: str, skills: SkillMatch | None = None
+) -> str:
+    logger.info("Analyse servie par le moteur local (%s).", reason)
+    return await asyncio.to_thread(analyze_locally, cv_text, job_text, skills)
+
+
+def _completion_params(
+    kind: str,
+    cv_text: str,
+    job_text: str,
+    structured: bool | None = None,
+    skills: SkillMatch | None = None,
+) -> dict[str, Any]:
+    """
+    Paramètres de l'appel (prompt compacté, indice des compétences). Travail CPU :
+    appelé via `_prepare_completion`, hors de la boucle d'événements. `skills` : matching
+    déjà fait par l'appelant, recalculé seulement s'il n'est pas fourni.
+    """
+    if structured is None:
+        structured = settings.LLM_STRUCTURED_OUTPUT
+    # Les clés et la ponctuation JSON coûtent quelques tokens de plus qu'en markdown
+    max_tokens = 1100 if structured else 900
+    extra = {"response_format": response_format(kind)} if structured else {}
+    if kind == "rewrite":
+        cv_text, job_text = compact_inputs(cv_text, job_text, REWRITE_MODEL, kind)
+        return {
+            "model": REWRITE_MODEL,
+            "messages": _build_rewrite_messages(cv_text, job_text, structured),
+            "temperature": REWRITE_TEMPERATURE,
+            "max_tokens": max_tokens,
+            **extra,
+        }
+    if not settings.SKILLS_HINT_IN_PROMPT:
+        skills = None
+    elif skills is None:
+        skills = match_skills(cv_text, job_text)
+    cv_text, job_text = compact_inputs(cv_text, job_text, ANALYZE_MODEL, kind)
+    hint = skills.prompt_hint() if skills else None
+    return {
+        "model": ANALYZE_MODEL,
+        "messages": _build_messages(cv_text, job_text, hint, structured),
+        "temperature": ANALYZE_TEMPERATURE,
+        "max_tokens": max_tokens,
+        **extra,
+    }
+
+
+async def _prepare_completion(
+    kind: str,
+    cv_text: str,
+    job_text: str,
+    structured: bool | None = None,
+    skills: SkillMatch | None = None,
+) -> dict[str, Any]:
+    return await asyncio.to_thread(_completion_params, kind, cv_text, job_text, structured, skills)
+
+
+def _as_markdown(kind: str, content: str) -> str:
+    """Réponse JSON (structured outputs) rendue en markdown ; une réponse markdown passe telle quelle."""
+    if not looks_like_json(content):
+        return content
+    try:
+        return parse_result(kind, content).to_markdown()
+    except ValidationError as exc:
+        logger.warning("Réponse %s JSON invalide (%d erreurs), affichée brute.", kind, exc.error_count())
+        return content
+
+
+async def _run(
+    kind: str,
+    cv_text: str,
+    job_text: str,
+    raise_errors: bool = False,
+    skills: SkillMatch | None = None,
+    lookup: bool = True,
+) -> str:
+    cv_text = (cv_text or "").strip()
+    job_text = (job_text or "").strip()
+
+    # Cas où on n'a pas de matière
+    if not cv_text or not job_text:
+        return _empty_message(kind)
+
+    if _local_analysis_for(kind, "engine"):
+        return await _local_message(cv_text, job_text, "engine", skills)
+
+    client = _get_client()
+    if client is None:
+        # Mode mock si pas de clé
+        if _local_analysis_for(kind, "mock"):
+            return await _local_message(cv_text, job_text, "mock", skills)
+        return _mock_message(kind, cv_text, job_text)
+
+    try:
+        params = await _prepare_completion(kind, cv_text, job_text, skills=skills)
+        content = await _cached_completion(client, kind, cv_text, job_text, **params, lookup=lookup)
+        return _as_markdown(kind, content)
+    except Exception as exc:  # noqa: BLE001
+        if raise_errors:
+            raise
+        return await _failure_result(kind, cv_text, job_text, exc, skills)
+
+
+async def _failure_result(
+    kind: str, cv_text: str, job_text: str, exc: Exception, skills: SkillMatch | None = None
+) -> str:
+    """Réponse après un échec d'appel : moteur local si possible, sinon message d'erreur / mode dégradé."""
+    if isinstance(exc, LOCAL_FALLBACK_ERRORS) and _local_analysis_for(kind, "degraded"):
+        return await _local_message(cv_text, job_text, type(exc).__name__, skills)
+    return _failure_message(kind, cv_text, job_text, exc)
+
+
+async def _run_stream(
+    kind: str, cv_text: str, job_text: str, lookup: bool = True
+) -> AsyncIterator[str]:
+    cv_text = (cv_text or "").strip()
+    job_text = (job_text or "").strip()
+
+    if not cv_text or not job_text:
+        yield _empty_message(kind)
+        return
+
+    if _local_analysis_for(kind, "engine"):
+        yield await _local_message(cv_text, job_text, "engine")
+        return
+
+    if settings.LLM_STRUCTURED_OUTPUT:
+        # Un JSON partiel n'est pas affichable : la réponse arrive en une fois, déjà rendue
+        yield await _run(kind, cv_text, job_text)
+        return
+
+    client = _get_client()
+    if client is None:
+        if _local_analysis_for(kind, "mock"):
+            yield await _local_message(cv_text, job_text, "mock")
+        else:
+            yield _mock_message(kind, cv_text, job_text)
+        return
+
+    started = False
+    try:
+        params = await _prepare_completion(kind, cv_text, job_text)
+        async for delta in _stream_completion(client, kind, cv_text, job_text, **params, lookup=lookup):
+            started = True
+            yield delta
+    except Exception as exc:  # noqa: BLE001
+        # Repli local seulement si rien n'a encore été envoyé au navigateur
+        if not started and isinstance(exc, LOCAL_FALLBACK_ERRORS) and _local_analysis_for(kind, "degraded"):
+            yield await _local_message(cv_text, job_text, type(exc).__name__)
+            return
+        message = _failure_message(kind, cv_text, job_text, exc)
+        yield message if isinstance(exc, (SchedulerTimeout, CircuitOpen)) else "\n\n" + message
+
+
+@timed_stage("llm_client")
+async def analyze_profile(
+    cv_text: str, job_text: str, raise_errors: bool = False, skills: SkillMatch | None = None
+) -> str:
+    """
+    Analyse CV + offre via OpenAI.
+    Si pas de clé API ou erreur, renvoie un texte explicatif + mock.
+    Avec `raise_errors`, les erreurs d'appel remontent en exception (statut par élément d'un batch).
+    `skills` : matching des compétences déjà calculé par l'appelant (évite de le refaire).
+    """
+    return await _run("analyze", cv_text, job_text, raise_errors, skills)
+
+
+async def _incremental_update(
+    cv_text: str, job_text: str, previous_cv_text: str | None, previous_job_text: str | None
+) -> tuple[str | None, bool]:
+    """
+    Analyse incrémentale : si le CV ou l'offre n'ont que peu changé depuis la version
+    précédente de la session, et que l'analyse de cette version est en cache, demande
+    au modèle de ne réécrire que les sections touchées et les fusionne dans l'ancienne.
+    Le résultat fusionné est mis en cache sous sa propre clé (liée à l'analyse de départ) :
+    il n'est jamais servi comme analyse complète, ni repris comme base d'une autre mise à jour.
+
+    Renvoie (analyse, cache_lu) : analyse None quand il faut passer par l'analyse complète,
+    `cache_lu` indiquant que l'analyse complète a déjà été cherchée (en vain) dans le cache.
+    SchedulerTimeout / CircuitOpen remontent : une analyse complète échouerait pareil.
+    """
+    if not settings.INCREMENTAL_ANALYSIS or settings.LLM_STRUCTURED_OUTPUT:
+        return None, False
+    cv_text = (cv_text or "").strip()
+    job_text = (job_text or "").strip()
+    previous_cv_text = (previous_cv_text or "").strip()
+    previous_job_text = (previous_job_text or "").strip()
+    if not (cv_text and job_text and previous_cv_text and previous_job_text):
+        return None, False
+    if _local_analysis_for("analyze", "engine"):
+        return None, False
+    client = _get_client()
+    if client is None:
+        return None, False
+
+    cv_diff = diff_texts(previous_cv_text, cv_text)
+    job_diff = diff_texts(previous_job_text, job_text)
+    if cv_diff.unchanged and job_diff.unchanged:
+        # Rien n'a changé : l'analyse complète est servie par le cache
+        return None, False
+    changed_ratio = max(cv_diff.changed_ratio, job_diff.changed_ratio)
+    if changed_ratio > settings.INCREMENTAL_MAX_CHANGE:
+        return None, False
+
+    key = make_key("analyze", cv_text, job_text, ANALYZE_MODEL, PROMPT_VERSION, ANALYZE_TEMPERATURE)
+    cached = await llm_cache.get(key)
+    if cached is not None:
+        return cached, True
+    previous = await llm_cache.get(
+        make_key(
+            "analyze", previous_cv_text, previous_job_text, ANALYZE_MODEL, PROMPT_VERSION, ANALYZE_TEMPERATURE
+        )
+    )
+    if previous is None or looks_like_json(previous):
+        return None, True
 
+    # La clé de la mise à jour dépend aussi de l'analyse de départ
+    version = f"{PROMPT_VERSION}-update-{hashlib.sha256(previous.encode('utf-8')).hexdigest()[:16]}"
+    merged_key = make_key("analyze", cv_text, job_text, ANALYZE_MODEL, f"{version}-merged", ANALYZE_TEMPERATURE)
+    merged = await llm_cache.get(merged_key)
+    if merged is not None:
+        return merged, True
     try:
-        logger.debug("Appel API OpenAI/OpenRouter avec modèle: gpt-4o")
-        completion = await client.chat.completions.create(
-            model="gpt-4o",
-            messages=_build_rewrite_messages(cv_text, job_text),
-            temperature=0.4,
-            max_tokens=900,
+        update = await _cached_completion(
+            client,
+            "analyze",
+            cv_text,
+            job_text,
+            ANALYZE_MODEL,
+            _build_update_messages(previous, cv_diff.describe(), job_diff.describe()),
+            ANALYZE_TEMPERATURE,
+            900,
+            prompt_version=version,
         )
-        content = completion.choices[0].message.content or ""
-        logger.debug("Réponse API reçue (%d caractères)", len(content))
-        return content.strip()
+    except (SchedulerTimeout, CircuitOpen):
+        raise
     except Exception as exc:  # noqa: BLE001
-        logger.error("Erreur lors de l'appel API: %s", exc, exc_info=True)
-        log_exception(exc, logger_name="fmp.llm")
-        return f"Une erreur est survenue lors de l'appel à l'IA. Détails techniques : {type(exc).__name__}"
+        logger.warning("Mise à jour incrémentale impossible (%s), analyse complète.", type(exc).__name__)
+        return None, True
+
+    merged = merge_sections(previous, update)
+    if merged is None:
+        logger.warning("Mise à jour incrémentale inexploitable, analyse complète.")
+        return None, True
+    logger.info(
+        "Analyse mise à jour incrémentalement (%.0f %% du texte modifié).", changed_ratio * 100
+    )
+    # Pas sous la clé de l'analyse complète : la prochaine modification repartira
+    # d'une vraie analyse complète, sans cumuler les approximations des fusions
+    await llm_cache.set(merged_key, merged)
+    return merged, True
+
+
+@timed_stage("llm_client")
+async def reanalyze_profile(
+    cv_text: str,
+    job_text: str,
+    previous_cv_text: str | None = None,
+    previous_job_text: str | None = None,
+    skills: SkillMatch | None = None,
+) -> str:
+    """
+    Comme `analyze_profile`, mais en partant de la version précédente du CV et de l'offre
+    (session) : une petite modification ne fait réécrire que les sections concernées.
+    """
+    try:
+        merged, looked_up = await _incremental_update(
+            cv_text, job_text, previous_cv_text, previous_job_text
+        )
+    except (SchedulerTimeout, CircuitOpen) as exc:
+        # Provider saturé ou en panne : pas de seconde attente pour l'analyse complète
+        return await _failure_result("analyze", cv_text.strip(), job_text.strip(), exc, skills)
+    if merged is not None:
+        return merged
+    return await _run("analyze", cv_text, job_text, skills=skills, lookup=not looked_up)
+
+
+@timed_stage("llm_client")
+async def analyze_profile_structured(
+    cv_text: str, job_text: str, skills: SkillMatch | None = None
+) -> tuple[AnalysisResult, str]:
+    """
+    Analyse au format JSON validé (AnalysisResult), pour l'API : renvoie (résultat, source),
+    source valant "llm" ou "local". Les erreurs remontent en exception ; le moteur local
+    prend le relais dans les mêmes cas que pour l'analyse markdown.
+    """
+    cv_text = (cv_text or "").strip()
+    job_text = (job_text or "").strip()
+    if not cv_text or not job_text:
+        raise ValueError("CV ou offre vides")
+
+    if _local_analysis_for("analyze", "engine"):
+        return await asyncio.to_thread(analyze_locally_structured, cv_text, job_text, skills), "local"
+
+    client = _get_client()
+    if client is None:
+        if _local_analysis_for("analyze", "mock"):
+            return await asyncio.to_thread(analyze_locally_structured, cv_text, job_text, skills), "local"
+        raise RuntimeError("OPENAI_API_KEY non configurée")
+
+    try:
+        params = await _prepare_completion("analyze", cv_text, job_text, structured=True, skills=skills)
+        content = await _cached_completion(client, "analyze", cv_text, job_text, **params)
+    except LOCAL_FALLBACK_ERRORS:
+        if not _local_analysis_for("analyze", "degraded"):
+            raise
+        return await asyncio.to_thread(analyze_locally_structured, cv_text, job_text, skills), "local"
+    return parse_result("analyze", content), "llm"  # type: ignore[return-value]
+
+
+@timed_stage("llm_client")
+async def rewrite_profile(cv_text: str, job_text: str, raise_errors: bool = False) -> str:
+    return await _run("rewrite", cv_text, job_text, raise_errors)
+
+
+def provider_batch_available() -> bool:
+    """La Batch API n'existe que chez OpenAI (pas via OpenRouter)."""
+    return bool(settings.OPENAI_API_KEY) and not settings.OPENROUTER_BASE_URL
+
+
+def _provider_batch_payload(items: list[tuple[str, str, str]]) -> bytes:
+    """Fichier JSONL de la Batch API (prompts compactés : travail CPU, hors event loop)."""
+    lines = []
+    for custom_id, cv_text, job_text in items:
+        body = _completion_params("analyze", cv_text.strip(), job_text.strip())
+        lines.append(
+            json.dumps(
+                {
+                    "custom_id": custom_id,
+                    "method": "POST",
+                    "url": "/v1/chat/completions",
+                    "body": body,
+                },
+                ensure_ascii=False,
+            )
+        )
+    return "\n".join(lines).encode("utf-8")
+
+
+async def submit_provider_batch(items: list[tuple[str, str, str]]) -> str:
+    """
+    Soumet des analyses (custom_id, CV, offre) à la Batch API d'OpenAI :
+    moitié prix, résultats disponibles sous 24 h. Renvoie l'id du batch.
+    """
+    client = _get_client()
+    if client is None or not provider_batch_available():
+        raise RuntimeError("Batch API indisponible avec ce provider")
+
+    payload = await asyncio.to_thread(_provider_batch_payload, items)
+    batch_file = await client.files.create(
+        file=("fmp-batch.jsonl", payload),
+        purpose="batch",
+    )
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info("Batch provider %s soumis (%d analyses)", batch.id, len(items))
+    return batch.id
+
+
+async def fetch_provider_batch(batch_id: str) -> tuple[str, dict[str, str | None] | None]:
+    """
+    État d'un batch provider et, s'il est terminé, la réponse par custom_id
+    (None pour un élément en erreur).
+    """
+    client = _get_client()
+    if client is None or not provider_batch_available():
+        raise RuntimeError("Batch API indisponible avec ce provider")
+
+    batch = await client.batches.retrieve(batch_id)
+    if batch.status != "completed" or not batch.output_file_id:
+        return batch.status, None
+
+    output = await client.files.content(batch.output_file_id)
+    results: dict[str, str | None] = {}
+    for line in output.text.splitlines():
+        if not line.strip():
+            continue
+        row = json.loads(line)
+        response = row.get("response") or {}
+        if row.get("error") or response.get("status_code") != 200:
+            results[row["custom_id"]] = None
+            continue
+        content = response["body"]["choices"][0]["message"]["content"] or ""
+        results[row["custom_id"]] = _as_markdown("analyze", content.strip())
+    return batch.status, results
+
+
+async def embed_texts(texts: list[str], model: str, dimensions: int | None = None) -> list[list[float]]:
+    """Embeddings d'un lot de textes via l'endpoint du provider, dans l'ordre des textes."""
+    client = _get_client()
+    if client is None:
+        raise RuntimeError("Embeddings indisponibles : OPENAI_API_KEY non configurée")
+
+    params: dict[str, Any] = {"input": texts}
+    if dimensions:
+        params["dimensions"] = dimensions
+    response, used_model = await llm_resilience.call(
+        [model],
+        lambda name: client.embeddings.create(model=name, **params),
+        hedge=False,
+    )
+    record_llm_usage(used_model, getattr(response.usage, "prompt_tokens", None), None)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+
+def stream_analyze_profile(cv_text: str, job_text: str) -> AsyncIterator[str]:
+    """Comme `analyze_profile`, mais renvoie la réponse morceau par morceau (streaming)."""
+    return _run_stream("analyze", cv_text, job_text)
+
+
+async def stream_reanalyze_profile(
+    cv_text: str,
+    job_text: str,
+    previous_cv_text: str | None = None,
+    previous_job_text: str | None = None,
+) -> AsyncIterator[str]:
+    """Comme `reanalyze_profile` en streaming : une mise à jour incrémentale arrive en une fois."""
+    try:
+        merged, looked_up = await _incremental_update(
+            cv_text, job_text, previous_cv_text, previous_job_text
+        )
+    except (SchedulerTimeout, CircuitOpen) as exc:
+        yield await _failure_result("analyze", cv_text.strip(), job_text.strip(), exc)
+        return
+    if merged is not None:
+        yield merged
+        return
+    async for delta in _run_stream("analyze", cv_text, job_text, lookup=not looked_up):
+        yield delta
+
+
+def stream_rewrite_profile(cv_text: str, job_text: str) -> AsyncIterator[str]:
+    """Comme `rewrite_profile`, mais renvoie la réponse morceau par morceau (streaming)."""
+    return _run_stream("rewrite", cv_text, job_text)
@@ -0,0 +1,294 @@
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from collections import deque
+from typing import Awaitable, Callable, Sequence, TypeVar
+
+import openai
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.llm.resilience")
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class CircuitOpen(Exception):
+    """Le provider est considéré comme indisponible : on n'essaie même pas de l'appeler."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Erreurs transitoires (timeouts, 429, 5xx) qui méritent une nouvelle tentative."""
+    if isinstance(exc, (openai.APITimeoutError, openai.APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, openai.APIStatusError):
+        return exc.status_code in RETRYABLE_STATUS or exc.status_code >= 500
+    return False
+
+
+def retry_after_seconds(exc: BaseException) -> float | None:
+    """Délai demandé par le provider (en-tête Retry-After, en secondes ou en date HTTP)."""
+    response = getattr(exc, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(when.timestamp() - time.time(), 0.0)
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: float | None = None) -> float:
+    """Backoff exponentiel avec "full jitter", jamais plus court que le Retry-After."""
+    delay = random.uniform(0, min(cap, base * (2**attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur classique : après `failure_threshold` échecs consécutifs, le circuit
+    s'ouvre pendant `reset_seconds`, puis une seule requête test est autorisée.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = settings.LLM_BREAKER_FAILURES,
+        reset_seconds: float = settings.LLM_BREAKER_RESET_SECONDS,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Provider LLM de nouveau disponible, circuit refermé.")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def release_probe(self) -> None:
+        """La requête test a été abandonnée (client parti) : une autre pourra la refaire."""
+        self._probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.state != "open":
+                logger.error(
+                    "Provider LLM en échec (%d erreurs), circuit ouvert pour %.0fs.",
+                    self.failures,
+                    self.reset_seconds,
+                )
+            self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    """Latences récentes par modèle, pour décider quand envoyer une requête de secours."""
+
+    def __init__(self, window: int = 200) -> None:
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+
+    def record(self, model: str, seconds: float) -> None:
+        samples = self._samples.get(model)
+        if samples is None:
+            samples = self._samples[model] = deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def percentile(self, model: str, pct: float, min_samples: int) -> float | None:
+        samples = self._samples.get(model)
+        if not samples or len(samples) < min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(int(len(ordered) * pct / 100.0), len(ordered) - 1)
+        return ordered[index]
+
+
+class ResilientCaller:
+    """
+    Enrobe un appel au provider :
+
+    - retries avec backoff exponentiel + jitter, en respectant Retry-After
+    - requête "hedgée" : si la première tentative dépasse le percentile de latence
+      du modèle, une seconde part en parallèle et la plus rapide gagne
+    - chaîne de modèles de repli (ex. gpt-4o → gpt-4o-mini)
+    - disjoncteur : si le provider est en panne, on échoue immédiatement (CircuitOpen)
+    """
+
+    def __init__(
+        self,
+        attempts: int = settings.LLM_RETRY_ATTEMPTS,
+        base_delay: float = settings.LLM_RETRY_BASE_SECONDS,
+        max_delay: float = settings.LLM_RETRY_MAX_SECONDS,
+        hedge_enabled: bool = settings.LLM_HEDGE_ENABLED,
+        hedge_percentile: float = settings.LLM_HEDGE_PERCENTILE,
+        hedge_min_samples: int = settings.LLM_HEDGE_MIN_SAMPLES,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.attempts = max(attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = LatencyTracker()
+
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.fallbacks = 0
+        self.rejected = 0
+
+    async def _first_success(self, first: asyncio.Task[T], second: asyncio.Task[T]) -> T:
+        pending = {first, second}
+        error: BaseException | None = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            assert error is not None
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _attempt(self, model: str, request: Callable[[str], Awaitable[T]], hedge: bool) -> T:
+        started = time.monotonic()
+        threshold = (
+            self.latency.percentile(model, self.hedge_percentile, self.hedge_min_samples)
+            if hedge and self.hedge_enabled
+            else None
+        )
+
+        if threshold is None:
+            result = await request(model)
+        else:
+            first = asyncio.ensure_future(request(model))
+            try:
+                done, _ = await asyncio.wait({first}, timeout=threshold)
+            except BaseException:
+                first.cancel()
+                raise
+            if done:
+                result = first.result()
+            else:
+                self.hedged += 1
+                logger.debug("Appel %s au-delà de %.2fs, requête de secours lancée.", model, threshold)
+                second = asyncio.ensure_future(request(model))
+                result = await self._first_success(first, second)
+
+        self.latency.record(model, time.monotonic() - started)
+        return result
+
+    async def call(
+        self,
+        models: Sequence[str],
+        request: Callable[[str], Awaitable[T]],
+        hedge: bool = True,
+    ) -> tuple[T, str]:
+        """Exécute `request(model)` sur la chaîne `models` ; renvoie (résultat, modèle utilisé)."""
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpen()
+
+        last_error: BaseException | None = None
+        for index, model in enumerate(models):
+            if index > 0:
+                self.fallbacks += 1
+                logger.warning("Repli sur le modèle %s après l'échec de %s.", model, models[index - 1])
+
+            for attempt in range(self.attempts):
+                try:
+                    result = await self._attempt(model, request, hedge)
+                except openai.NotFoundError as exc:
+                    # Modèle inconnu chez le provider : on passe directement au suivant
+                    last_error = exc
+                    break
+                except Exception as exc:
+                    if not is_retryable(exc):
+                        # Erreur côté requête (400, 401…) : inutile d'insister,
+                        # mais le provider a bien répondu
+                        self.breaker.record_success()
+                        raise
+                    last_error = exc
+                    retry_after = retry_after_seconds(exc)
+                    if attempt + 1 >= self.attempts or (
+                        retry_after is not None and retry_after > self.max_delay
+                    ):
+                        break
+                    self.retries += 1
+                    delay = backoff_delay(attempt, self.base_delay, self.max_delay, retry_after)
+                    logger.info(
+                        "Erreur transitoire %s sur %s, nouvelle tentative dans %.2fs.",
+                        type(exc).__name__,
+                        model,
+                        delay,
+                    )
+                    try:
+                        await asyncio.sleep(delay)
+                    except asyncio.CancelledError:
+                        self.breaker.release_probe()
+                        raise
+                except asyncio.CancelledError:
+                    self.breaker.release_probe()
+                    raise
+                else:
+                    self.breaker.record_success()
+                    return result, model
+
+        self.breaker.record_failure()
+        assert last_error is not None
+        raise last_error
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "retries": self.retries,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "fallbacks": self.fallbacks,
+            "rejected": self.rejected,
+        }
+
+
+llm_resilience = ResilientCaller()
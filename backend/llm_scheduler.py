@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.llm.scheduler")
+
+FREE_LANE = "free"
+PRO_LANE = "pro"
+# Plus la valeur est basse, plus la voie est prioritaire dans la file d'attente
+LANE_PRIORITY = {PRO_LANE: 0, FREE_LANE: 1}
+
+
+class SchedulerTimeout(Exception):
+    """L'appel LLM n'a pas pu démarrer avant l'échéance : on échoue vite plutôt que d'empiler."""
+
+
+class Ticket:
+    """Autorisation de lancer un appel LLM, avec le temps passé en file d'attente."""
+
+    __slots__ = ("lane", "reserved_tokens", "queue_wait", "used_tokens")
+
+    def __init__(self, lane: str, reserved_tokens: int, queue_wait: float) -> None:
+        self.lane = lane
+        self.reserved_tokens = reserved_tokens
+        self.queue_wait = queue_wait
+        self.used_tokens: int | None = None
+
+    def record_usage(self, total_tokens: int | None) -> None:
+        """Tokens réellement consommés (renvoyés par le provider), pour corriger l'estimation."""
+        self.used_tokens = total_tokens
+
+
+class _Waiter:
+    __slots__ = ("lane", "tokens", "future", "enqueued_at")
+
+    def __init__(self, lane: str, tokens: int, future: asyncio.Future[None]) -> None:
+        self.lane = lane
+        self.tokens = tokens
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Ordonnanceur en process des appels LLM.
+
+    - un plafond global d'appels simultanés, plus un budget par voie (free / pro)
+    - une file de priorité : quand une place se libère, la voie pro passe d'abord
+    - un budget de tokens par minute (0 = illimité) calé sur le quota du provider ;
+      chaque appel réserve une estimation, corrigée ensuite avec l'usage réel
+    - un appel qui ne peut pas démarrer avant `queue_timeout` lève SchedulerTimeout
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = settings.LLM_MAX_CONCURRENCY,
+        lane_limits: dict[str, int] | None = None,
+        tokens_per_minute: int = settings.LLM_TOKENS_PER_MINUTE,
+        queue_timeout: float = settings.LLM_QUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self.lane_limits = lane_limits or {
+            FREE_LANE: settings.LLM_FREE_CONCURRENCY,
+            PRO_LANE: settings.LLM_PRO_CONCURRENCY,
+        }
+        self.tokens_per_minute = tokens_per_minute
+        self.queue_timeout = queue_timeout
+
+        self._running: dict[str, int] = {lane: 0 for lane in self.lane_limits}
+        self._queue: list[tuple[int, int, _Waiter]] = []
+        self._seq = itertools.count()
+        self._tokens = float(tokens_per_minute)
+        self._tokens_updated = time.monotonic()
+        self._refill_handle: asyncio.TimerHandle | None = None
+
+        self._stats: dict[str, dict[str, float]] = {
+            lane: {"started": 0, "rejected": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for lane in self.lane_limits
+        }
+
+    # --- budget de tokens par minute -------------------------------------------------
+
+    def _refill_tokens(self) -> None:
+        if self.tokens_per_minute <= 0:
+            return
+        now = time.monotonic()
+        rate = self.tokens_per_minute / 60.0
+        self._tokens = min(
+            float(self.tokens_per_minute),
+            self._tokens + (now - self._tokens_updated) * rate,
+        )
+        self._tokens_updated = now
+
+    def _clamp_tokens(self, tokens: int) -> int:
+        # Un appel plus gros que le quota entier doit quand même pouvoir passer
+        if self.tokens_per_minute <= 0:
+            return 0
+        return min(tokens, self.tokens_per_minute)
+
+    def _schedule_refill(self, missing: float) -> None:
+        if self._refill_handle is not None:
+            return
+        delay = missing / (self.tokens_per_minute / 60.0)
+
+        def _wake() -> None:
+            self._refill_handle = None
+            self._dispatch()
+
+        self._refill_handle = asyncio.get_running_loop().call_later(delay, _wake)
+
+    # --- file d'attente --------------------------------------------------------------
+
+    def _has_slot(self, lane: str) -> bool:
+        return (
+            sum(self._running.values()) < self.max_concurrency
+            and self._running[lane] < self.lane_limits[lane]
+        )
+
+    def _start(self, lane: str, tokens: int) -> None:
+        self._running[lane] += 1
+        self._tokens -= tokens
+
+    def _dispatch(self) -> None:
+        """Démarre les appels en attente qui peuvent l'être, dans l'ordre de priorité."""
+        self._refill_tokens()
+        blocked: list[tuple[int, int, _Waiter]] = []
+
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            waiter = entry[2]
+            if waiter.future.done():  # timeout ou client parti
+                continue
+            if not self._has_slot(waiter.lane):
+                blocked.append(entry)
+                continue
+            if self.tokens_per_minute > 0 and self._tokens < waiter.tokens:
+                # Le plus prioritaire attend des tokens : on ne le double pas
+                blocked.append(entry)
+                self._schedule_refill(waiter.tokens - self._tokens)
+                break
+            self._start(waiter.lane, waiter.tokens)
+            waiter.future.set_result(None)
+
+        for entry in blocked:
+            heapq.heappush(self._queue, entry)
+
+    async def _acquire(self, lane: str, tokens: int) -> float:
+        self._refill_tokens()
+        if not self._queue and self._has_slot(lane) and (
+            self.tokens_per_minute <= 0 or self._tokens >= tokens
+        ):
+            self._start(lane, tokens)
+            return 0.0
+
+        future: asyncio.Future[None] = asyncio.get_running_loop().create_future()
+        waiter = _Waiter(lane, tokens, future)
+        heapq.heappush(self._queue, (LANE_PRIORITY.get(lane, 1), next(self._seq), waiter))
+        self._dispatch()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done():  # place obtenue au tout dernier moment
+                return time.monotonic() - waiter.enqueued_at
+            future.cancel()
+            self._stats[lane]["rejected"] += 1
+            logger.warning(
+                "Appel LLM (%s) abandonné après %.1fs en file d'attente.", lane, self.queue_timeout
+            )
+            raise SchedulerTimeout(lane) from None
+        except BaseException:
+            # Requête annulée pendant l'attente (client déconnecté…)
+            if future.done() and not future.cancelled():
+                self._release(lane, tokens, tokens)
+            else:
+                future.cancel()
+            raise
+        return time.monotonic() - waiter.enqueued_at
+
+    def _release(self, lane: str, reserved: int, used: int) -> None:
+        self._running[lane] -= 1
+        if self.tokens_per_minute > 0:
+            # rembourse (ou facture en plus) l'écart entre estimation et usage réel
+            self._tokens += reserved - self._clamp_tokens(used)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, lane: str, estimated_tokens: int) -> AsyncIterator[Ticket]:
+        """Attend une place dans la voie `lane` pour un appel d'environ `estimated_tokens`."""
+        if lane not in self.lane_limits:
+            raise ValueError(f"Voie LLM inconnue : {lane}")
+
+        reserved = self._clamp_tokens(estimated_tokens)
+        queue_wait = await self._acquire(lane, reserved)
+
+        stats = self._stats[lane]
+        stats["started"] += 1
+        stats["wait_total"] += queue_wait
+        stats["wait_max"] = max(stats["wait_max"], queue_wait)
+        if queue_wait >= 1.0:
+            logger.info("Appel LLM (%s) démarré après %.2fs d'attente.", lane, queue_wait)
+
+        ticket = Ticket(lane, reserved, queue_wait)
+        try:
+            yield ticket
+        finally:
+            used = ticket.used_tokens if ticket.used_tokens is not None else estimated_tokens
+            self._release(lane, reserved, used)
+
+    def stats(self) -> dict[str, object]:
+        return {
+            "running": dict(self._running),
+            "queued": sum(1 for _, _, waiter in self._queue if not waiter.future.done()),
+            "tokens_available": round(self._tokens) if self.tokens_per_minute > 0 else None,
+            "lanes": {
+                lane: {
+                    "started": int(values["started"]),
+                    "rejected": int(values["rejected"]),
+                    "wait_avg_s": round(values["wait_total"] / values["started"], 4)
+                    if values["started"]
+                    else 0.0,
+                    "wait_max_s": round(values["wait_max"], 4),
+                }
+                for lane, values in self._stats.items()
+            },
+        }
+
+
+llm_scheduler = LLMScheduler()
@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import logging
+import time
+
+import httpx
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.llm.transport")
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # type: ignore  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def build_http_client() -> httpx.AsyncClient:
+    """
+    Client HTTP partagé par tous les appels LLM : pool de connexions borné,
+    keep-alive configurable, timeouts connect/read séparés, HTTP/2 optionnel.
+    """
+    http2 = settings.LLM_HTTP2
+    if http2 and not _http2_available():
+        logger.warning("LLM_HTTP2 activé mais le paquet 'h2' est absent : HTTP/1.1 utilisé.")
+        http2 = False
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_POOL_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_POOL_MAX_KEEPALIVE,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            settings.LLM_READ_TIMEOUT_SECONDS,
+            connect=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+            pool=settings.LLM_POOL_TIMEOUT_SECONDS,
+        ),
+        http2=http2,
+    )
+
+
+async def warm_up(http_client: httpx.AsyncClient, base_url: str) -> None:
+    """
+    Ouvre une première connexion (DNS + TLS) vers le provider, pour que la première
+    vraie requête après un déploiement n'en paie pas le coût. Le statut renvoyé
+    importe peu : seule la connexion gardée en keep-alive nous intéresse.
+    """
+    started = time.perf_counter()
+    try:
+        await http_client.head(base_url)
+    except httpx.HTTPError as exc:
+        logger.warning("Préchauffage de la connexion LLM impossible: %s", exc)
+        return
+    logger.info(
+        "Connexion LLM préchauffée en %.0f ms (%s)",
+        (time.perf_counter() - started) * 1000,
+        base_url,
+    )
+
+
+def pool_stats(http_client: httpx.AsyncClient | None) -> dict[str, int]:
+    """État du pool de connexions (lu dans httpcore, absent si l'implémentation change)."""
+    stats = {
+        "max_connections": settings.LLM_POOL_MAX_CONNECTIONS,
+        "max_keepalive": settings.LLM_POOL_MAX_KEEPALIVE,
+    }
+    pool = getattr(getattr(http_client, "_transport", None), "_pool", None)
+    if pool is None:
+        return stats
+
+    connections = list(getattr(pool, "connections", []))
+    idle = sum(1 for connection in connections if connection.is_idle())
+    stats.update(
+        {
+            "connections": len(connections),
+            "idle": idle,
+            "active": len(connections) - idle,
+            "requests": len(getattr(pool, "_requests", [])),
+        }
+    )
+    return stats
@@ -0,0 +1,363 @@
+from __future__ import annotations
+
+import logging
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+from .analysis_schema import AnalysisResult, Keywords
+from .metrics import timed_stage
+from .prompt_compaction import HEADING_RE, dedupe_segments, fold, split_segments, terms
+from .settings import settings
+from .skill_matcher import SkillMatch, get_skill_categories, get_skill_matcher, score_skills
+
+logger = logging.getLogger("fmp.local")
+
+# Rubriques du CV reconnues à partir de leur titre
+SECTION_PATTERNS = {
+    "experience": re.compile(
+        r"exp[ée]riences?|parcours|experience|r[ée]alisations|projets?|projects", re.IGNORECASE
+    ),
+    "skills": re.compile(r"comp[ée]tences?|skills", re.IGNORECASE),
+    "education": re.compile(r"formations?|[ée]ducation|dipl[ôo]mes?|certifications?", re.IGNORECASE),
+    "languages": re.compile(r"langues|languages", re.IGNORECASE),
+}
+SECTION_LABELS = {
+    "experience": "expériences",
+    "skills": "compétences",
+    "education": "formation",
+    "languages": "langues",
+}
+
+HARD_SKILL_CATEGORIES = ("Langages", "Frameworks et bibliothèques", "Données et bases")
+TOOL_CATEGORIES = ("Cloud, DevOps, infra", "Méthodes et gestion de projet")
+SOFT_SKILL_CATEGORY = "Soft skills"
+
+# Poids des trois signaux dans le score global (sans dictionnaire de compétences : 0.6 / 0.4)
+SKILLS_WEIGHT, KEYWORDS_WEIGHT, REQUIREMENTS_WEIGHT = 0.5, 0.3, 0.2
+# Part des compétences du dictionnaire dans la couverture d'une exigence (le reste : BM25)
+REQUIREMENT_SKILLS_SHARE = 0.7
+TOP_JOB_TERMS = 25
+MIN_REQUIREMENT_TERMS = 3
+QUOTE_CHARS = 110
+SURFACE_WORD_RE = re.compile(r"[\w+#]+(?:[.\-][\w+#]+)*")
+# Mots fréquents des offres qui ne disent rien du poste (en plus des STOPWORDS du compacteur)
+OFFER_STOPWORDS = frozenset(
+    """
+    votre vos notre nos tes ton sera serez seront rejoindre rejoignez recherchons recherche
+    cherchons poste postes mission missions profil profils candidat candidate equipe equipes
+    entreprise societe client clients base bases cadre sein concevez developpez maintenez
+    deployez participez assurez travaillez aurez requis requise souhaite souhaitee apprecie
+    appreciee idealement minimum ans annee annees experience experiences bonne bonnes bon bons
+    """.split()
+)
+LOCAL_NOTE = "_Analyse automatique (sans IA), basée sur les mots-clés et compétences de l'offre._"
+TITLE_END_RE = re.compile(r"\s*(?:\(?\s*[hf]\s*/\s*[hf]\s*\)?|[-–—:,.(]|\bvous\b|\bnous\b)", re.IGNORECASE)
+
+
+class BM25:
+    """Okapi BM25 sur une petite collection (les segments d'un CV)."""
+
+    def __init__(self, documents: list[list[str]], k1: float = 1.5, b: float = 0.75) -> None:
+        self.k1 = k1
+        self.b = b
+        self.frequencies = [Counter(document) for document in documents]
+        self.lengths = [len(document) for document in documents]
+        self.average_length = (sum(self.lengths) / len(documents)) if documents else 0.0
+        document_frequency: Counter[str] = Counter()
+        for frequency in self.frequencies:
+            document_frequency.update(frequency.keys())
+        self.document_frequency = document_frequency
+        self.size = len(documents)
+
+    def idf(self, term: str) -> float:
+        df = self.document_frequency.get(term, 0)
+        return math.log(1 + (self.size - df + 0.5) / (df + 0.5))
+
+    def scores(self, query: list[str]) -> list[float]:
+        unique_query = set(query)
+        results: list[float] = []
+        for frequency, length in zip(self.frequencies, self.lengths):
+            norm = self.k1 * (1 - self.b + self.b * length / (self.average_length or 1))
+            score = 0.0
+            for term in unique_query:
+                tf = frequency.get(term)
+                if tf:
+                    score += self.idf(term) * tf * (self.k1 + 1) / (tf + norm)
+            results.append(score)
+        return results
+
+    def ideal(self, query: list[str]) -> float:
+        """Score d'un segment qui contiendrait une fois chaque mot de la requête (longueur moyenne)."""
+        return sum(self.idf(term) for term in set(query))
+
+
+@dataclass
+class Requirement:
+    """Une phrase de l'offre et le passage du CV qui y répond le mieux."""
+
+    text: str
+    coverage: float
+    best_match: str = ""
+
+
+@dataclass
+class LocalAnalysis:
+    score: int
+    sections: dict[str, list[str]]
+    skills: SkillMatch | None
+    keyword_coverage: float
+    requirements: list[Requirement] = field(default_factory=list)
+    missing_terms: list[str] = field(default_factory=list)
+    job_title: str = ""
+    cv_chars: int = 0
+
+
+def detect_sections(segments: list[str]) -> dict[str, list[str]]:
+    """Range les segments du CV sous leur rubrique (titre reconnu), "profile" pour l'en-tête."""
+    sections: dict[str, list[str]] = {"profile": []}
+    current = "profile"
+    for segment in segments:
+        heading = HEADING_RE.match(segment.strip())
+        if heading is not None and heading.group(0)[0].isupper():
+            current = next(
+                (name for name, pattern in SECTION_PATTERNS.items() if pattern.match(heading.group(0))),
+                "other",
+            )
+        sections.setdefault(current, []).append(segment)
+    return sections
+
+
+def _job_title(job_segments: list[str]) -> str:
+    """Intitulé du poste : début de la première phrase de l'offre, avant "H/F", tiret, etc."""
+    if not job_segments:
+        return ""
+    first = job_segments[0].strip()
+    cut = TITLE_END_RE.search(first)
+    title = first[: cut.start()] if cut and cut.start() > 0 else first
+    return " ".join(title.split()[:8])
+
+
+def _quote(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= QUOTE_CHARS else text[: QUOTE_CHARS - 1].rstrip() + "…"
+
+
+def _surface_forms(text: str) -> dict[str, str]:
+    """Forme sans accent -> mot tel qu'écrit dans le texte (première occurrence)."""
+    forms: dict[str, str] = {}
+    for word in SURFACE_WORD_RE.findall(text.lower()):
+        forms.setdefault(fold(word), word)
+    return forms
+
+
+def analyze(cv_text: str, job_text: str, skills: SkillMatch | None = None) -> LocalAnalysis:
+    """
+    Compare CV et offre sans IA : compétences du dictionnaire, mots-clés, BM25 par exigence.
+    `skills` : matching des compétences déjà calculé par l'appelant, sinon fait ici.
+    """
+    cv_segments = dedupe_segments(split_segments(cv_text))
+    job_segments = dedupe_segments(split_segments(job_text))
+    cv_documents = [terms(segment) for segment in cv_segments]
+    cv_terms = {term for document in cv_documents for term in document}
+
+    # Au plus un passage de l'automate sur chaque texte
+    matcher = get_skill_matcher() if settings.SKILLS_ENABLED else None
+    if matcher is None:
+        skills = None
+    elif skills is None:
+        job_skills = matcher.find(job_text)
+        skills = score_skills(matcher, matcher.find(cv_text), job_skills) if job_skills else None
+
+    # Mots les plus fréquents de l'offre : présents ou non dans le CV
+    job_counts = Counter(term for term in terms(job_text) if term not in OFFER_STOPWORDS)
+    top_terms = job_counts.most_common(TOP_JOB_TERMS)
+    total_weight = sum(count for _, count in top_terms)
+    covered_weight = sum(count for term, count in top_terms if term in cv_terms)
+    keyword_coverage = covered_weight / total_weight if total_weight else 0.0
+    surface = _surface_forms(job_text)
+    missing_terms = [surface.get(term, term) for term, _ in top_terms if term not in cv_terms]
+
+    # Chaque phrase de l'offre contre chaque segment du CV (BM25), complété par les
+    # compétences du dictionnaire citées dans la phrase : les verbes et mots de liaison
+    # de l'offre ne se retrouvent jamais tels quels dans un CV
+    index = BM25(cv_documents)
+    requirements: list[Requirement] = []
+    for segment in job_segments:
+        query = [term for term in terms(segment) if term not in OFFER_STOPWORDS]
+        if len(set(query)) < MIN_REQUIREMENT_TERMS:
+            continue
+        scores = index.scores(query) if cv_documents else []
+        best = max(range(len(scores)), key=scores.__getitem__) if scores else -1
+        ideal = index.ideal(query)
+        coverage = min(scores[best] / ideal, 1.0) if best >= 0 and ideal else 0.0
+        wanted = matcher.find(segment) if matcher and skills else None
+        if wanted:
+            # Compétences de l'offre : présentes dans le CV si et seulement si "matched"
+            found = sum(1 for skill_id in wanted if skill_id in skills.matched_ids)  # type: ignore[union-attr]
+            coverage = REQUIREMENT_SKILLS_SHARE * found / len(wanted) + (1 - REQUIREMENT_SKILLS_SHARE) * coverage
+        requirements.append(
+            Requirement(segment, coverage, cv_segments[best] if best >= 0 and scores[best] > 0 else "")
+        )
+    requirement_coverage = (
+        sum(requirement.coverage for requirement in requirements) / len(requirements)
+        if requirements
+        else keyword_coverage
+    )
+
+    if skills is not None:
+        raw = (
+            SKILLS_WEIGHT * skills.score / 100
+            + KEYWORDS_WEIGHT * keyword_coverage
+            + REQUIREMENTS_WEIGHT * requirement_coverage
+        )
+    else:
+        raw = 0.6 * keyword_coverage + 0.4 * requirement_coverage
+
+    return LocalAnalysis(
+        score=max(0, min(round(raw * 100), 100)),
+        sections=detect_sections(cv_segments),
+        skills=skills,
+        keyword_coverage=keyword_coverage,
+        requirements=requirements,
+        missing_terms=missing_terms,
+        job_title=_job_title(job_segments),
+        cv_chars=len(cv_text),
+    )
+
+
+def _by_category(skills: list[str], categories: tuple[str, ...]) -> list[str]:
+    category_of = get_skill_categories()
+    return [skill for skill in skills if category_of.get(skill) in categories]
+
+
+def to_structured(result: LocalAnalysis) -> AnalysisResult:
+    """Rapport au même format (AnalysisResult : score + 6 sections) que l'analyse IA."""
+    matched = result.skills.matched if result.skills else []
+    missing = result.skills.missing if result.skills else []
+    found_sections = [name for name in SECTION_LABELS if result.sections.get(name)]
+    absent_sections = [SECTION_LABELS[name] for name in ("experience", "skills", "education") if name not in found_sections]
+    strong = sorted(
+        (requirement for requirement in result.requirements if requirement.coverage >= 0.5),
+        key=lambda requirement: requirement.coverage,
+        reverse=True,
+    )
+    weak = [requirement for requirement in result.requirements if requirement.coverage < 0.25]
+    title = result.job_title or "le poste visé"
+    other_missing = [term for term in result.missing_terms if term not in {skill.lower() for skill in missing}]
+
+    if result.score >= 70:
+        verdict = "Ton profil correspond bien à l'offre"
+    elif result.score >= 45:
+        verdict = "Ton profil correspond en partie à l'offre"
+    else:
+        verdict = "Ton CV, en l'état, reste éloigné de l'offre"
+    summary = [
+        f"{verdict} : environ {round(result.keyword_coverage * 100)} % des mots-clés principaux de l'offre se retrouvent dans ton CV.",
+    ]
+    if result.skills is not None:
+        summary.append(
+            f"{len(matched)} compétence(s) demandée(s) sur {len(matched) + len(missing)} sont présentes dans ton CV."
+        )
+    summary.append(
+        f"{len(strong)} exigence(s) de l'offre sur {len(result.requirements)} trouvent un écho clair dans ton CV."
+    )
+    if absent_sections:
+        summary.append("Rubrique(s) non repérée(s) dans ton CV : " + ", ".join(absent_sections) + ".")
+
+    strengths: list[str] = []
+    if matched:
+        strengths.append("Compétences demandées déjà présentes : " + ", ".join(matched[:10]) + ".")
+    for requirement in strong[:4]:
+        strengths.append(
+            f"L'offre demande « {_quote(requirement.text)} » : ton CV y répond avec « {_quote(requirement.best_match)} »."
+        )
+    if found_sections:
+        strengths.append(
+            "CV structuré : rubriques " + ", ".join(SECTION_LABELS[name] for name in found_sections) + " identifiées."
+        )
+    if not strengths:
+        strengths.append("Peu de recoupements directs avec l'offre : le CV doit être adapté à ce poste.")
+
+    weaknesses: list[str] = []
+    if missing:
+        weaknesses.append("Compétences de l'offre absentes du CV : " + ", ".join(missing[:10]) + ".")
+    for requirement in weak[:3]:
+        weaknesses.append(f"Rien dans le CV ne répond clairement à « {_quote(requirement.text)} ».")
+    if other_missing:
+        weaknesses.append("Mots importants de l'offre absents du CV : " + ", ".join(other_missing[:8]) + ".")
+    for section in absent_sections:
+        weaknesses.append(f"Pas de rubrique « {section} » repérée : un recruteur risque de la chercher.")
+    if result.cv_chars < 1200:
+        weaknesses.append("CV très court : il manque probablement de détails sur tes réalisations.")
+    if not weaknesses:
+        weaknesses.append("Pas d'écart majeur détecté sur les mots-clés : travaille surtout la mise en valeur des résultats.")
+
+    actions: list[str] = []
+    if missing:
+        actions.append(
+            "Ajoute les compétences que tu maîtrises parmi : " + ", ".join(missing[:6])
+            + ", dans la rubrique compétences et dans les expériences où tu les as utilisées."
+        )
+    for requirement in weak[:2]:
+        actions.append(f"Ajoute une ligne d'expérience qui montre concrètement : « {_quote(requirement.text)} ».")
+    if "skills" not in found_sections:
+        actions.append("Crée une rubrique « Compétences » listant outils et technologies, avec les mots de l'offre.")
+    actions.append(f"Reprends l'intitulé « {title} » dans le titre de ton CV.")
+    actions.append("Chiffre tes résultats (volumes, délais, gains, taille d'équipe) dans chaque expérience.")
+    if matched:
+        actions.append("Remonte en tête de tes expériences les réalisations qui utilisent " + ", ".join(matched[:3]) + ".")
+
+    highlight = ", ".join(matched[:3]) or "les compétences clés de l'offre"
+    titles = [f"{title}", f"{title} – {highlight}"]
+    if matched:
+        titles.append(f"{title} orienté {matched[0]}")
+    hooks = [
+        f"{title} avec une expérience concrète sur {highlight}. "
+        "J'interviens de la conception à la mise en production, avec le souci de résultats mesurables. "
+        "Je cherche à mettre ces compétences au service de vos équipes.",
+        f"Habitué(e) aux environnements exigeants, je maîtrise {highlight} et j'aime travailler en équipe "
+        "sur des projets à fort impact. Votre offre correspond directement à mon parcours et à mes ambitions.",
+    ]
+
+    category_of = get_skill_categories()
+    keywords = Keywords(
+        hard_skills=_by_category(missing, HARD_SKILL_CATEGORIES),
+        to_reinforce=[skill for skill in matched if category_of.get(skill) != SOFT_SKILL_CATEGORY][:10],
+        soft_skills=[skill for skill in matched + missing if category_of.get(skill) == SOFT_SKILL_CATEGORY],
+        tools=_by_category(missing, TOOL_CATEGORIES),
+        other=other_missing[:10],
+    )
+
+    return AnalysisResult(
+        score=result.score,
+        summary=" ".join(summary),
+        strengths=strengths,
+        weaknesses=weaknesses,
+        action_plan=actions,
+        titles=titles,
+        hooks=hooks,
+        keywords=keywords,
+    )
+
+
+def render_report(result: LocalAnalysis) -> str:
+    return to_structured(result).to_markdown(note=LOCAL_NOTE)
+
+
+@timed_stage("local_analysis")
+def analyze_locally_structured(
+    cv_text: str, job_text: str, skills: SkillMatch | None = None
+) -> AnalysisResult:
+    return to_structured(analyze(cv_text, job_text, skills))
+
+
+@timed_stage("local_analysis")
+def analyze_locally(cv_text: str, job_text: str, skills: SkillMatch | None = None) -> str:
+    """Analyse complète sans appel IA (mode mock, mode dégradé, offre gratuite)."""
+    started = time.perf_counter()
+    report = render_report(analyze(cv_text, job_text, skills))
+    logger.debug("Analyse locale en %.1f ms", (time.perf_counter() - started) * 1000)
+    return report
@@ -1,35 +1,112 @@
 from __future__ import annotations
 
+import asyncio
+import json
 import logging
 import re
+import secrets
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator
 
-import markdown
 import stripe
 from fastapi import FastAPI, Request, Form, UploadFile, File, HTTPException, status
-from fastapi.responses import HTMLResponse, JSONResponse, RedirectResponse
+from fastapi.responses import (
+    HTMLResponse,
+    JSONResponse,
+    PlainTextResponse,
+    RedirectResponse,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from starlette.middleware.sessions import SessionMiddleware
 
 from .settings import settings
-from .upload_guard import validate_and_read_upload
+from .upload_guard import new_file_hasher, validate_and_read_upload
 from .parse_cv import extract_text_from_validated_upload, clean_text
-from .llm_client import analyze_profile, rewrite_profile
+from .parse_cache import parse_cache
+from .parse_engine import parse_engine
+from .batch import item_id, parse_cvs, rank_pairs, run_batch, select_pairs
+from .embedding_index import CV, JOB, KIND_CODES, EmbeddingService, get_embedding_service
+from pydantic import ValidationError
+
+from .llm_client import (
+    analyze_profile,
+    analyze_profile_structured,
+    close_client,
+    fetch_provider_batch,
+    http_pool_stats,
+    inflight_stats,
+    provider_batch_available,
+    reanalyze_profile,
+    rewrite_profile,
+    start_client,
+    stream_reanalyze_profile,
+    stream_rewrite_profile,
+    submit_provider_batch,
+)
+from .job_queue import DONE, ERROR, Job, job_queue
+from .llm_cache import llm_cache
+from .llm_resilience import CircuitOpen, llm_resilience
+from .llm_scheduler import SchedulerTimeout, llm_scheduler
 from .logging_conf import configure_logging
-from .rate_limit import RateLimitMiddleware
+from .markdown_render import markdown_renderer, render_markdown_async
+from .metrics import MetricsMiddleware, loop_lag_monitor, registry, timed
+from .rate_limit import RateLimitMiddleware, create_rate_limiter
+from .session_store import ServerSessionMiddleware, create_session_backend
+from .skill_matcher import get_skill_matcher, match_skills
 
 # Configurer les logs
 configure_logging(settings.LOG_LEVEL)
 
 logger = logging.getLogger("fmp.api")
 
-app = FastAPI(title="Fit My Profile (FMP)")
+session_backend = create_session_backend(settings.SESSION_BACKEND)
+
+# Mode job : les erreurs IA remontent pour que le job passe en "error" (relançable)
+job_queue.register("analyze", lambda cv, job: analyze_profile(cv, job, raise_errors=True))
+job_queue.register("rewrite", lambda cv, job: rewrite_profile(cv, job, raise_errors=True))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_client()
+    if settings.SKILLS_ENABLED:
+        # Compile le dictionnaire de compétences avant la première requête
+        await asyncio.to_thread(get_skill_matcher)
+    if settings.JOB_MODE:
+        job_queue.start()
+    if settings.METRICS_ENABLED:
+        loop_lag_monitor.start()
+    yield
+    await loop_lag_monitor.stop()
+    await job_queue.stop()
+    await close_client()
+    parse_engine.shutdown()
+    parse_cache.close()
+    llm_cache.close()
+    if session_backend is not None:
+        session_backend.close()
+    rate_limiter.close()
 
-# Session middleware
-app.add_middleware(
-    SessionMiddleware,
-    secret_key=settings.SESSION_SECRET_KEY,
-)
+
+app = FastAPI(title="Fit My Profile (FMP)", lifespan=lifespan)
+
+# Session middleware : stockage côté serveur (le cookie ne porte qu'un id),
+# ou session entière dans le cookie signé si SESSION_BACKEND=cookie
+if session_backend is None:
+    app.add_middleware(
+        SessionMiddleware,
+        secret_key=settings.SESSION_SECRET_KEY,
+    )
+else:
+    app.add_middleware(
+        ServerSessionMiddleware,
+        backend=session_backend,
+        secret_key=settings.SESSION_SECRET_KEY,
+        max_age=settings.SESSION_TTL_SECONDS,
+    )
 
 if settings.STRIPE_SECRET_KEY:
     stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -48,19 +125,123 @@ def render_template(
     ctx = {"request": request, "analytics_domain": settings.ANALYTICS_DOMAIN}
     if context:
         ctx.update(context)
-    return templates.TemplateResponse(name, ctx, status_code=status_code)
+    with timed("jinja"):
+        return templates.TemplateResponse(name, ctx, status_code=status_code)
+
+
+SCORE_RE = re.compile(r"Score global\s*:\s*(\d{1,3})")
+# En streaming, on attend le caractère suivant pour ne pas publier "7" au lieu de "72"
+PARTIAL_SCORE_RE = re.compile(r"Score global\s*:\s*(\d{1,3})\D")
+SSE_RENDER_INTERVAL = 0.25  # secondes entre deux rendus markdown intermédiaires
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+JOB_KEEPALIVE_SECONDS = 15.0
+
 
+def extract_score(analysis_md: str, pattern: re.Pattern[str] = SCORE_RE) -> int | None:
+    """Extrait le "Score global : XX/100" d'une analyse (borné à 0-100)."""
+    match = pattern.search(analysis_md)
+    if not match:
+        return None
+    try:
+        raw = int(match.group(1))
+    except ValueError:
+        return None
+    return max(0, min(raw, 100))  # clamp 0-100
+
+
+def _sse(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _markdown_event_stream(
+    chunks: AsyncIterator[str],
+    with_score: bool,
+) -> AsyncIterator[str]:
+    """
+    Convertit un flux de tokens LLM en Server-Sent Events :
+
+    - `token` : chaque morceau de texte brut
+    - `score` : le score global, dès qu'il est lisible
+    - `html` : rendu markdown intermédiaire (au plus toutes les SSE_RENDER_INTERVAL s)
+    - `done` : rendu markdown final
+    """
+    text = ""
+    score_sent = not with_score
+    last_render = time.monotonic()
 
-# Rate limiting (simple, en mémoire)
+    async for delta in chunks:
+        text += delta
+        yield _sse("token", delta)
+
+        if not score_sent:
+            score = extract_score(text, PARTIAL_SCORE_RE)
+            if score is not None:
+                score_sent = True
+                yield _sse("score", score)
+
+        now = time.monotonic()
+        if "\n" in delta and now - last_render >= SSE_RENDER_INTERVAL:
+            last_render = now
+            yield _sse("html", await render_markdown_async(text, cache=False))
+
+    if not score_sent:
+        score = extract_score(text)
+        if score is not None:
+            yield _sse("score", score)
+    yield _sse("done", await render_markdown_async(text.strip()))
+
+
+# Rate limiting (mémoire bornée par défaut, SQLite pour partager entre workers)
 rate_per_minute = settings.RATE_LIMIT_PER_MIN
 rate_burst = settings.RATE_LIMIT_BURST
+rate_limiter = create_rate_limiter(rate_per_minute, rate_burst, settings.RATE_LIMIT_BACKEND)
 app.add_middleware(
     RateLimitMiddleware,
     rate_per_minute=rate_per_minute,
     burst=rate_burst,
+    route_costs=settings.RATE_LIMIT_ROUTE_COSTS,
+    exclude_paths=settings.RATE_LIMIT_EXCLUDED_PATHS,
+    limiter=rate_limiter,
 )
 
 
+def _cache_counters(field: str):
+    """Lit un compteur dans les stats de chaque cache, au moment du scrape."""
+
+    def read():
+        caches = {
+            "llm": llm_cache.stats(),
+            "parse": parse_cache.stats(),
+            "markdown": markdown_renderer.stats(),
+        }
+        for name, stats in caches.items():
+            value = stats.get(field, 0)
+            if field == "hits":
+                value += stats.get("disk_hits", 0)
+            yield (name,), value
+
+    return read
+
+
+# Ajouté en dernier : englobe toute la pile, rejets du rate limit compris
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    registry.callback(
+        "fmp_cache_hits_total",
+        "Hits des caches (mémoire + disque).",
+        "counter",
+        ("cache",),
+        _cache_counters("hits"),
+    )
+    registry.callback(
+        "fmp_cache_misses_total",
+        "Miss des caches.",
+        "counter",
+        ("cache",),
+        _cache_counters("misses"),
+    )
+
+
 @app.get("/", response_class=HTMLResponse)
 async def landing(request: Request):
     """
@@ -74,6 +255,52 @@ async def health():
     return JSONResponse({"status": "ok"})
 
 
+def _check_internal_api_key(request: Request) -> None:
+    """
+    Endpoints de suivi réservés à l'exploitation : désactivés tant que INTERNAL_API_KEY
+    n'est pas défini. Clé dans `X-API-Key` ou `Authorization: Bearer` (scrapers Prometheus).
+    """
+    if not settings.INTERNAL_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    provided = request.headers.get("x-api-key", "")
+    authorization = request.headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        provided = authorization[7:].strip()
+    if not secrets.compare_digest(provided.encode(), settings.INTERNAL_API_KEY.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Clé API invalide.",
+        )
+
+
+@app.get("/internal/stats")
+async def internal_stats(request: Request):
+    """Compteurs internes (caches, files d'attente) pour le suivi en prod."""
+    _check_internal_api_key(request)
+    return JSONResponse(
+        {
+            "parse_cache": parse_cache.stats(),
+            "llm_cache": llm_cache.stats(),
+            "llm_http_pool": http_pool_stats(),
+            "llm_scheduler": llm_scheduler.stats(),
+            "llm_inflight": inflight_stats(),
+            "llm_resilience": llm_resilience.stats(),
+            "markdown": markdown_renderer.stats(),
+            "jobs": await job_queue.stats() if settings.JOB_MODE else None,
+            "embeddings": service.stats() if (service := get_embedding_service()) else None,
+        }
+    )
+
+
+@app.get("/metrics")
+async def metrics(request: Request):
+    """Métriques au format Prometheus : durées par étape, tokens, caches, 429, retard de l'event loop."""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    _check_internal_api_key(request)
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/app", response_class=HTMLResponse)
 async def app_index(request: Request):
     return render_template("app_index.html", request)
@@ -92,38 +319,78 @@ async def analyze(
     - retourne un résultat structuré
     """
 
-    # 1. Valider + lire le fichier CV
-    file_bytes = await validate_and_read_upload(cv_file)
+    # 1. Valider + lire le fichier CV (hashé au passage pour le cache de parsing)
+    hasher = new_file_hasher()
+    file_bytes = await validate_and_read_upload(cv_file, hasher=hasher)
 
-    # 2. Extraire le texte du CV
-    cv_text = await extract_text_from_validated_upload(cv_file, file_bytes)
+    # 2. Extraire le texte du CV (sauf s'il a déjà été parsé)
+    cv_text = await extract_text_from_validated_upload(cv_file, file_bytes, hasher.hexdigest())
 
     # 3. Nettoyer l'offre
     job_text = clean_text(job_offer)
 
+    # Version précédente (même session) : base de la ré-analyse incrémentale
+    previous_cv_text = request.session.get("cv_text")
+    previous_job_text = request.session.get("job_text")
+
     # Stocker dans la session pour utilisation ultérieure
     request.session["cv_text"] = cv_text
     request.session["job_text"] = job_text
 
+    # On affiche seulement les 800 premiers caractères de chaque texte
+    cv_excerpt = cv_text[:800] + ("…" if len(cv_text) > 800 else "")
+    job_excerpt = job_text[:800] + ("…" if len(job_text) > 800 else "")
+
+    # Score local des mots-clés : immédiat, affiché avant la réponse de l'IA.
+    # Calculé une fois, hors event loop, et réutilisé pour le prompt / le moteur local
+    skills = await asyncio.to_thread(match_skills, cv_text, job_text)
+
+    if settings.JOB_MODE:
+        job = await job_queue.submit("analyze", cv_text, job_text)
+        if _wants_json(request):
+            return _job_accepted(request, job)
+        # La page s'affiche tout de suite et interroge /jobs/{id} jusqu'au résultat
+        return render_template(
+            "result.html",
+            request,
+            {
+                "cv_excerpt": cv_excerpt,
+                "job_excerpt": job_excerpt,
+                "analysis_html": "",
+                "score": None,
+                "skills": skills,
+                "job_url": request.url_for("job_status", job_id=job.id).path,
+            },
+        )
+
+    if settings.LLM_STREAMING:
+        if settings.INCREMENTAL_ANALYSIS and previous_cv_text and previous_job_text:
+            request.session["previous_cv_text"] = previous_cv_text
+            request.session["previous_job_text"] = previous_job_text
+        # La page s'affiche tout de suite, l'analyse arrive via /analyze/stream
+        return render_template(
+            "result.html",
+            request,
+            {
+                "cv_excerpt": cv_excerpt,
+                "job_excerpt": job_excerpt,
+                "analysis_html": "",
+                "score": None,
+                "skills": skills,
+                "stream_url": request.url_for("analyze_stream").path,
+            },
+        )
+
     # 4. Appel LLM (ou mock)
-    analysis_md = await analyze_profile(cv_text, job_text)
+    analysis_md = await reanalyze_profile(
+        cv_text, job_text, previous_cv_text, previous_job_text, skills=skills
+    )
 
     # Extraction du score global (si présent dans le texte)
-    match = re.search(r"Score global\s*:\s*(\d{1,3})", analysis_md)
-    score: int | None = None
-    if match:
-        try:
-            raw = int(match.group(1))
-            score = max(0, min(raw, 100))  # clamp 0-100
-        except ValueError:
-            score = None
+    score = extract_score(analysis_md)
 
     # Convertir le markdown en HTML
-    analysis_html = markdown.markdown(analysis_md, extensions=["extra"])
-
-    # On affiche seulement les 800 premiers caractères de chaque texte
-    cv_excerpt = cv_text[:800] + ("…" if len(cv_text) > 800 else "")
-    job_excerpt = job_text[:800] + ("…" if len(job_text) > 800 else "")
+    analysis_html = await render_markdown_async(analysis_md)
 
     return render_template(
         "result.html",
@@ -133,10 +400,122 @@ async def analyze(
             "job_excerpt": job_excerpt,
             "analysis_html": analysis_html,
             "score": score,
+            "skills": skills,
         },
     )
 
 
+@app.get("/analyze/stream")
+async def analyze_stream(request: Request):
+    """Analyse en streaming (Server-Sent Events) du CV et de l'offre stockés en session."""
+    cv_text = request.session.get("cv_text")
+    job_text = request.session.get("job_text")
+    if not cv_text or not job_text:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Aucun CV ni offre en session. Relance une analyse.",
+        )
+    # Laissée par POST /analyze, une seule fois : une ré-analyse après rechargement sort du cache
+    previous_cv_text = request.session.pop("previous_cv_text", None)
+    previous_job_text = request.session.pop("previous_job_text", None)
+
+    return StreamingResponse(
+        _markdown_event_stream(
+            stream_reanalyze_profile(cv_text, job_text, previous_cv_text, previous_job_text),
+            with_score=True,
+        ),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
+    )
+
+
+@app.post("/api/analyze")
+async def api_analyze(
+    cv_file: UploadFile = File(...),
+    job_offer: str = Form(...),
+):
+    """
+    Analyse au format JSON (schéma AnalysisResult) : score, résumé, forces, faiblesses,
+    plan d'action, titres, accroches et mots-clés, sans markdown à interpréter.
+    """
+    hasher = new_file_hasher()
+    file_bytes = await validate_and_read_upload(cv_file, hasher=hasher)
+    cv_text = await extract_text_from_validated_upload(cv_file, file_bytes, hasher.hexdigest())
+    job_text = clean_text(job_offer)
+    if not cv_text or not job_text:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="CV ou offre vides : vérifie que ton fichier est lisible et que l'offre est renseignée.",
+        )
+
+    skills = await asyncio.to_thread(match_skills, cv_text, job_text)
+    try:
+        result, source = await analyze_profile_structured(cv_text, job_text, skills)
+    except (SchedulerTimeout, CircuitOpen) as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Le service IA est momentanément saturé ou indisponible. Réessaie dans quelques instants.",
+        ) from exc
+    except ValidationError as exc:
+        logger.warning("Analyse JSON non conforme au schéma (%d erreurs).", exc.error_count())
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Réponse de l'IA non conforme au format attendu.",
+        ) from exc
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Analyse JSON en échec: %s", exc)
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Une erreur est survenue lors de l'appel à l'IA.",
+        ) from exc
+
+    return JSONResponse(
+        {
+            "source": source,
+            "analysis": result.model_dump(),
+            "skills": (
+                {"score": skills.score, "matched": skills.matched, "missing": skills.missing}
+                if skills
+                else None
+            ),
+        }
+    )
+
+
+async def _render_rewrite(request: Request, cv_text: str, job_text: str):
+    # Extraits affichés UI
+    cv_excerpt = cv_text[:800] + ("…" if len(cv_text) > 800 else "")
+    job_excerpt = job_text[:800] + ("…" if len(job_text) > 800 else "")
+
+    context = {
+        "cv_excerpt": cv_excerpt,
+        "job_excerpt": job_excerpt,
+        "access_granted": True,
+        "use_fake_checkout": settings.USE_FAKE_CHECKOUT,
+    }
+
+    if settings.JOB_MODE:
+        job = await job_queue.submit("rewrite", cv_text, job_text)
+        if _wants_json(request):
+            return _job_accepted(request, job)
+        context.update(
+            {"rewrite_html": "", "job_url": request.url_for("job_status", job_id=job.id).path}
+        )
+        return render_template("pro_result.html", request, context)
+
+    if settings.LLM_STREAMING:
+        stream_url = request.url_for("pro_rewrite_stream").path
+        if request.query_params.get("paid") == "1":
+            stream_url += "?paid=1"
+        context.update({"rewrite_html": "", "stream_url": stream_url})
+        return render_template("pro_result.html", request, context)
+
+    # 🔥 Appel modèle Pro (réécriture)
+    rewrite_md = await rewrite_profile(cv_text, job_text)
+    context["rewrite_html"] = await render_markdown_async(rewrite_md)
+    return render_template("pro_result.html", request, context)
+
+
 @app.post("/pro/rewrite", response_class=HTMLResponse)
 async def pro_rewrite(
     request: Request,
@@ -164,8 +543,11 @@ async def pro_rewrite(
     # 1. Vérifier d'abord si de nouveaux fichiers sont fournis
     if cv_file and cv_file.filename:
         # Nouveau CV fourni : l'utiliser
-        file_bytes = await validate_and_read_upload(cv_file)
-        cv_text = await extract_text_from_validated_upload(cv_file, file_bytes)
+        hasher = new_file_hasher()
+        file_bytes = await validate_and_read_upload(cv_file, hasher=hasher)
+        cv_text = await extract_text_from_validated_upload(
+            cv_file, file_bytes, hasher.hexdigest()
+        )
     elif "cv_text" in request.session:
         # Pas de nouveau CV : utiliser la session si disponible
         cv_text = request.session["cv_text"]
@@ -209,24 +591,33 @@ async def pro_rewrite(
             status_code=status.HTTP_400_BAD_REQUEST,
         )
 
-    # 🔥 Appel modèle Pro (réécriture)
-    rewrite_md = await rewrite_profile(cv_text, job_text)
-    rewrite_html = markdown.markdown(rewrite_md, extensions=["extra"])
+    return await _render_rewrite(request, cv_text, job_text)
 
-    # Extraits affichés UI
-    cv_excerpt = cv_text[:800] + ("…" if len(cv_text) > 800 else "")
-    job_excerpt = job_text[:800] + ("…" if len(job_text) > 800 else "")
 
-    return render_template(
-        "pro_result.html",
-        request,
-        {
-            "cv_excerpt": cv_excerpt,
-            "job_excerpt": job_excerpt,
-            "rewrite_html": rewrite_html,
-            "access_granted": True,
-            "use_fake_checkout": settings.USE_FAKE_CHECKOUT,
-        },
+@app.get("/pro/rewrite/stream")
+async def pro_rewrite_stream(request: Request):
+    """Réécriture Pro en streaming (Server-Sent Events), à partir des données de session."""
+    access_granted = (
+        settings.USE_FAKE_CHECKOUT or request.query_params.get("paid") == "1"
+    )
+    if not access_granted:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail="Paiement requis pour la réécriture Pro.",
+        )
+
+    cv_text = request.session.get("cv_text")
+    job_text = request.session.get("job_text")
+    if not cv_text or not job_text:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Veuillez fournir un CV et une description de poste.",
+        )
+
+    return StreamingResponse(
+        _markdown_event_stream(stream_rewrite_profile(cv_text, job_text), with_score=False),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS,
     )
 
 
@@ -257,24 +648,7 @@ async def pro_rewrite_form(request: Request):
 
         if cv_text and job_text:
             # Traiter directement avec les données de session
-            rewrite_md = await rewrite_profile(cv_text, job_text)
-            rewrite_html = markdown.markdown(rewrite_md, extensions=["extra"])
-
-            # Extraits affichés UI
-            cv_excerpt = cv_text[:800] + ("…" if len(cv_text) > 800 else "")
-            job_excerpt = job_text[:800] + ("…" if len(job_text) > 800 else "")
-
-            return render_template(
-                "pro_result.html",
-                request,
-                {
-                    "cv_excerpt": cv_excerpt,
-                    "job_excerpt": job_excerpt,
-                    "rewrite_html": rewrite_html,
-                    "access_granted": True,
-                    "use_fake_checkout": settings.USE_FAKE_CHECKOUT,
-                },
-            )
+            return await _render_rewrite(request, cv_text, job_text)
 
     return render_template(
         "pro_rewrite.html",
@@ -287,6 +661,340 @@ async def pro_rewrite_form(request: Request):
     )
 
 
+def _wants_json(request: Request) -> bool:
+    return "application/json" in request.headers.get("accept", "")
+
+
+def _job_accepted(request: Request, job: Job) -> JSONResponse:
+    return JSONResponse(
+        {
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": request.url_for("job_status", job_id=job.id).path,
+            "events_url": request.url_for("job_events", job_id=job.id).path,
+        },
+        status_code=status.HTTP_202_ACCEPTED,
+    )
+
+
+async def _job_payload(job: Job) -> dict[str, Any]:
+    payload: dict[str, Any] = {"job_id": job.id, "kind": job.kind, "status": job.status}
+    if job.status == DONE and job.result is not None:
+        if job.kind == "analyze":
+            payload["score"] = extract_score(job.result)
+        payload["html"] = await render_markdown_async(job.result)
+    elif job.status == ERROR:
+        payload["error"] = "Une erreur est survenue pendant le traitement. Merci de relancer."
+    return payload
+
+
+async def _get_job_or_404(job_id: str) -> Job:
+    if not settings.JOB_MODE:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job inconnu ou expiré.")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    """État d'un job (mode JOB_MODE) : queued, running, done (avec le résultat) ou error."""
+    job = await _get_job_or_404(job_id)
+    return JSONResponse(await _job_payload(job))
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """
+    Même information que /jobs/{id}, poussée en Server-Sent Events : `status` à chaque
+    changement, puis `score` et `done` (HTML) ou `error`.
+    """
+    job = await _get_job_or_404(job_id)
+
+    async def events() -> AsyncIterator[str]:
+        current: Job | None = job
+        last_status = ""
+        while current is not None:
+            if current.status != last_status:
+                last_status = current.status
+                yield _sse("status", current.status)
+            if current.finished:
+                payload = await _job_payload(current)
+                if current.status == ERROR:
+                    yield _sse("error", payload["error"])
+                else:
+                    if payload.get("score") is not None:
+                        yield _sse("score", payload["score"])
+                    yield _sse("done", payload["html"])
+                return
+            # Commentaire SSE : garde la connexion ouverte à travers les proxies
+            yield ": keepalive\n\n"
+            current = await job_queue.wait(job_id, timeout=JOB_KEEPALIVE_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+def _check_batch_api_key(request: Request) -> None:
+    """L'API batch est réservée aux partenaires : désactivée tant que BATCH_API_KEY n'est pas défini."""
+    if not settings.BATCH_API_KEY:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    provided = request.headers.get("x-api-key", "")
+    if not secrets.compare_digest(provided.encode(), settings.BATCH_API_KEY.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Clé API invalide.",
+        )
+
+
+def _ndjson(data: dict[str, Any]) -> str:
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+
+@app.post("/api/batch/analyze")
+async def batch_analyze(
+    request: Request,
+    cv_files: list[UploadFile] = File(...),
+    job_offers: list[str] = Form(...),
+    mode: str = Form("interactive"),
+    top_k: int | None = Form(None),
+):
+    """
+    Analyse en lot : chaque CV contre chaque offre (1 CV × N offres, ou N CV × 1 offre).
+
+    - chaque CV n'est parsé qu'une fois
+    - avec l'index d'embeddings, chaque élément porte sa similarité CV / offre et les
+      couples les plus proches sont analysés en premier ; `top_k` limite l'analyse IA
+      aux k CV les plus proches de chaque offre (les autres : statut "skipped")
+    - mode "interactive" : résultats renvoyés en NDJSON au fil de l'eau, un statut par élément
+    - mode "deferred" : soumission à la Batch API du provider (moins chère, résultat
+      sous 24 h), à récupérer ensuite sur GET /api/batch/{batch_id}
+    """
+    _check_batch_api_key(request)
+
+    job_texts = [clean_text(offer) for offer in job_offers if offer and offer.strip()]
+    item_count = len(cv_files) * len(job_texts)
+    if not job_texts:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Aucune offre d'emploi fournie.",
+        )
+    if len(cv_files) > settings.BATCH_MAX_FILES or item_count > settings.BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=(
+                f"Batch trop gros : {settings.BATCH_MAX_FILES} CV "
+                f"et {settings.BATCH_MAX_ITEMS} analyses maximum par requête."
+            ),
+        )
+    if mode not in ("interactive", "deferred"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Mode inconnu (interactive ou deferred).",
+        )
+    if mode == "deferred" and not provider_batch_available():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Le mode deferred nécessite l'API OpenAI (Batch API absente chez ce provider).",
+        )
+    if top_k is not None and (top_k < 1 or get_embedding_service() is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="top_k doit être ≥ 1 et nécessite l'index d'embeddings (EMBEDDINGS_ENABLED).",
+        )
+
+    cvs = await parse_cvs(cv_files)
+    cv_summary = [
+        {"index": cv.index, "filename": cv.filename, "status": "error", "error": cv.error}
+        if cv.error
+        else {"index": cv.index, "filename": cv.filename, "status": "ok", "chars": len(cv.text)}
+        for cv in cvs
+    ]
+    ranking = await rank_pairs(cvs, job_texts)
+    selected = select_pairs(ranking, top_k) if ranking is not None and top_k else None
+
+    if mode == "deferred":
+        items = [
+            (item_id(cv.index, job_index), cv.text, job_text)
+            for cv in cvs
+            if not cv.error
+            for job_index, job_text in enumerate(job_texts)
+            if selected is None or (cv.index, job_index) in selected
+        ]
+        if not items:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Aucun CV exploitable dans ce batch.",
+            )
+        try:
+            batch_id = await submit_provider_batch(items)
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Soumission du batch provider impossible: %s", exc)
+            raise HTTPException(
+                status_code=status.HTTP_502_BAD_GATEWAY,
+                detail="Soumission du batch au provider impossible.",
+            ) from exc
+        return JSONResponse(
+            {
+                "batch_id": batch_id,
+                "status": "submitted",
+                "cvs": cv_summary,
+                "items": [item[0] for item in items],
+            },
+            status_code=status.HTTP_202_ACCEPTED,
+        )
+
+    async def results() -> AsyncIterator[str]:
+        started = time.perf_counter()
+        ok = failed = skipped = 0
+        yield _ndjson({"type": "batch", "cvs": cv_summary, "jobs": len(job_texts), "items": item_count})
+        async for item in run_batch(cvs, job_texts, settings.BATCH_CONCURRENCY, ranking, selected):
+            if item["status"] == "ok":
+                ok += 1
+                item["score"] = extract_score(item["analysis"])
+            elif item["status"] == "skipped":
+                skipped += 1
+            else:
+                failed += 1
+            yield _ndjson(item)
+        yield _ndjson(
+            {
+                "type": "done",
+                "ok": ok,
+                "failed": failed,
+                "skipped": skipped,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000),
+            }
+        )
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/api/batch/{batch_id}")
+async def batch_result(request: Request, batch_id: str):
+    """État d'un batch soumis en mode deferred, et ses résultats une fois terminé."""
+    _check_batch_api_key(request)
+    if not provider_batch_available():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+
+    try:
+        batch_status, results = await fetch_provider_batch(batch_id)
+    except Exception as exc:  # noqa: BLE001
+        logger.exception("Lecture du batch provider %s impossible: %s", batch_id, exc)
+        raise HTTPException(
+            status_code=status.HTTP_502_BAD_GATEWAY,
+            detail="Lecture du batch auprès du provider impossible.",
+        ) from exc
+
+    payload: dict[str, Any] = {"batch_id": batch_id, "status": batch_status}
+    if results is not None:
+        payload["items"] = [
+            {"id": custom_id, "status": "error"}
+            if analysis is None
+            else {
+                "id": custom_id,
+                "status": "ok",
+                "score": extract_score(analysis),
+                "analysis": analysis,
+            }
+            for custom_id, analysis in results.items()
+        ]
+    return JSONResponse(payload)
+
+
+def _embedding_service_or_404() -> EmbeddingService:
+    service = get_embedding_service()
+    if service is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return service
+
+
+def _check_k(k: int) -> int:
+    if not 1 <= k <= 1000:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="k doit être entre 1 et 1000.")
+    return k
+
+
+@app.post("/api/index/documents")
+async def index_documents(
+    request: Request,
+    cv_files: list[UploadFile] = File(default=[]),
+    job_offers: list[str] = Form(default=[]),
+):
+    """
+    Ajoute des CV (fichiers) et des offres (texte) à l'index d'embeddings, sans reconstruction.
+    L'id renvoyé est le hash du texte : un document déjà indexé n'est pas recalculé.
+    """
+    _check_batch_api_key(request)
+    service = _embedding_service_or_404()
+    if len(cv_files) + len(job_offers) > settings.BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{settings.BATCH_MAX_FILES} documents maximum par requête.",
+        )
+
+    documents: list[dict[str, Any]] = []
+    cvs = await parse_cvs(cv_files)
+    for cv in cvs:
+        if cv.error:
+            documents.append({"kind": CV, "label": cv.filename, "status": "error", "error": cv.error})
+    offers = [clean_text(offer) for offer in job_offers if offer and offer.strip()]
+    batches = {
+        CV: [(cv.filename, cv.text) for cv in cvs if not cv.error],
+        JOB: [(offer[:80], offer) for offer in offers],
+    }
+
+    for kind, items in batches.items():
+        added = await service.add(kind, items)
+        for (label, _), (document_id, new) in zip(items, added):
+            documents.append({"id": document_id, "kind": kind, "label": label, "status": "ok", "new": new})
+
+    return JSONResponse({"documents": documents, "index": service.stats()})
+
+
+@app.get("/api/index/{document_id}/matches")
+async def index_matches(request: Request, document_id: str, k: int = settings.EMBEDDINGS_TOP_K):
+    """Les k documents de l'autre type les plus proches (offres pour un CV, CV pour une offre)."""
+    _check_batch_api_key(request)
+    service = _embedding_service_or_404()
+    document = await asyncio.to_thread(service.index.document, document_id)
+    if document is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document inconnu.")
+
+    vector = await asyncio.to_thread(service.index.vector, document_id)
+    target = JOB if document.kind == CV else CV
+    matches = (await service.search(vector, _check_k(k), target))[0]
+    return JSONResponse(
+        {
+            "id": document_id,
+            "kind": document.kind,
+            "matches": [match.as_dict() for match in matches],
+        }
+    )
+
+
+@app.post("/api/index/search")
+async def index_search(
+    request: Request,
+    text: str = Form(...),
+    kind: str = Form(CV),
+    k: int = Form(settings.EMBEDDINGS_TOP_K),
+):
+    """Recherche libre : les k CV (kind=cv) ou offres (kind=job) les plus proches d'un texte."""
+    _check_batch_api_key(request)
+    service = _embedding_service_or_404()
+    if kind not in KIND_CODES:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="kind : cv ou job.")
+    text = clean_text(text)
+    if not text:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Texte vide.")
+
+    # Une offre cherche des CV, un CV cherche des offres : le texte est de l'autre type
+    vectors = await service.vectors_for(JOB if kind == CV else CV, [text])
+    matches = (await service.search(vectors, _check_k(k), kind))[0]
+    return JSONResponse({"kind": kind, "matches": [match.as_dict() for match in matches]})
+
+
 # Point d'entrée :
 # uvicorn backend.main:app --reload
 
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from xml.etree import ElementTree
+
+import markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+
+from .metrics import timed_stage
+from .settings import settings
+
+logger = logging.getLogger("fmp.markdown")
+
+EXTENSIONS = ["extra"]
+# Schémas autorisés dans les liens / images (le reste, dont javascript:, est retiré)
+SAFE_URL_RE = re.compile(r"^(?:https?:|mailto:|#|/(?!/))", re.IGNORECASE)
+URL_ATTRIBUTES = ("href", "src")
+
+
+class _SafeLinks(Treeprocessor):
+    def run(self, root: ElementTree.Element) -> None:
+        for element in root.iter():
+            for attribute in URL_ATTRIBUTES:
+                url = element.get(attribute)
+                if url is not None and not SAFE_URL_RE.match(url.strip()):
+                    del element.attrib[attribute]
+
+
+class SanitizeExtension(Extension):
+    """
+    Sanitisation pendant la conversion, sans second passage sur le HTML :
+    le HTML brut présent dans la sortie du modèle est échappé (affiché tel quel)
+    et les liens dont le schéma n'est pas sûr sont neutralisés.
+    """
+
+    def extendMarkdown(self, md: markdown.Markdown) -> None:
+        md.preprocessors.deregister("html_block", strict=False)
+        md.inlinePatterns.deregister("html", strict=False)
+        # Après l'inline (priorité 20) : les liens sont déjà des éléments <a>
+        md.treeprocessors.register(_SafeLinks(md), "safe_links", 5)
+
+
+def _build() -> markdown.Markdown:
+    return markdown.Markdown(extensions=[*EXTENSIONS, SanitizeExtension()])
+
+
+class MarkdownRenderer:
+    """
+    Rendu markdown -> HTML des réponses du modèle.
+
+    - les instances `Markdown` (registre d'extensions compris) sont construites une fois
+      puis réutilisées via `reset()` ; une instance n'est utilisée que par un thread à la fois
+    - le HTML final est mémorisé par hash du texte (LRU) : un résultat servi depuis le
+      cache LLM n'est pas re-rendu
+    """
+
+    def __init__(
+        self,
+        pool_size: int = settings.MARKDOWN_POOL_SIZE,
+        cache_entries: int = settings.MARKDOWN_CACHE_ENTRIES,
+        offload_min_chars: int | None = settings.MARKDOWN_OFFLOAD_MIN_CHARS,
+    ) -> None:
+        self.pool_size = max(pool_size, 1)
+        self.cache_entries = cache_entries
+        self.offload_min_chars = offload_min_chars
+        self._idle: list[markdown.Markdown] = []
+        self._pool_lock = threading.Lock()
+        self._cache: OrderedDict[bytes, str] = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _acquire(self) -> markdown.Markdown:
+        with self._pool_lock:
+            if self._idle:
+                return self._idle.pop()
+        return _build()
+
+    def _release(self, md: markdown.Markdown) -> None:
+        with self._pool_lock:
+            if len(self._idle) < self.pool_size:
+                self._idle.append(md)
+
+    def _convert(self, text: str) -> str:
+        md = self._acquire()
+        try:
+            return md.reset().convert(text)
+        finally:
+            self._release(md)
+
+    @timed_stage("markdown")
+    def render(self, text: str, cache: bool = True) -> str:
+        """Convertit `text` en HTML sûr. `cache=False` pour les rendus intermédiaires d'un flux."""
+        if not cache or self.cache_entries <= 0:
+            return self._convert(text)
+
+        key = hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+        with self._cache_lock:
+            html = self._cache.get(key)
+            if html is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return html
+            self.misses += 1
+
+        html = self._convert(text)
+        with self._cache_lock:
+            self._cache[key] = html
+            while len(self._cache) > self.cache_entries:
+                self._cache.popitem(last=False)
+        return html
+
+    async def render_async(self, text: str, cache: bool = True) -> str:
+        """Comme `render`, dans un thread pour les textes longs (MARKDOWN_OFFLOAD_MIN_CHARS)."""
+        if self.offload_min_chars is not None and len(text) >= self.offload_min_chars:
+            return await asyncio.to_thread(self.render, text, cache)
+        return self.render(text, cache)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._cache),
+            "idle_instances": len(self._idle),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+markdown_renderer = MarkdownRenderer()
+
+
+def render_markdown(text: str, cache: bool = True) -> str:
+    return markdown_renderer.render(text, cache)
+
+
+async def render_markdown_async(text: str, cache: bool = True) -> str:
+    return await markdown_renderer.render_async(text, cache)
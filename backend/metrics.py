@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterable, Iterator, TypeVar
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.metrics")
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Secondes : du rendu markdown (ms) à l'appel IA (dizaines de secondes)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    @abstractmethod
+    def samples(self) -> list[str]:
+        """Lignes d'échantillons au format texte Prometheus (sans HELP / TYPE)."""
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, help_text, labelnames)
+        # Sans labels, la série existe dès le départ (0 plutôt qu'absente)
+        self._values: dict[tuple[str, ...], float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = STAGE_BUCKETS,
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (compteurs par bucket, +Inf inclus ; somme)
+        self._series: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def samples(self) -> list[str]:
+        with self._lock:
+            items = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        lines: list[str] = []
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(total, 6))}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Callback(_Metric):
+    """Métrique lue à chaque scrape (compteurs déjà tenus ailleurs, ex. stats des caches)."""
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        kind: str,
+        labelnames: Iterable[str],
+        read: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+    ) -> None:
+        super().__init__(name, help_text, labelnames)
+        self.kind = kind
+        self._read = read
+
+    def samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in self._read()
+        ]
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: list[_Metric] = []
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Iterable[str] = ()) -> Gauge:
+        return self.register(Gauge(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Iterable[str] = (),
+        buckets: tuple[float, ...] = STAGE_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def callback(
+        self,
+        name: str,
+        help_text: str,
+        kind: str,
+        labelnames: Iterable[str],
+        read: Callable[[], Iterable[tuple[tuple[str, ...], float]]],
+    ) -> None:
+        self.register(_Callback(name, help_text, kind, labelnames, read))
+
+    def render(self) -> str:
+        """Toutes les métriques au format texte Prometheus (version 0.0.4)."""
+        lines: list[str] = []
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception as exc:  # noqa: BLE001 - un collecteur cassé ne doit pas vider /metrics
+                logger.warning("Métrique %s illisible: %s", metric.name, exc)
+                continue
+            lines += metric.header()
+            lines += samples
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    "fmp_stage_duration_seconds",
+    "Durée de chaque étape du traitement d'une requête.",
+    ("stage",),
+)
+http_request_seconds = registry.histogram(
+    "fmp_http_request_duration_seconds",
+    "Durée des requêtes HTTP (jusqu'à l'envoi des en-têtes).",
+    ("method", "route", "status"),
+)
+llm_tokens = registry.counter(
+    "fmp_llm_tokens_total",
+    "Tokens envoyés (in) et générés (out) par modèle.",
+    ("model", "direction"),
+)
+rate_limit_rejections = registry.counter(
+    "fmp_rate_limit_rejections_total",
+    "Requêtes refusées (429) par le rate limit.",
+)
+parse_failures = registry.counter(
+    "fmp_parse_failures_total",
+    "CV dont l'extraction de texte a échoué, par format et code HTTP.",
+    ("format", "status"),
+)
+loop_lag_seconds = registry.histogram(
+    "fmp_event_loop_lag_seconds",
+    "Retard de l'event loop (réveil d'un sleep par rapport à l'heure prévue).",
+    buckets=LAG_BUCKETS,
+)
+loop_lag_max = registry.gauge(
+    "fmp_event_loop_lag_max_seconds",
+    "Retard maximal de l'event loop sur la dernière fenêtre de mesure.",
+)
+
+# Étapes de la requête en cours (pour l'en-tête Server-Timing) : nom -> durée cumulée (s)
+_request_stages: ContextVar[dict[str, float] | None] = ContextVar("fmp_request_stages", default=None)
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    stage_seconds.observe(seconds, stage=stage)
+    stages = _request_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Chronomètre un bloc (y compris s'il lève) et l'ajoute à l'étape `stage`."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def timed_stage(stage: str) -> Callable[[F], F]:
+    """Décorateur de `timed`, pour une fonction synchrone ou une coroutine."""
+
+    def decorate(func: F) -> F:
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                with timed(stage):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with timed(stage):
+                return func(*args, **kwargs)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def record_llm_usage(model: str, tokens_in: int | None, tokens_out: int | None) -> None:
+    if tokens_in:
+        llm_tokens.inc(tokens_in, model=model, direction="in")
+    if tokens_out:
+        llm_tokens.inc(tokens_out, model=model, direction="out")
+
+
+def _server_timing(stages: dict[str, float], total: float) -> str:
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in stages.items()]
+    entries.append(f"app;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI pur : durée de chaque requête par route, et en-tête `Server-Timing`
+    avec le temps passé dans chaque étape (visible dans l'onglet réseau du navigateur).
+
+    Les étapes terminées après l'envoi des en-têtes (flux SSE, NDJSON) ne comptent
+    que dans les histogrammes.
+    """
+
+    def __init__(self, app: ASGIApp, server_timing: bool = settings.METRICS_SERVER_TIMING) -> None:
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stages: dict[str, float] = {}
+        token = _request_stages.set(stages)
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                elapsed = time.perf_counter() - started
+                route = scope.get("route")
+                http_request_seconds.observe(
+                    elapsed,
+                    method=scope["method"],
+                    # Le modèle de route ("/jobs/{job_id}") et pas le chemin : cardinalité bornée
+                    route=getattr(route, "path", "other"),
+                    status=str(message["status"]),
+                )
+                if self.server_timing:
+                    MutableHeaders(scope=message).append(
+                        "Server-Timing", _server_timing(stages, elapsed)
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stages.reset(token)
+
+
+class LoopLagMonitor:
+    """Mesure en continu le retard de l'event loop : un sleep de `interval` qui se réveille en retard."""
+
+    WINDOW = 60.0  # secondes couvertes par la jauge du retard maximal
+
+    def __init__(self, interval: float = settings.METRICS_LOOP_LAG_INTERVAL) -> None:
+        self.interval = interval
+        self._task: asyncio.Task[None] | None = None
+
+    async def _run(self) -> None:
+        window_started = time.monotonic()
+        worst = 0.0
+        while True:
+            before = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - before - self.interval, 0.0)
+            loop_lag_seconds.observe(lag)
+            worst = max(worst, lag)
+            if now - window_started >= self.WINDOW:
+                loop_lag_max.set(worst)
+                window_started, worst = now, 0.0
+            elif worst > loop_lag_max.value():
+                loop_lag_max.set(worst)
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.parse.cache")
+
+
+def make_key(digest: str, extension: str) -> str:
+    """
+    Clé de cache : hash du fichier + format + limites d'extraction
+    (un changement de PDF_MAX_PAGES / PDF_MAX_CHARS ne doit pas servir un texte tronqué autrement).
+    """
+    return f"{extension}:{settings.PDF_MAX_PAGES}:{settings.PDF_MAX_CHARS}:{digest}"
+
+
+class _DiskTier:
+    """Tier SQLite optionnel, borné en taille : les plus anciens accès sont supprimés en premier."""
+
+    TRIM_EVERY = 50  # écritures entre deux vérifications de la taille totale
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS parsed_cv ("
+                "key TEXT PRIMARY KEY, text TEXT NOT NULL, size INTEGER NOT NULL, "
+                "used_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS parsed_cv_used ON parsed_cv (used_at)")
+
+    def get(self, key: str) -> str | None:
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT text FROM parsed_cv WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE parsed_cv SET used_at = ? WHERE key = ?", (time.time(), key)
+                )
+        return row[0] if row else None
+
+    def set(self, key: str, text: str, size: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parsed_cv (key, text, size, used_at) VALUES (?, ?, ?, ?)",
+                (key, text, size, time.time()),
+            )
+            self._writes += 1
+            if self._writes % self.TRIM_EVERY == 0:
+                self._trim()
+
+    def _trim(self) -> None:
+        (total,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM parsed_cv").fetchone()
+        if total <= self.max_bytes:
+            return
+        removed = 0
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM parsed_cv ORDER BY used_at"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM parsed_cv WHERE key = ?", (key,))
+            total -= size
+            removed += 1
+        logger.debug("Cache de CV sur disque : %d entrées supprimées", removed)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ParsedCVCache:
+    """
+    Cache du texte extrait des CV, adressé par le hash du fichier.
+
+    Un même CV est souvent envoyé plusieurs fois (une fois par offre testée, puis
+    pour la réécriture Pro) : on évite de le re-parser à chaque fois.
+
+    - tier mémoire : LRU borné par la taille totale des textes
+    - tier disque (optionnel) : SQLite, interrogé en cas de miss mémoire
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = settings.PARSE_CACHE_MAX_MB * 1024 * 1024,
+        db_path: str | None = settings.PARSE_CACHE_DB_PATH,
+        disk_max_bytes: int = settings.PARSE_CACHE_DISK_MAX_MB * 1024 * 1024,
+        enabled: bool = settings.PARSE_CACHE_ENABLED,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        # clé -> (texte, taille en octets)
+        self._entries: OrderedDict[str, tuple[str, int]] = OrderedDict()
+        self._bytes = 0
+        self._disk = _DiskTier(db_path, disk_max_bytes) if (enabled and db_path) else None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # octets de fichiers dont le parsing a été évité
+        self.bytes_saved = 0
+
+    def _remember(self, key: str, text: str) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        size = len(text.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (text, size)
+        self._bytes += size
+
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    async def get(self, key: str, file_size: int) -> str | None:
+        if not self.enabled:
+            return None
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += file_size
+            return entry[0]
+
+        if self._disk is not None:
+            try:
+                text = await asyncio.to_thread(self._disk.get, key)
+            except sqlite3.Error as exc:
+                logger.warning("Lecture du cache de CV sur disque impossible: %s", exc)
+                text = None
+            if text is not None:
+                self._remember(key, text)
+                self.disk_hits += 1
+                self.bytes_saved += file_size
+                return text
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, text: str) -> None:
+        if not self.enabled:
+            return
+        self._remember(key, text)
+        if self._disk is not None:
+            try:
+                await asyncio.to_thread(self._disk.set, key, text, len(text.encode("utf-8")))
+            except sqlite3.Error as exc:
+                logger.warning("Écriture du cache de CV sur disque impossible: %s", exc)
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            "bytes_saved": self.bytes_saved,
+        }
+
+    def close(self) -> None:
+        if self._disk is not None:
+            self._disk.close()
+
+
+parse_cache = ParsedCVCache()
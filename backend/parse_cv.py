@@ -1,28 +1,59 @@
 from __future__ import annotations
 
+import asyncio
 import io
+import logging
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
 
 import fitz  # PyMuPDF
 import docx  # python-docx
 from fastapi import UploadFile, HTTPException, status
 
+from .metrics import parse_failures, timed_stage
+from .parse_cache import make_key, parse_cache
+from .parse_engine import parse_engine
+from .settings import settings
+from .upload_guard import file_digest
+
+logger = logging.getLogger("fmp.parse")
+
 
 def clean_text(text: str) -> str:
-    """Nettoyage simple : trim + normalisation des espaces."""
+    """
+    Nettoyage simple : trim + normalisation des espaces, en une seule passe.
+
+    Tous les blancs Unicode (retours ligne, tabulations, espaces insécables,
+    espaces fines…) sont remplacés par un espace unique.
+    """
     if not text:
         return ""
-    # remplacement des retours chariot multiples par un seul
-    lines = [line.strip() for line in text.splitlines()]
-    joined = " ".join(line for line in lines if line)
-    # collapse espaces multiples
-    while "  " in joined:
-        joined = joined.replace("  ", " ")
-    return joined.strip()
+    # str.split() sans argument coupe sur toute suite de blancs (str.isspace)
+    return " ".join(text.split())
 
 
-def parse_pdf_bytes(data: bytes) -> str:
-    """Extrait le texte d'un PDF (bytes) via PyMuPDF."""
+@dataclass
+class PdfExtraction:
+    """Texte extrait d'une plage de pages, avec le temps passé sur chacune."""
+
+    first_page: int
+    page_count: int
+    parts: list[str] = field(default_factory=list)
+    page_timings_ms: list[float] = field(default_factory=list)
+    budget_reached: bool = False
+
+
+def extract_pdf_pages(
+    data: bytes | bytearray | memoryview,
+    start: int = 0,
+    stop: int | None = None,
+    max_chars: int | None = None,
+) -> PdfExtraction:
+    """
+    Extrait les pages [start, stop) d'un PDF, en s'arrêtant dès que `max_chars`
+    caractères ont été lus. Le document est toujours fermé en sortie.
+    """
     try:
         doc = fitz.open(stream=data, filetype="pdf")
     except Exception as exc:  # noqa: BLE001
@@ -31,14 +62,107 @@ def parse_pdf_bytes(data: bytes) -> str:
             detail="Impossible de lire le PDF.",
         ) from exc
 
-    parts: list[str] = []
-    for page in doc:
-        parts.append(page.get_text("text") or "")
+    with doc:
+        page_count = doc.page_count
+        stop = page_count if stop is None else min(stop, page_count)
+        result = PdfExtraction(first_page=start, page_count=page_count)
+        chars = 0
+
+        for page_number in range(start, stop):
+            started = time.perf_counter()
+            text = doc.load_page(page_number).get_text("text") or ""
+            result.page_timings_ms.append((time.perf_counter() - started) * 1000)
+            result.parts.append(text)
+
+            chars += len(text)
+            if max_chars is not None and chars >= max_chars:
+                result.budget_reached = True
+                break
+
+    return result
+
+
+def _assemble_pdf(extractions: list[PdfExtraction], max_chars: int) -> str:
+    parts = [part for extraction in extractions for part in extraction.parts]
+    timings = [
+        (extraction.first_page + index + 1, ms)
+        for extraction in extractions
+        for index, ms in enumerate(extraction.page_timings_ms)
+    ]
+    total_ms = sum(ms for _, ms in timings)
+    if timings:
+        slowest_page, slowest_ms = max(timings, key=lambda item: item[1])
+        logger.log(
+            logging.INFO if total_ms >= settings.PDF_SLOW_LOG_MS else logging.DEBUG,
+            "PDF : %d/%d pages lues en %.0f ms (page la plus lente : p.%d, %.0f ms)",
+            len(timings),
+            extractions[0].page_count,
+            total_ms,
+            slowest_page,
+            slowest_ms,
+        )
+
+    return clean_text("\n".join(parts))[:max_chars]
+
+
+def parse_pdf_bytes(
+    data: bytes | bytearray | memoryview,
+    max_pages: int = settings.PDF_MAX_PAGES,
+    max_chars: int = settings.PDF_MAX_CHARS,
+) -> str:
+    """
+    Extrait le texte d'un PDF (bytes ou memoryview, sans copie) via PyMuPDF.
 
-    return clean_text("\n".join(parts))
+    Seules les `max_pages` premières pages sont lues, et la lecture s'arrête
+    dès que `max_chars` caractères ont été extraits.
+    """
+    extraction = extract_pdf_pages(data, 0, max_pages, max_chars)
+    return _assemble_pdf([extraction], max_chars)
 
 
-def parse_docx_bytes(data: bytes) -> str:
+async def parse_pdf(data: bytes | bytearray | memoryview) -> str:
+    """
+    Version asynchrone de `parse_pdf_bytes`, via le pool de `parse_engine`.
+
+    La première plage de pages est extraite seule (ce qui donne le nombre de pages) ;
+    pour un document plus long, les plages suivantes sont extraites en parallèle
+    sur plusieurs workers, chacune avec sa part du budget de caractères restant.
+    L'ensemble n'occupe qu'une place dans la file de `parse_engine`.
+    """
+    max_pages = settings.PDF_MAX_PAGES
+    max_chars = settings.PDF_MAX_CHARS
+    pages_per_job = max(settings.PDF_PAGES_PER_JOB, 1)
+
+    if parse_engine.max_workers <= 1:
+        return await parse_engine.run(parse_pdf_bytes, data, max_pages, max_chars)
+
+    with parse_engine.reserve():
+        first = await parse_engine.execute(extract_pdf_pages, data, 0, pages_per_job, max_chars)
+        extractions = [first]
+
+        last_page = min(first.page_count, max_pages)
+        if not first.budget_reached and last_page > pages_per_job:
+            # Budget restant réparti au prorata des pages de chaque plage : les plages
+            # parallèles ne lisent pas chacune tout le budget pour rien
+            remaining = max_chars - sum(len(part) for part in first.parts)
+            remaining_pages = last_page - pages_per_job
+            ranges = [
+                (start, min(start + pages_per_job, last_page))
+                for start in range(pages_per_job, last_page, pages_per_job)
+            ]
+            extractions += await asyncio.gather(
+                *(
+                    parse_engine.execute(
+                        extract_pdf_pages, data, start, stop, -(-remaining * (stop - start) // remaining_pages)
+                    )
+                    for start, stop in ranges
+                )
+            )
+
+    return _assemble_pdf(extractions, max_chars)
+
+
+def parse_docx_bytes(data: bytes | bytearray | memoryview) -> str:
     """Extrait le texte d'un DOCX (bytes) via python-docx."""
     try:
         file_obj = io.BytesIO(data)
@@ -57,23 +181,50 @@ def parse_docx_bytes(data: bytes) -> str:
     return clean_text("\n".join(parts))
 
 
-async def extract_text_from_validated_upload(
-    upload: UploadFile,
-    file_bytes: bytes,
-) -> str:
-    """
-    Choisit le parser adapté (PDF/DOCX) selon l'extension du fichier déjà validé.
+async def _parse_counting_failures(ext: str, file_bytes: bytes | memoryview) -> str:
+    try:
+        return await _parse_by_extension(ext, file_bytes)
+    except HTTPException as exc:
+        parse_failures.inc(format=ext.lstrip(".") or "inconnu", status=str(exc.status_code))
+        raise
 
-    `file_bytes` doit déjà avoir été validé par `validate_and_read_upload`.
-    """
-    ext = Path(upload.filename or "").suffix.lower()
 
+async def _parse_by_extension(ext: str, file_bytes: bytes | memoryview) -> str:
     if ext == ".pdf":
-        return parse_pdf_bytes(file_bytes)
+        return await parse_pdf(file_bytes)
     if ext == ".docx":
-        return parse_docx_bytes(file_bytes)
+        return await parse_engine.run(parse_docx_bytes, file_bytes)
 
     raise HTTPException(
         status_code=status.HTTP_400_BAD_REQUEST,
         detail="Format de fichier non supporté pour l'extraction de texte.",
     )
+
+
+@timed_stage("parse_cv")
+async def extract_text_from_validated_upload(
+    upload: UploadFile,
+    file_bytes: bytes | memoryview,
+    digest: str | None = None,
+) -> str:
+    """
+    Choisit le parser adapté (PDF/DOCX) selon l'extension du fichier déjà validé.
+
+    `file_bytes` doit déjà avoir été validé par `validate_and_read_upload`.
+    Le parsing tourne dans le pool de `parse_engine` pour ne pas bloquer l'event loop.
+    Le texte est mis en cache par hash du fichier (`digest`, calculé pendant l'upload
+    via `new_file_hasher`, sinon ici) : un CV déjà vu n'est pas re-parsé.
+    """
+    ext = Path(upload.filename or "").suffix.lower()
+    if not parse_cache.enabled:
+        return await _parse_counting_failures(ext, file_bytes)
+
+    key = make_key(digest or file_digest(file_bytes), ext)
+    text = await parse_cache.get(key, len(file_bytes))
+    if text is not None:
+        logger.debug("CV déjà parsé (%s), extraction évitée", key)
+        return text
+
+    text = await _parse_counting_failures(ext, file_bytes)
+    await parse_cache.set(key, text)
+    return text
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Iterator
+
+from fastapi import HTTPException, status
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.parse")
+
+
+class _JobError(Exception):
+    """HTTPException sérialisable, pour la faire remonter d'un worker au process principal."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _picklable(arg: Any) -> Any:
+    # memoryview ne se picke pas : on transmet le bytearray sous-jacent s'il est entier
+    if isinstance(arg, memoryview):
+        if isinstance(arg.obj, bytearray) and arg.nbytes == len(arg.obj):
+            return arg.obj
+        return arg.tobytes()
+    return arg
+
+
+def _run_job(func: Callable[..., Any], *args: Any) -> Any:
+    # HTTPException ne se picke pas (status_code obligatoire, absent de args)
+    try:
+        return func(*args)
+    except HTTPException as exc:
+        raise _JobError(exc.status_code, exc.detail) from None
+
+
+class ParsingEngine:
+    """
+    Exécute les parsers PDF/DOCX hors de l'event loop, dans un pool de processus.
+
+    - max_workers : taille du pool (0 = exécution dans un thread, sans pool)
+    - timeout : durée max d'un job (secondes)
+    - max_queue : nombre de jobs en attente tolérés en plus des workers (503 au-delà)
+    - max_jobs_per_worker : un worker est recyclé après N jobs (mémoire bornée)
+    """
+
+    def __init__(
+        self,
+        max_workers: int = settings.PARSE_WORKERS,
+        timeout: float = settings.PARSE_TIMEOUT_SECONDS,
+        max_queue: int = settings.PARSE_MAX_QUEUE,
+        max_jobs_per_worker: int = settings.PARSE_MAX_JOBS_PER_WORKER,
+    ) -> None:
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self._executor: ProcessPoolExecutor | None = None
+        self._inflight = 0
+        # Jobs lancés sur chaque pool, et pools écartés (worker bloqué) en attente d'arrêt
+        self._jobs: dict[ProcessPoolExecutor, set[asyncio.Future[Any]]] = {}
+        self._retiring: dict[ProcessPoolExecutor, asyncio.Task[None]] = {}
+
+    @property
+    def capacity(self) -> int:
+        return max(self.max_workers, 1) + self.max_queue
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # "spawn" : requis par max_tasks_per_child, et évite de forker
+            # un process uvicorn qui a déjà des threads / sockets ouverts.
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                max_tasks_per_child=self.max_jobs_per_worker or None,
+            )
+            logger.info(
+                "Pool de parsing démarré (%d workers, recyclage tous les %d jobs)",
+                self.max_workers,
+                self.max_jobs_per_worker,
+            )
+        return self._executor
+
+    def _terminate(self, executor: ProcessPoolExecutor) -> None:
+        self._jobs.pop(executor, None)
+        terminate = getattr(executor, "terminate_workers", None)  # Python >= 3.14
+        if terminate is not None:
+            terminate()
+        else:
+            for process in list((getattr(executor, "_processes", None) or {}).values()):
+                process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _recycle(self) -> None:
+        """Tue le pool courant (cassé) ; le suivant sera recréé à la demande."""
+        executor = self._executor
+        self._executor = None
+        if executor is not None:
+            self._terminate(executor)
+
+    def _retire(self, executor: ProcessPoolExecutor) -> None:
+        """
+        Écarte un pool dont un worker est bloqué : les nouveaux jobs partent sur un pool neuf,
+        ceux déjà lancés sur l'ancien (autres utilisateurs) vont au bout ou à leur propre
+        timeout, puis l'ancien pool est tué avec le worker bloqué.
+        """
+        if self._executor is executor:
+            self._executor = None
+        if executor in self._retiring:
+            return
+        others = [job for job in self._jobs.get(executor, ()) if not job.done()]
+        logger.warning(
+            "Pool de parsing écarté : %d autre(s) job(s) en cours, arrêt du pool après eux.",
+            len(others),
+        )
+        if not others:
+            self._terminate(executor)
+            return
+        self._retiring[executor] = asyncio.get_running_loop().create_task(
+            self._terminate_after(executor, others)
+        )
+
+    async def _terminate_after(self, executor: ProcessPoolExecutor, jobs: list[asyncio.Future[Any]]) -> None:
+        try:
+            # Chaque job a son propre timeout : borne de sécurité seulement
+            _, still_running = await asyncio.wait(jobs, timeout=self.timeout)
+            if still_running:
+                logger.warning(
+                    "Arrêt du pool de parsing écarté avec %d job(s) encore en cours.", len(still_running)
+                )
+        finally:
+            self._retiring.pop(executor, None)
+            self._terminate(executor)
+
+    async def _run_on(self, executor: ProcessPoolExecutor, func: Callable[..., Any], *args: Any) -> Any:
+        job = asyncio.get_running_loop().run_in_executor(executor, _run_job, func, *args)
+        jobs = self._jobs.setdefault(executor, set())
+        jobs.add(job)
+        job.add_done_callback(jobs.discard)
+        return await job
+
+    async def _submit(
+        self, func: Callable[..., Any], *args: Any, used: list[ProcessPoolExecutor]
+    ) -> Any:
+        """`used` reçoit le pool qui exécute le job, pour écarter celui-là en cas de timeout."""
+        if self.max_workers <= 0:
+            return await asyncio.to_thread(func, *args)
+
+        executor = self._get_executor()
+        used.append(executor)
+        args = tuple(_picklable(arg) for arg in args)
+        try:
+            try:
+                return await self._run_on(executor, func, *args)
+            except BrokenProcessPool:
+                # Worker crashé (ou pool tué) : on relance une seule fois sur un pool neuf.
+                if self._executor is executor:
+                    self._recycle()
+                logger.warning("Pool de parsing cassé, nouvelle tentative sur un pool neuf.")
+                executor = self._get_executor()
+                used.append(executor)
+                return await self._run_on(executor, func, *args)
+        except _JobError as exc:
+            raise HTTPException(status_code=exc.status_code, detail=exc.detail) from None
+
+    @contextmanager
+    def reserve(self) -> Iterator[None]:
+        """
+        Réserve une place dans la file pour une requête, le temps du bloc.
+        Lève HTTPException 503 si la file est pleine.
+        """
+        if self._inflight >= self.capacity:
+            logger.warning(
+                "File de parsing pleine (%d jobs en cours), requête refusée.",
+                self._inflight,
+            )
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Serveur très sollicité. Merci de réessayer dans quelques instants.",
+            )
+
+        self._inflight += 1
+        try:
+            yield
+        finally:
+            self._inflight -= 1
+
+    async def execute(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Exécute `func(*args)` dans le pool, dans une place déjà réservée (`reserve`) :
+        une requête découpée en plusieurs jobs (plages de pages d'un PDF) n'occupe
+        qu'une place. Lève HTTPException 504 si le job dépasse le timeout ; seul le pool
+        qui l'exécute est écarté, sans interrompre les jobs des autres requêtes.
+        """
+        used: list[ProcessPoolExecutor] = []
+        try:
+            return await asyncio.wait_for(self._submit(func, *args, used=used), timeout=self.timeout)
+        except asyncio.TimeoutError as exc:
+            logger.warning(
+                "Parsing interrompu après %.1fs (%s), worker bloqué.",
+                self.timeout,
+                getattr(func, "__name__", func),
+            )
+            if used:
+                self._retire(used[-1])
+            raise HTTPException(
+                status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+                detail="La lecture du fichier a pris trop de temps. Essaie avec un fichier plus léger.",
+            ) from exc
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Exécute `func(*args)` dans le pool et renvoie son résultat.
+
+        Lève HTTPException 503 si la file est pleine, 504 si le job dépasse le timeout.
+        Les HTTPException levées par `func` sont propagées telles quelles.
+        """
+        with self.reserve():
+            return await self.execute(func, *args)
+
+    def shutdown(self) -> None:
+        for executor, task in list(self._retiring.items()):
+            task.cancel()
+            self._terminate(executor)
+        self._retiring.clear()
+        executor = self._executor
+        self._executor = None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+parse_engine = ParsingEngine()
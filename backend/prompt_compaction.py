@@ -0,0 +1,303 @@
+from __future__ import annotations
+
+import logging
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.llm.prompt")
+
+# Le texte extrait (clean_text) tient sur une seule ligne : on découpe en phrases / puces
+SEGMENT_RE = re.compile(r"(?<=[.!?;])\s+|\s+(?=[•▪●◦■►✓]\s*)|\s+\|\s+")
+# Titres de sections usuels d'un CV, en capitales (tel qu'ils sortent des PDF) ou en début de segment
+HEADING_WORDS = (
+    r"exp[ée]riences?(?: professionnelles?)?|parcours(?: professionnel)?|formations?|"
+    r"[ée]ducation|dipl[ôo]mes?|comp[ée]tences?(?: techniques| cl[ée]s)?|skills|"
+    r"langues|languages|projets?|projects|certifications?|centres? d'int[ée]r[êe]ts?|"
+    r"loisirs|int[ée]r[êe]ts|profil|r[ée]sum[ée]|summary|experience|r[ée]alisations"
+)
+HEADING_RE = re.compile(rf"\b(?:{HEADING_WORDS})\b", re.IGNORECASE)
+PAGE_MARK_RE = re.compile(r"^(?:page\s*)?\d+\s*(?:/|sur|of)\s*\d+$", re.IGNORECASE)
+WORD_RE = re.compile(r"[a-z0-9+#]+(?:[.\-][a-z0-9+#]+)*")
+DIGITS_RE = re.compile(r"\d+")
+
+# Segments plus longs que ça ne sont pas considérés comme du "boilerplate" répété
+BOILERPLATE_MAX_CHARS = 200
+# Un en-tête / pied de page revient sur chaque page : en dessous, une répétition est du contenu
+BOILERPLATE_MIN_REPEATS = 3
+# Taille cible d'un bloc quand un CV n'a pas de titres de sections exploitables
+CHUNK_TOKENS = 200
+
+STOPWORDS = frozenset(
+    """
+    les des une est pour par sur dans avec aux qui que quoi dont sont ses son sa leur leurs
+    nous vous ils elles cette ces ceux plus moins tres tout tous toute toutes etre avoir fait
+    faire comme mais donc car ainsi afin entre chez sans sous vers ete etait the and for with
+    you your our are from that this will have has not all any can into over who what
+    """.split()
+)
+
+
+class _FoldTable(dict):
+    """Table pour `str.translate`, remplie à la demande : caractère -> forme sans accent."""
+
+    def __missing__(self, codepoint: int) -> str:
+        decomposed = unicodedata.normalize("NFKD", chr(codepoint))
+        folded = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        self[codepoint] = folded
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def fold(text: str) -> str:
+    """Minuscules sans accents, pour comparer des mots indépendamment de la typographie."""
+    text = text.lower()
+    # Décomposition caractère par caractère (mise en cache) : bien plus rapide qu'un NFKD
+    # suivi d'un filtre Python sur chaque caractère, pour le même résultat
+    return text if text.isascii() else text.translate(_FOLD_TABLE)
+
+
+def terms(text: str) -> list[str]:
+    """Mots significatifs (normalisés) d'un texte, dans l'ordre."""
+    return [
+        word
+        for word in WORD_RE.findall(fold(text))
+        if len(word) >= 3 and word not in STOPWORDS
+    ]
+
+
+@lru_cache(maxsize=8)
+def _tiktoken_counter(model: str) -> Callable[[str], int] | None:
+    try:
+        import tiktoken  # type: ignore
+    except ImportError:
+        return None
+    try:
+        try:
+            encoding = tiktoken.encoding_for_model(model.split("/")[-1])
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+    except Exception as exc:  # noqa: BLE001 - téléchargement des tables BPE impossible, etc.
+        logger.warning("tiktoken indisponible (%s), estimation à 4 caractères par token.", exc)
+        return None
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+def count_tokens(text: str, model: str = "gpt-4o-mini") -> int:
+    """Nombre de tokens du texte : tiktoken s'il est installé, sinon ≈ 4 caractères par token."""
+    counter = _tiktoken_counter(model)
+    if counter is None:
+        return (len(text) + 3) // 4
+    return counter(text)
+
+
+def split_segments(text: str) -> list[str]:
+    """Phrases / puces du texte, avec une coupure supplémentaire avant chaque titre en capitales."""
+    segments: list[str] = []
+    for segment in SEGMENT_RE.split(text):
+        if not segment or not segment.strip():
+            continue
+        start = 0
+        for match in HEADING_RE.finditer(segment):
+            if match.start() > start and match.group(0).isupper():
+                segments.append(segment[start : match.start()].rstrip())
+                start = match.start()
+        segments.append(segment[start:])
+    return segments
+
+
+def _boilerplate_signature(segment: str) -> str | None:
+    if len(segment) > BOILERPLATE_MAX_CHARS:
+        return None
+    signature = fold(segment)
+    if "page" in signature:
+        signature = DIGITS_RE.sub("#", signature)
+    return signature
+
+
+def dedupe_segments(segments: list[str]) -> list[str]:
+    """
+    Supprime les en-têtes / pieds de page répétés et les marqueurs "2/3" : un segment
+    court présent au moins `BOILERPLATE_MIN_REPEATS` fois (à la casse près, et au numéro
+    près pour les mentions "page") n'est gardé qu'une fois. Une phrase répétée deux fois
+    (même tâche dans deux expériences) est du contenu : elle reste.
+    """
+    signatures = [_boilerplate_signature(segment.strip()) for segment in segments]
+    repeats = Counter(signature for signature in signatures if signature is not None)
+    seen: set[str] = set()
+    kept: list[str] = []
+    for segment, signature in zip(segments, signatures):
+        if PAGE_MARK_RE.match(segment.strip()):
+            continue
+        if signature is not None and repeats[signature] >= BOILERPLATE_MIN_REPEATS:
+            if signature in seen:
+                continue
+            seen.add(signature)
+        kept.append(segment)
+    return kept
+
+
+def _is_heading(segment: str) -> bool:
+    match = HEADING_RE.match(segment.strip())
+    return match is not None and (match.group(0).isupper() or match.group(0)[0].isupper())
+
+
+@dataclass
+class _Section:
+    index: int
+    text: str
+    tokens: int
+    score: float = 0.0
+
+
+def split_sections(segments: list[str], model: str) -> list[_Section]:
+    """Regroupe les segments en sections (sur les titres du CV, sinon par blocs de taille fixe)."""
+    sections: list[_Section] = []
+    current: list[str] = []
+    current_tokens = 0
+
+    def flush() -> None:
+        nonlocal current, current_tokens
+        if current:
+            sections.append(_Section(len(sections), " ".join(current), current_tokens))
+        current, current_tokens = [], 0
+
+    for segment in segments:
+        tokens = count_tokens(segment, model)
+        if current and (_is_heading(segment) or current_tokens + tokens > 2 * CHUNK_TOKENS):
+            flush()
+        current.append(segment)
+        current_tokens += tokens
+    flush()
+    return sections
+
+
+def rank_sections(sections: list[_Section], job_text: str) -> None:
+    """Score lexical (type TF-IDF) de chaque section par rapport aux mots de l'offre."""
+    job_terms = set(terms(job_text))
+    if not job_terms or not sections:
+        return
+
+    section_terms = [Counter(terms(section.text)) for section in sections]
+    document_frequency: Counter[str] = Counter()
+    for counts in section_terms:
+        document_frequency.update(term for term in counts if term in job_terms)
+
+    total = len(sections)
+    for section, counts in zip(sections, section_terms):
+        score = 0.0
+        for term, frequency in counts.items():
+            if term in job_terms:
+                idf = math.log(1 + total / document_frequency[term])
+                score += (1 + math.log(frequency)) * idf
+        section.score = score / math.sqrt(max(section.tokens, 1))
+
+
+def _cut_to_budget(segment: str, budget: int, model: str) -> str:
+    """Début du segment tenant dans `budget` tokens, coupé sur un espace si possible."""
+    tokens = count_tokens(segment, model)
+    if tokens <= budget:
+        return segment
+    # Estimation au prorata des tokens, puis réduction jusqu'à tenir dans le budget
+    cut = segment[: max(len(segment) * budget // max(tokens, 1), 1)]
+    while len(cut) > 1 and count_tokens(cut, model) > budget:
+        cut = cut[: max(len(cut) * 9 // 10, 1)]
+    head, space, _ = cut.rpartition(" ")
+    return head if space and len(head) >= len(cut) // 2 else cut
+
+
+def _trim_in_order(segments: list[str], budget: int, model: str) -> str:
+    """
+    Garde les segments dans l'ordre jusqu'au budget ; celui qui le dépasse est coupé au
+    lieu d'être abandonné. Un texte sans ponctuation (un seul segment géant) donne donc
+    son début, jamais une chaîne vide.
+    """
+    kept: list[str] = []
+    used = 0
+    for segment in segments:
+        tokens = count_tokens(segment, model)
+        if used + tokens > budget:
+            remaining = budget - used
+            if remaining > 0 or not kept:
+                kept.append(_cut_to_budget(segment, max(remaining, 1), model))
+            break
+        kept.append(segment)
+        used += tokens
+    return " ".join(kept)
+
+
+def compact_cv(cv_text: str, job_text: str, budget: int, model: str) -> str:
+    """
+    Réduit le CV à `budget` tokens : le début (identité, titre, accroche) est toujours
+    gardé, puis les sections les plus proches de l'offre, restituées dans l'ordre d'origine.
+    """
+    segments = dedupe_segments(split_segments(cv_text))
+    text = " ".join(segments)
+    if count_tokens(text, model) <= budget:
+        return text
+
+    sections = split_sections(segments, model)
+    rank_sections(sections, job_text)
+
+    chosen = {0} if sections[0].tokens <= budget else set()
+    used = sections[0].tokens if chosen else 0
+    for section in sorted(sections[1:], key=lambda item: item.score, reverse=True):
+        if used + section.tokens <= budget:
+            chosen.add(section.index)
+            used += section.tokens
+
+    if not chosen:
+        # Une seule section géante : on coupe simplement à la fin du budget
+        return _trim_in_order(segments, budget, model)
+    return " ".join(section.text for section in sections if section.index in chosen)
+
+
+def token_budget(model: str) -> int:
+    return settings.PROMPT_TOKEN_BUDGETS.get(model, settings.PROMPT_DEFAULT_TOKEN_BUDGET)
+
+
+def compact_inputs(cv_text: str, job_text: str, model: str, kind: str = "analyze") -> tuple[str, str]:
+    """
+    Prépare CV + offre pour le prompt : suppression des répétitions, puis, si le tout
+    dépasse le budget du modèle, sélection des passages les plus pertinents.
+    """
+    if not settings.PROMPT_COMPACTION:
+        return cv_text, job_text
+
+    budget = token_budget(model)
+    cv_before = count_tokens(cv_text, model)
+    job_before = count_tokens(job_text, model)
+
+    # L'offre garde au plus sa part du budget ; le CV prend tout le reste
+    job_segments = dedupe_segments(split_segments(job_text))
+    job_budget = int(budget * settings.PROMPT_JOB_SHARE)
+    compacted_job = " ".join(job_segments)
+    if count_tokens(compacted_job, model) > job_budget:
+        compacted_job = _trim_in_order(job_segments, job_budget, model)
+    job_after = count_tokens(compacted_job, model)
+
+    compacted_cv = compact_cv(cv_text, compacted_job, budget - job_after, model)
+    cv_after = count_tokens(compacted_cv, model)
+
+    logger.log(
+        logging.INFO if cv_after + job_after < cv_before + job_before else logging.DEBUG,
+        "Prompt %s (%s) : %d → %d tokens (CV %d → %d, offre %d → %d, budget %d)",
+        kind,
+        model,
+        cv_before + job_before,
+        cv_after + job_after,
+        cv_before,
+        cv_after,
+        job_before,
+        job_after,
+        budget,
+    )
+    return compacted_cv, compacted_job
@@ -1,73 +1,275 @@
 from __future__ import annotations
 
+import asyncio
+import math
+import sqlite3
+import threading
 import time
-from typing import Dict
+from collections import OrderedDict
+from typing import Iterable, Mapping
 
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-from starlette.responses import Response, PlainTextResponse
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
 
+from .metrics import rate_limit_rejections
 from .settings import settings
 
 
 class TokenBucket:
-    def __init__(self, rate_per_minute: int, burst: int) -> None:
-        self.capacity = burst
-        self.tokens = burst
-        self.refill_rate_per_sec = rate_per_minute / 60.0
-        self.last_refill = time.monotonic()
+    """
+    Bucket minimal : la capacité et le débit sont portés par le limiter,
+    seuls l'état (jetons restants, dernier refill) sont stockés par client.
+    """
 
-    def allow(self) -> bool:
-        now = time.monotonic()
+    __slots__ = ("tokens", "last_refill")
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.last_refill = now
+
+    def allow(self, cost: float, capacity: float, refill_rate_per_sec: float, now: float) -> bool:
         elapsed = now - self.last_refill
         self.last_refill = now
 
         # refill tokens
-        self.tokens = min(
-            self.capacity,
-            self.tokens + elapsed * self.refill_rate_per_sec,
-        )
+        self.tokens = min(capacity, self.tokens + elapsed * refill_rate_per_sec)
 
-        if self.tokens >= 1.0:
-            self.tokens -= 1.0
+        if self.tokens >= cost:
+            self.tokens -= cost
             return True
 
         return False
 
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
+class MemoryRateLimiter:
     """
-    Rate limit ultra simple par IP (token bucket en mémoire).
+    Token buckets par client, en mémoire, avec un nombre de clients borné.
+
+    - les clients sont répartis sur `shards` LRU (OrderedDict) indépendants
+    - un bucket inactif depuis `burst / débit` secondes est plein : on peut l'oublier
+      sans rien changer au comportement (éviction "gratuite" des IP de passage)
+    - au-delà de `max_clients`, les buckets les moins récemment vus sont évincés
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: int,
+        burst: int,
+        max_clients: int = settings.RATE_LIMIT_MAX_CLIENTS,
+        shards: int = settings.RATE_LIMIT_SHARDS,
+    ) -> None:
+        self.capacity = float(burst)
+        self.refill_rate_per_sec = rate_per_minute / 60.0
+        # Sans recharge (RATE_LIMIT_PER_MIN=0), un seau vidé ne redevient jamais plein
+        self.idle_seconds = (
+            self.capacity / self.refill_rate_per_sec if self.refill_rate_per_sec > 0 else math.inf
+        )
+        self._shards: list[OrderedDict[str, TokenBucket]] = [
+            OrderedDict() for _ in range(max(shards, 1))
+        ]
+        self._shard_capacity = max(math.ceil(max_clients / len(self._shards)), 1)
+
+    def __len__(self) -> int:
+        return sum(len(shard) for shard in self._shards)
+
+    def _evict(self, shard: OrderedDict[str, TokenBucket], now: float) -> None:
+        # L'ordre LRU est aussi l'ordre de dernière activité : on ne regarde que la tête
+        while shard:
+            bucket = next(iter(shard.values()))
+            if len(shard) > self._shard_capacity or now - bucket.last_refill >= self.idle_seconds:
+                shard.popitem(last=False)
+            else:
+                break
+
+    def allow_sync(self, key: str, cost: float = 1.0) -> bool:
+        shard = self._shards[hash(key) % len(self._shards)]
+        now = time.monotonic()
+
+        bucket = shard.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.capacity, now)
+            shard[key] = bucket
+        else:
+            shard.move_to_end(key)
+
+        allowed = bucket.allow(cost, self.capacity, self.refill_rate_per_sec, now)
+        self._evict(shard, now)
+        return allowed
+
+    async def allow(self, key: str, cost: float = 1.0) -> bool:
+        return self.allow_sync(key, cost)
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteRateLimiter:
+    """
+    Token buckets partagés entre plusieurs workers uvicorn via un fichier SQLite.
+
+    Même algorithme que `MemoryRateLimiter`, sur une horloge murale (time.time)
+    commune aux process. Les buckets inactifs sont purgés périodiquement.
+    """
+
+    PURGE_EVERY = 1000  # nombre de requêtes entre deux purges
 
-    - rate_per_minute: nombre de requêtes par minute
+    def __init__(
+        self,
+        rate_per_minute: int,
+        burst: int,
+        path: str = settings.RATE_LIMIT_DB_PATH,
+        max_clients: int = settings.RATE_LIMIT_MAX_CLIENTS,
+    ) -> None:
+        self.capacity = float(burst)
+        self.refill_rate_per_sec = rate_per_minute / 60.0
+        # Sans recharge (RATE_LIMIT_PER_MIN=0), un seau vidé ne redevient jamais plein
+        self.idle_seconds = (
+            self.capacity / self.refill_rate_per_sec if self.refill_rate_per_sec > 0 else math.inf
+        )
+        self.max_clients = max_clients
+        self._calls = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=5.0
+        )
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, last_refill REAL NOT NULL)"
+            )
+
+    def _purge(self, now: float) -> None:
+        self._conn.execute(
+            "DELETE FROM buckets WHERE last_refill < ?", (now - self.idle_seconds,)
+        )
+        self._conn.execute(
+            "DELETE FROM buckets WHERE key IN ("
+            "SELECT key FROM buckets ORDER BY last_refill DESC LIMIT -1 OFFSET ?)",
+            (self.max_clients,),
+        )
+
+    def allow_sync(self, key: str, cost: float = 1.0) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, last_refill FROM buckets WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    bucket = TokenBucket(self.capacity, now)
+                else:
+                    bucket = TokenBucket(row[0], row[1])
+                allowed = bucket.allow(cost, self.capacity, self.refill_rate_per_sec, now)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (key, tokens, last_refill) VALUES (?, ?, ?)",
+                    (key, bucket.tokens, bucket.last_refill),
+                )
+                self._calls += 1
+                if self._calls % self.PURGE_EVERY == 0:
+                    self._purge(now)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return allowed
+
+    async def allow(self, key: str, cost: float = 1.0) -> bool:
+        return await asyncio.to_thread(self.allow_sync, key, cost)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+RateLimiter = MemoryRateLimiter | SqliteRateLimiter
+
+
+def create_rate_limiter(
+    rate_per_minute: int = settings.RATE_LIMIT_PER_MIN,
+    burst: int = settings.RATE_LIMIT_BURST,
+    backend: str = settings.RATE_LIMIT_BACKEND,
+) -> RateLimiter:
+    backend = backend.lower()
+    if backend == "memory":
+        return MemoryRateLimiter(rate_per_minute, burst)
+    if backend == "sqlite":
+        return SqliteRateLimiter(rate_per_minute, burst)
+    raise ValueError(f"RATE_LIMIT_BACKEND inconnu : {backend}")
+
+
+def route_cost(path: str, route_costs: Mapping[str, float], method: str = "") -> float:
+    """
+    Coût d'une requête : préfixe le plus long de `route_costs`, 1 par défaut.
+    Une clé peut viser une seule méthode ("GET /pro/rewrite") ; à préfixe égal,
+    elle l'emporte sur la clé sans méthode.
+    """
+    best = (-1, False)
+    cost = 1.0
+    for key, key_cost in route_costs.items():
+        key_method, _, prefix = key.rpartition(" ")
+        if key_method and key_method.upper() != method.upper():
+            continue
+        rank = (len(prefix), bool(key_method))
+        if path.startswith(prefix) and rank > best:
+            best = rank
+            cost = key_cost
+    return cost
+
+
+class RateLimitMiddleware:
+    """
+    Rate limit par IP (token bucket), en middleware ASGI pur.
+
+    Pas de BaseHTTPMiddleware : ni tâche ni memory stream supplémentaires par requête,
+    la réponse de l'app est transmise telle quelle.
+
+    - rate_per_minute: nombre de jetons rechargés par minute
     - burst: capacité max de rafale
+    - route_costs: coût en jetons par préfixe d'URL, éventuellement par méthode (0 = pas de limite)
+    - exclude_paths: préfixes jamais limités (ni même comptés)
+    - limiter: stockage des buckets (mémoire borné par défaut, ou SQLite partagé)
     """
 
     def __init__(
         self,
-        app,
+        app: ASGIApp,
         rate_per_minute: int = settings.RATE_LIMIT_PER_MIN,
         burst: int = settings.RATE_LIMIT_BURST,
+        route_costs: Mapping[str, float] | None = None,
+        exclude_paths: Iterable[str] | None = None,
+        limiter: RateLimiter | None = None,
     ) -> None:
-        super().__init__(app)
+        self.app = app
         self.rate_per_minute = rate_per_minute
         self.burst = burst
-        self.buckets: Dict[str, TokenBucket] = {}
+        self.route_costs = dict(
+            settings.RATE_LIMIT_ROUTE_COSTS if route_costs is None else route_costs
+        )
+        self.exclude_paths = tuple(
+            settings.RATE_LIMIT_EXCLUDED_PATHS if exclude_paths is None else exclude_paths
+        )
+        self.limiter = limiter or MemoryRateLimiter(rate_per_minute, burst)
 
-    async def dispatch(self, request: Request, call_next):
-        client_ip = request.client.host if request.client else "unknown"
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
 
-        bucket = self.buckets.get(client_ip)
-        if bucket is None:
-            bucket = TokenBucket(self.rate_per_minute, self.burst)
-            self.buckets[client_ip] = bucket
-
-        if not bucket.allow():
-            # Trop de requêtes
-            return PlainTextResponse(
-                "Trop de requêtes. Merci de réessayer dans quelques instants.",
-                status_code=429,
-            )
+        path: str = scope["path"]
+        cost = 0.0 if path.startswith(self.exclude_paths) else route_cost(path, self.route_costs, scope["method"])
+        if cost > 0:
+            client = scope.get("client")
+            client_ip = client[0] if client else "unknown"
+            if not await self.limiter.allow(client_ip, cost):
+                rate_limit_rejections.inc()
+                # Trop de requêtes
+                response = PlainTextResponse(
+                    "Trop de requêtes. Merci de réessayer dans quelques instants.",
+                    status_code=429,
+                )
+                await response(scope, receive, send)
+                return
 
-        response: Response = await call_next(request)
-        return response
+        await self.app(scope, receive, send)
@@ -0,0 +1,379 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import secrets
+import sqlite3
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any
+
+import itsdangerous
+from itsdangerous.exc import BadSignature
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .settings import settings
+
+logger = logging.getLogger("fmp.session")
+
+# En dessous de cette taille, une valeur reste dans l'enregistrement de session.
+# Au-dessus (CV, offre), elle est compressée et stockée une seule fois par hash.
+BLOB_MIN_CHARS = 256
+BLOB_REF = "__blob__"
+# Une session lue est prolongée (expiration + cookie) au plus une fois par intervalle
+TOUCH_INTERVAL_SECONDS = 3600
+
+
+def _blob_hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def _compress(value: str) -> bytes:
+    return zlib.compress(value.encode("utf-8"), 6)
+
+
+def _decompress(data: bytes) -> str:
+    return zlib.decompress(data).decode("utf-8")
+
+
+def _is_blob_candidate(value: Any) -> bool:
+    return isinstance(value, str) and len(value) >= BLOB_MIN_CHARS
+
+
+class SessionBackend(ABC):
+    """Interface d'un stockage de sessions côté serveur (le cookie ne contient que l'id)."""
+
+    @abstractmethod
+    async def load(self, sid: str) -> dict[str, Any] | None: ...
+
+    @abstractmethod
+    async def save(self, sid: str, data: dict[str, Any]) -> None: ...
+
+    @abstractmethod
+    async def delete(self, sid: str) -> None: ...
+
+    @abstractmethod
+    async def touch(self, sid: str) -> None:
+        """Repousse l'expiration d'une session simplement lue (expiration glissante)."""
+
+    def close(self) -> None:
+        pass
+
+
+class MemorySessionBackend(SessionBackend):
+    """
+    Sessions en mémoire : LRU borné + TTL.
+
+    Les grosses valeurs sont partagées entre sessions (compteur de références),
+    donc un même CV soumis depuis plusieurs onglets n'est stocké qu'une fois.
+    Ne convient qu'à un seul worker uvicorn.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = settings.SESSION_MAX_ENTRIES,
+        ttl_seconds: int = settings.SESSION_TTL_SECONDS,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions: OrderedDict[str, tuple[float, dict[str, Any]]] = OrderedDict()
+        # hash -> [données compressées, nombre de sessions qui y font référence]
+        self._blobs: dict[str, list[Any]] = {}
+
+    def _release(self, sid: str) -> None:
+        entry = self._sessions.pop(sid, None)
+        if entry is None:
+            return
+        for value in entry[1].values():
+            if isinstance(value, dict) and BLOB_REF in value:
+                blob = self._blobs.get(value[BLOB_REF])
+                if blob is None:
+                    continue
+                blob[1] -= 1
+                if blob[1] <= 0:
+                    del self._blobs[value[BLOB_REF]]
+
+    async def load(self, sid: str) -> dict[str, Any] | None:
+        entry = self._sessions.get(sid)
+        if entry is None:
+            return None
+        expires_at, packed = entry
+        if expires_at < time.monotonic():
+            self._release(sid)
+            return None
+        self._sessions.move_to_end(sid)
+
+        data: dict[str, Any] = {}
+        for key, value in packed.items():
+            if isinstance(value, dict) and BLOB_REF in value:
+                data[key] = _decompress(self._blobs[value[BLOB_REF]][0])
+            else:
+                data[key] = value
+        return data
+
+    async def save(self, sid: str, data: dict[str, Any]) -> None:
+        packed: dict[str, Any] = {}
+        for key, value in data.items():
+            if _is_blob_candidate(value):
+                digest = _blob_hash(value)
+                blob = self._blobs.get(digest)
+                if blob is None:
+                    blob = self._blobs[digest] = [_compress(value), 0]
+                blob[1] += 1
+                packed[key] = {BLOB_REF: digest}
+            else:
+                packed[key] = value
+
+        # Les nouvelles références sont prises avant de libérer les anciennes
+        self._release(sid)
+        self._sessions[sid] = (time.monotonic() + self.ttl_seconds, packed)
+
+        while len(self._sessions) > self.max_sessions:
+            oldest = next(iter(self._sessions))
+            self._release(oldest)
+
+    async def delete(self, sid: str) -> None:
+        self._release(sid)
+
+    async def touch(self, sid: str) -> None:
+        entry = self._sessions.get(sid)
+        if entry is not None:
+            self._sessions[sid] = (time.monotonic() + self.ttl_seconds, entry[1])
+
+
+class SqliteSessionBackend(SessionBackend):
+    """
+    Sessions dans un fichier SQLite : partagées entre workers, conservées au redémarrage.
+
+    Les grosses valeurs vont dans une table `blobs` (compressées, clé = hash du contenu) ;
+    les blobs orphelins et les sessions expirées sont purgés périodiquement.
+    """
+
+    PURGE_EVERY = 500  # nombre d'écritures entre deux purges
+
+    def __init__(self, path: str, ttl_seconds: int = settings.SESSION_TTL_SECONDS) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS sessions (
+                    sid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS blobs (
+                    hash TEXT PRIMARY KEY,
+                    data BLOB NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS session_blobs (
+                    sid TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    PRIMARY KEY (sid, hash)
+                );
+                """
+            )
+        self._purge()
+
+    def _purge(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (time.time(),))
+            self._conn.execute(
+                "DELETE FROM session_blobs WHERE sid NOT IN (SELECT sid FROM sessions)"
+            )
+            self._conn.execute(
+                "DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM session_blobs)"
+            )
+
+    def _load(self, sid: str) -> dict[str, Any] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires_at FROM sessions WHERE sid = ?", (sid,)
+            ).fetchone()
+            if row is None or row[1] < time.time():
+                return None
+            data: dict[str, Any] = json.loads(row[0])
+            for key, value in data.items():
+                if isinstance(value, dict) and BLOB_REF in value:
+                    blob = self._conn.execute(
+                        "SELECT data FROM blobs WHERE hash = ?", (value[BLOB_REF],)
+                    ).fetchone()
+                    data[key] = _decompress(blob[0]) if blob else None
+        return data
+
+    def _save(self, sid: str, data: dict[str, Any]) -> None:
+        packed: dict[str, Any] = {}
+        blobs: dict[str, str] = {}
+        for key, value in data.items():
+            if _is_blob_candidate(value):
+                digest = _blob_hash(value)
+                blobs[digest] = value
+                packed[key] = {BLOB_REF: digest}
+            else:
+                packed[key] = value
+
+        with self._lock, self._conn:
+            for digest, value in blobs.items():
+                exists = self._conn.execute(
+                    "SELECT 1 FROM blobs WHERE hash = ?", (digest,)
+                ).fetchone()
+                if not exists:
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)",
+                        (digest, _compress(value)),
+                    )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (sid, data, expires_at) VALUES (?, ?, ?)",
+                (sid, json.dumps(packed), time.time() + self.ttl_seconds),
+            )
+            self._conn.execute("DELETE FROM session_blobs WHERE sid = ?", (sid,))
+            self._conn.executemany(
+                "INSERT INTO session_blobs (sid, hash) VALUES (?, ?)",
+                [(sid, digest) for digest in blobs],
+            )
+
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._purge()
+
+    def _delete(self, sid: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+            self._conn.execute("DELETE FROM session_blobs WHERE sid = ?", (sid,))
+
+    def _touch(self, sid: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE sessions SET expires_at = ? WHERE sid = ?",
+                (time.time() + self.ttl_seconds, sid),
+            )
+
+    async def load(self, sid: str) -> dict[str, Any] | None:
+        return await asyncio.to_thread(self._load, sid)
+
+    async def save(self, sid: str, data: dict[str, Any]) -> None:
+        await asyncio.to_thread(self._save, sid, data)
+
+    async def delete(self, sid: str) -> None:
+        await asyncio.to_thread(self._delete, sid)
+
+    async def touch(self, sid: str) -> None:
+        await asyncio.to_thread(self._touch, sid)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_session_backend(name: str = settings.SESSION_BACKEND) -> SessionBackend | None:
+    """Instancie le backend configuré (None = session dans le cookie signé, mode historique)."""
+    name = name.lower()
+    if name == "cookie":
+        return None
+    if name == "memory":
+        return MemorySessionBackend()
+    if name == "sqlite":
+        return SqliteSessionBackend(settings.SESSION_DB_PATH)
+    raise ValueError(f"SESSION_BACKEND inconnu : {name}")
+
+
+class ServerSessionMiddleware:
+    """
+    Équivalent de `SessionMiddleware`, mais le cookie ne contient qu'un id opaque signé :
+    les données (`request.session`) sont stockées dans un `SessionBackend`.
+
+    La session n'est réécrite que si elle a été modifiée pendant la requête. Comme avec
+    `SessionMiddleware`, l'expiration est glissante : une session simplement lue est
+    prolongée de `max_age` (stockage et cookie), au plus une fois par `touch_interval`.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        backend: SessionBackend,
+        secret_key: str,
+        session_cookie: str = "session",
+        max_age: int = settings.SESSION_TTL_SECONDS,
+        same_site: str = "lax",
+        https_only: bool = False,
+        exclude_paths: tuple[str, ...] = ("/static",),
+        touch_interval: int = TOUCH_INTERVAL_SECONDS,
+    ) -> None:
+        self.app = app
+        self.backend = backend
+        self.signer = itsdangerous.TimestampSigner(str(secret_key))
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.touch_interval = min(touch_interval, max_age)
+        self.exclude_paths = exclude_paths
+        self.security_flags = "httponly; samesite=" + same_site
+        if https_only:
+            self.security_flags += "; secure"
+
+    def _cookie(self, value: str, max_age: int) -> str:
+        return f"{self.session_cookie}={value}; path=/; Max-Age={max_age}; {self.security_flags}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket") or scope["path"].startswith(
+            self.exclude_paths
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        sid: str | None = None
+        initial: dict[str, Any] = {}
+        stale = False
+
+        cookie = connection.cookies.get(self.session_cookie)
+        if cookie:
+            try:
+                unsigned, signed_at = self.signer.unsign(
+                    cookie.encode("utf-8"), max_age=self.max_age, return_timestamp=True
+                )
+                sid = unsigned.decode()
+            except BadSignature:
+                sid = None
+            if sid is not None:
+                loaded = await self.backend.load(sid)
+                if loaded is None:
+                    sid = None
+                else:
+                    initial = loaded
+                    # Cookie signé il y a plus de `touch_interval` : à prolonger
+                    stale = time.time() - signed_at.timestamp() > self.touch_interval
+
+        scope["session"] = dict(initial)
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal sid
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                if session != initial:
+                    headers = MutableHeaders(scope=message)
+                    if session:
+                        if sid is None:
+                            sid = secrets.token_urlsafe(32)
+                        await self.backend.save(sid, session)
+                        signed = self.signer.sign(sid.encode()).decode()
+                        headers.append("Set-Cookie", self._cookie(signed, self.max_age))
+                    elif sid is not None:
+                        await self.backend.delete(sid)
+                        headers.append("Set-Cookie", self._cookie("null", 0))
+                elif stale and sid is not None:
+                    await self.backend.touch(sid)
+                    signed = self.signer.sign(sid.encode()).decode()
+                    MutableHeaders(scope=message).append("Set-Cookie", self._cookie(signed, self.max_age))
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
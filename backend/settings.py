@@ -18,6 +18,124 @@ class Settings(BaseSettings):
     MAX_UPLOAD_MB: int = 5
     RATE_LIMIT_PER_MIN: int = 120
     RATE_LIMIT_BURST: int = 40
+    RATE_LIMIT_BACKEND: str = "memory"  # memory | sqlite
+    RATE_LIMIT_DB_PATH: str = "ratelimit.db"
+    RATE_LIMIT_MAX_CLIENTS: int = 50_000
+    RATE_LIMIT_SHARDS: int = 16
+    # Coût en jetons par préfixe d'URL, éventuellement précédé d'une méthode
+    # (le plus long gagne, 1 par défaut). Une action utilisateur n'est comptée qu'une fois :
+    # le flux SSE qui suit le POST et le formulaire GET de la réécriture coûtent peu.
+    RATE_LIMIT_ROUTE_COSTS: dict[str, float] = {
+        "/analyze": 5.0,
+        "/analyze/stream": 0.25,
+        "/pro/rewrite": 5.0,
+        "GET /pro/rewrite": 1.0,
+        "/pro/rewrite/stream": 0.25,
+        "/api/analyze": 5.0,
+        "/api/batch": 20.0,
+        "/api/index": 2.0,
+        "/jobs": 0.25,  # suivi d'un job (polling)
+    }
+    RATE_LIMIT_EXCLUDED_PATHS: list[str] = ["/static", "/health", "/metrics", "/internal"]
+
+    PARSE_WORKERS: int = 2
+    PARSE_TIMEOUT_SECONDS: float = 20.0
+    PARSE_MAX_QUEUE: int = 16
+    PARSE_MAX_JOBS_PER_WORKER: int = 100
+
+    PDF_MAX_PAGES: int = 10
+    PDF_MAX_CHARS: int = 30_000
+    PDF_PAGES_PER_JOB: int = 4
+    PDF_SLOW_LOG_MS: float = 1000.0
+
+    PARSE_CACHE_ENABLED: bool = True
+    PARSE_CACHE_MAX_MB: int = 32  # taille totale des textes gardés en mémoire
+    PARSE_CACHE_DB_PATH: str | None = None  # ex: "parsed_cv.db" pour un tier disque
+    PARSE_CACHE_DISK_MAX_MB: int = 256
+
+    LLM_STREAMING: bool = False
+    # Réponses du modèle en JSON validé (schémas de analysis_schema), rendues en markdown côté serveur
+    LLM_STRUCTURED_OUTPUT: bool = False
+    # Ré-analyse après modification du CV / de l'offre : seules les sections touchées sont réécrites
+    INCREMENTAL_ANALYSIS: bool = True
+    INCREMENTAL_MAX_CHANGE: float = 0.25  # part du texte modifiée au-delà de laquelle on refait tout
+
+    MARKDOWN_POOL_SIZE: int = 4  # instances Markdown gardées prêtes à l'emploi
+    MARKDOWN_CACHE_ENTRIES: int = 256  # 0 = pas de mémoïsation du HTML
+    MARKDOWN_OFFLOAD_MIN_CHARS: int | None = None  # rendu dans un thread au-delà (None = jamais)
+
+    LLM_POOL_MAX_CONNECTIONS: int = 50
+    LLM_POOL_MAX_KEEPALIVE: int = 20
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    LLM_READ_TIMEOUT_SECONDS: float = 60.0
+    LLM_POOL_TIMEOUT_SECONDS: float = 10.0
+    LLM_HTTP2: bool = False  # nécessite le paquet "h2" (pip install httpx[http2])
+    LLM_WARMUP: bool = True
+
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 512
+    LLM_CACHE_MAX_MB: int = 16
+    LLM_CACHE_TTL_SECONDS: float = 24 * 3600
+    LLM_CACHE_DB_PATH: str | None = None
+    LLM_CACHE_DISK_MAX_MB: int = 256
+
+    LLM_MAX_CONCURRENCY: int = 16
+    LLM_FREE_CONCURRENCY: int = 10
+    LLM_PRO_CONCURRENCY: int = 8
+    LLM_TOKENS_PER_MINUTE: int = 0  # quota du provider, 0 = pas de limite
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 15.0
+
+    LLM_RETRY_ATTEMPTS: int = 3
+    LLM_RETRY_BASE_SECONDS: float = 0.5
+    LLM_RETRY_MAX_SECONDS: float = 8.0
+    LLM_HEDGE_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_SAMPLES: int = 20
+    # Modèles de repli essayés dans l'ordre quand le modèle principal échoue
+    LLM_FALLBACK_MODELS: dict[str, list[str]] = {"gpt-4o": ["gpt-4o-mini"]}
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_RESET_SECONDS: float = 30.0
+
+    PROMPT_COMPACTION: bool = True
+    # Budget de tokens (CV + offre) par modèle dans le prompt
+    PROMPT_TOKEN_BUDGETS: dict[str, int] = {"gpt-4o-mini": 6000, "gpt-4o": 6000}
+    PROMPT_DEFAULT_TOKEN_BUDGET: int = 6000
+    PROMPT_JOB_SHARE: float = 0.35  # part max du budget pour l'offre
+
+    SKILLS_ENABLED: bool = True
+    SKILLS_DICTIONARY_PATH: str | None = None  # défaut : backend/data/skills.txt
+    SKILLS_MAX_MISSING: int = 15
+    SKILLS_HINT_IN_PROMPT: bool = False
+
+    # "llm" ou "local" : /analyze toujours servi par le moteur local, sans IA (offre gratuite)
+    ANALYSIS_ENGINE: str = "llm"
+    # Sans clé API, provider saturé / en panne / hors quota : analyse locale plutôt qu'un message
+    LOCAL_ANALYSIS_FALLBACK: bool = True
+
+    # Index d'embeddings CV / offres (API partenaires, nécessite numpy)
+    EMBEDDINGS_ENABLED: bool = False
+    EMBEDDINGS_PROVIDER: str = "local"  # "local" (hachage de mots, hors ligne) ou "api"
+    EMBEDDINGS_MODEL: str = "text-embedding-3-small"
+    EMBEDDINGS_DIMENSIONS: int = 256
+    EMBEDDINGS_DIR: str = "embeddings"
+    EMBEDDINGS_BATCH_SIZE: int = 64  # textes par appel à l'endpoint d'embeddings
+    EMBEDDINGS_TOP_K: int = 10
+
+    BATCH_API_KEY: str | None = None  # API batch désactivée si absent
+    INTERNAL_API_KEY: str | None = None  # /internal/stats et /metrics désactivés si absent
+    BATCH_MAX_FILES: int = 200
+    BATCH_MAX_ITEMS: int = 200
+    BATCH_CONCURRENCY: int = 4
+    JOB_MODE: bool = False  # /analyze et /rewrite renvoient un id de job au lieu d'attendre l'IA
+    JOB_DB_PATH: str = "jobs.db"
+    JOB_WORKERS: int = 4
+    JOB_LEASE_SECONDS: float = 300.0  # un job "running" plus vieux est repris par un autre worker
+    JOB_TTL_SECONDS: float = 86400.0
+    JOB_POLL_SECONDS: float = 1.0
+    METRICS_ENABLED: bool = True  # /metrics (format Prometheus)
+    METRICS_SERVER_TIMING: bool = True  # en-tête Server-Timing par étape
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5  # 0 = pas de mesure du retard de l'event loop
     LOG_LEVEL: str = "INFO"
 
     STRIPE_SECRET_KEY: str | None = None
@@ -28,6 +146,11 @@ class Settings(BaseSettings):
     PUBLIC_BASE_URL: str | None = None
 
     SESSION_SECRET_KEY: str = "dev_secret"
+    SESSION_BACKEND: str = "sqlite"  # sqlite | memory | cookie
+    SESSION_DB_PATH: str = "sessions.db"
+    # Comme SessionMiddleware : 14 jours, prolongés à chaque visite
+    SESSION_TTL_SECONDS: int = 14 * 24 * 3600
+    SESSION_MAX_ENTRIES: int = 10_000
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,231 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Iterable
+
+from .prompt_compaction import fold
+from .settings import settings
+
+logger = logging.getLogger("fmp.skills")
+
+DEFAULT_DICTIONARY = Path(__file__).parent / "data" / "skills.txt"
+# Au-delà, une compétence répétée dans l'offre ne pèse pas plus lourd dans le score
+MAX_WEIGHT = 3
+
+
+def _normalize(term: str) -> str:
+    return " ".join(fold(term).split())
+
+
+CATEGORY_PREFIX = "# ---"
+
+
+def load_dictionary(path: str | Path) -> list[tuple[str, list[str]]]:
+    """Lit le dictionnaire : une compétence par ligne, synonymes séparés par "|"."""
+    entries: list[tuple[str, list[str]]] = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        variants = [variant.strip() for variant in line.split("|") if variant.strip()]
+        entries.append((variants[0], variants))
+    return entries
+
+
+def load_categories(path: str | Path) -> dict[str, str]:
+    """Catégorie de chaque compétence : le dernier titre "# --- …" qui la précède."""
+    categories: dict[str, str] = {}
+    category = ""
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line.startswith(CATEGORY_PREFIX):
+            category = line[len(CATEGORY_PREFIX) :].strip()
+        elif line and not line.startswith("#"):
+            categories[line.split("|")[0].strip()] = category
+    return categories
+
+
+class SkillMatcher:
+    """
+    Automate d'Aho-Corasick sur le dictionnaire de compétences.
+
+    Construit une seule fois par process, il trouve toutes les compétences d'un texte
+    en un seul passage, quelle que soit la taille du dictionnaire. Les transitions sont
+    stockées dans un unique dict (état, caractère) pour rester compact en mémoire.
+    """
+
+    def __init__(self, entries: Iterable[tuple[str, Iterable[str]]]) -> None:
+        self.skills: list[str] = []
+        self._goto: dict[tuple[int, str], int] = {}
+        self._fail: list[int] = [0]
+        # état terminal -> (id de la compétence, longueur du motif)
+        self._terminal: list[tuple[int, int] | None] = [None]
+        # prochain état terminal en suivant les liens de suppléance
+        self._output_link: list[int] = [0]
+        children: list[list[tuple[str, int]]] = [[]]
+
+        for skill, patterns in entries:
+            skill_id = len(self.skills)
+            self.skills.append(skill)
+            for pattern in patterns:
+                pattern = _normalize(pattern)
+                if pattern:
+                    self._add(pattern, skill_id, children)
+
+        self._link(children)
+
+    def __len__(self) -> int:
+        return len(self.skills)
+
+    @property
+    def states(self) -> int:
+        return len(self._fail)
+
+    def _add(self, pattern: str, skill_id: int, children: list[list[tuple[str, int]]]) -> None:
+        state = 0
+        for char in pattern:
+            next_state = self._goto.get((state, char))
+            if next_state is None:
+                next_state = len(self._fail)
+                self._goto[(state, char)] = next_state
+                self._fail.append(0)
+                self._terminal.append(None)
+                self._output_link.append(0)
+                children.append([])
+                children[state].append((char, next_state))
+            state = next_state
+        self._terminal[state] = (skill_id, len(pattern))
+
+    def _link(self, children: list[list[tuple[str, int]]]) -> None:
+        queue = deque(child for _, child in children[0])
+        while queue:
+            state = queue.popleft()
+            for char, child in children[state]:
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and (fallback, char) not in self._goto:
+                    fallback = self._fail[fallback]
+                target = self._goto.get((fallback, char), 0)
+                self._fail[child] = target
+                self._output_link[child] = (
+                    target if self._terminal[target] is not None else self._output_link[target]
+                )
+
+    def find(self, text: str) -> Counter[int]:
+        """Occurrences de chaque compétence (par id), sur des mots entiers."""
+        text = _normalize(text)
+        goto, fail, terminal, output_link = (
+            self._goto,
+            self._fail,
+            self._terminal,
+            self._output_link,
+        )
+        found: Counter[int] = Counter()
+        last = len(text) - 1
+        state = 0
+
+        for index, char in enumerate(text):
+            while state and (state, char) not in goto:
+                state = fail[state]
+            state = goto.get((state, char), 0)
+
+            output = state if terminal[state] is not None else output_link[state]
+            while output:
+                skill_id, length = terminal[output]  # type: ignore[misc]
+                start = index - length + 1
+                # "java" ne doit pas matcher dans "javascript", ni "go" dans "google"
+                if (start == 0 or not text[start - 1].isalnum() or not text[start].isalnum()) and (
+                    index == last or not text[index + 1].isalnum() or not char.isalnum()
+                ):
+                    found[skill_id] += 1
+                output = output_link[output]
+
+        return found
+
+
+@dataclass
+class SkillMatch:
+    """Couverture des compétences de l'offre par le CV (score déterministe, 0 à 100)."""
+
+    score: int
+    matched: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    # Ids (SkillMatcher.skills) des compétences de l'offre présentes dans le CV
+    matched_ids: frozenset[int] = field(default_factory=frozenset, repr=False)
+
+    def prompt_hint(self) -> str:
+        lines = [f"Couverture des mots-clés de l'offre (détection automatique) : {self.score}/100."]
+        if self.matched:
+            lines.append("Présents dans le CV : " + ", ".join(self.matched) + ".")
+        if self.missing:
+            lines.append("Absents du CV : " + ", ".join(self.missing) + ".")
+        return "\n".join(lines)
+
+
+@lru_cache(maxsize=1)
+def get_skill_matcher() -> SkillMatcher:
+    """Charge et compile le dictionnaire une seule fois par process."""
+    path = settings.SKILLS_DICTIONARY_PATH or DEFAULT_DICTIONARY
+    started = time.perf_counter()
+    matcher = SkillMatcher(load_dictionary(path))
+    logger.info(
+        "Dictionnaire de compétences compilé : %d compétences, %d états, %.0f ms (%s)",
+        len(matcher),
+        matcher.states,
+        (time.perf_counter() - started) * 1000,
+        path,
+    )
+    return matcher
+
+
+@lru_cache(maxsize=1)
+def get_skill_categories() -> dict[str, str]:
+    return load_categories(settings.SKILLS_DICTIONARY_PATH or DEFAULT_DICTIONARY)
+
+
+def match_skills(cv_text: str, job_text: str) -> SkillMatch | None:
+    """
+    Compare les compétences de l'offre à celles du CV, sans appel IA.
+
+    Chaque compétence de l'offre pèse selon son nombre d'occurrences (plafonné) ;
+    les manquantes sont listées par importance décroissante. None si l'offre
+    ne contient aucune compétence connue du dictionnaire.
+    """
+    if not settings.SKILLS_ENABLED:
+        return None
+
+    matcher = get_skill_matcher()
+    job_skills = matcher.find(job_text)
+    if not job_skills:
+        return None
+    return score_skills(matcher, matcher.find(cv_text), job_skills)
+
+
+def score_skills(matcher: SkillMatcher, cv_skills: Counter[int], job_skills: Counter[int]) -> SkillMatch:
+    """Score à partir des compétences déjà trouvées (`SkillMatcher.find`) dans le CV et l'offre."""
+    total = matched_weight = 0
+    matched: list[str] = []
+    matched_ids: set[int] = set()
+    missing: list[str] = []
+    # most_common est stable : à poids égal, l'ordre d'apparition dans l'offre est conservé
+    for skill_id, count in job_skills.most_common():
+        weight = min(count, MAX_WEIGHT)
+        total += weight
+        if skill_id in cv_skills:
+            matched_weight += weight
+            matched.append(matcher.skills[skill_id])
+            matched_ids.add(skill_id)
+        else:
+            missing.append(matcher.skills[skill_id])
+
+    return SkillMatch(
+        score=round(100 * matched_weight / total),
+        matched=matched,
+        missing=missing[: settings.SKILLS_MAX_MISSING],
+        matched_ids=frozenset(matched_ids),
+    )
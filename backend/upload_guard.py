@@ -1,8 +1,11 @@
+import hashlib
 from pathlib import Path
 from typing import Iterable
 
 from fastapi import UploadFile, HTTPException, status
 
+from .metrics import timed_stage
+
 
 ALLOWED_EXTENSIONS: set[str] = {".pdf", ".docx"}
 ALLOWED_MIME_TYPES: set[str] = {
@@ -11,6 +14,21 @@ ALLOWED_MIME_TYPES: set[str] = {
 }
 DEFAULT_MAX_UPLOAD_MB = 5
 
+SNIFF_BYTES = 8 * 1024
+CHUNK_BYTES = 1024 * 1024  # 1 Mo
+DIGEST_BYTES = 16
+
+
+def new_file_hasher() -> hashlib.blake2b:
+    """Hash rapide (BLAKE2b) du contenu d'un fichier, pour l'adresser dans un cache."""
+    return hashlib.blake2b(digest_size=DIGEST_BYTES)
+
+
+def file_digest(data: bytes | bytearray | memoryview) -> str:
+    hasher = new_file_hasher()
+    hasher.update(data)
+    return hasher.hexdigest()
+
 
 class UploadValidationError(HTTPException):
     """Erreur dédiée à la validation d'upload."""
@@ -30,19 +48,50 @@ def _mime_allowed(content_type: str | None) -> bool:
     return content_type.lower() in ALLOWED_MIME_TYPES
 
 
+def _magic_allowed(filename: str, head: bytes) -> bool:
+    """Vérifie que les premiers octets correspondent bien à l'extension annoncée."""
+    ext = Path(filename).suffix.lower()
+    if ext == ".pdf":
+        # la spec PDF tolère quelques octets parasites avant l'en-tête
+        return b"%PDF-" in head[:1024]
+    if ext == ".docx":
+        return head.startswith(b"PK\x03\x04")  # archive ZIP (Office Open XML)
+    return False
+
+
+def _declared_size(upload: UploadFile) -> int | None:
+    """Taille du fichier si elle est connue sans le lire (fichier déjà spoolé par Starlette)."""
+    if upload.size is not None:
+        return upload.size
+    try:
+        position = upload.file.tell()
+        end = upload.file.seek(0, 2)
+        upload.file.seek(position)
+    except (AttributeError, OSError, ValueError):
+        return None
+    return end - position
+
+
+@timed_stage("upload_guard")
 async def validate_and_read_upload(
     upload: UploadFile,
     max_upload_mb: int | None = None,
     allowed_extensions: Iterable[str] | None = None,
     allowed_mime_types: Iterable[str] | None = None,
-) -> bytes:
+    hasher: hashlib.blake2b | None = None,
+) -> memoryview:
     """
-    Valide un fichier uploadé (extension, MIME, taille) et renvoie ses bytes.
+    Valide un fichier uploadé (extension, MIME, signature, taille) et renvoie son contenu.
 
     - Vérifie l'extension (PDF/DOCX)
     - Vérifie le content-type
-    - Limite la taille à `max_upload_mb` (par défaut DEFAULT_MAX_UPLOAD_MB)
+    - Rejette d'emblée un fichier dont la taille annoncée dépasse `max_upload_mb`
+    - Vérifie la signature (`%PDF-` / ZIP) sur le premier bloc, avant de lire le reste
+    - Copie le fichier dans un bytearray préalloué (pas de liste de chunks + join)
 
+    Renvoie une `memoryview` sur ce buffer : les parsers la lisent sans copie.
+    Si `hasher` est fourni (cf. `new_file_hasher`), il est alimenté bloc par bloc
+    pendant la lecture : pas de second passage sur le fichier pour le hasher.
     Lève UploadValidationError (hérite de HTTPException) en cas de problème.
     """
     if max_upload_mb is None:
@@ -51,7 +100,8 @@ async def validate_and_read_upload(
     allowed_extensions_set = set(allowed_extensions or ALLOWED_EXTENSIONS)
     allowed_mime_types_set = set(allowed_mime_types or ALLOWED_MIME_TYPES)
 
-    if not _extension_allowed(upload.filename or ""):
+    filename = upload.filename or ""
+    if not _extension_allowed(filename):
         raise UploadValidationError(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Format de fichier non supporté. Utilise un PDF ou un DOCX.",
@@ -64,25 +114,45 @@ async def validate_and_read_upload(
         )
 
     max_bytes = max_upload_mb * 1024 * 1024
-    chunks: list[bytes] = []
-    total = 0
+    too_large = UploadValidationError(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"Fichier trop volumineux (max {max_upload_mb} Mo).",
+    )
 
-    while True:
-        chunk = await upload.read(1024 * 1024)  # 1 Mo
-        if not chunk:
-            break
-        total += len(chunk)
-        if total > max_bytes:
-            raise UploadValidationError(
-                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-                detail=f"Fichier trop volumineux (max {max_upload_mb} Mo).",
-            )
-        chunks.append(chunk)
-
-    if total == 0:
+    declared_size = _declared_size(upload)
+    if declared_size is not None and declared_size > max_bytes:
+        raise too_large
+
+    head = await upload.read(SNIFF_BYTES)
+    if not head:
         raise UploadValidationError(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Fichier vide ou illisible.",
         )
 
-    return b"".join(chunks)
+    if not _magic_allowed(filename, head):
+        raise UploadValidationError(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Le contenu du fichier ne correspond pas à un PDF ou un DOCX valide.",
+        )
+
+    if hasher is not None:
+        hasher.update(head)
+
+    buffer = bytearray(declared_size or len(head))
+    buffer[: len(head)] = head
+    total = len(head)
+
+    while True:
+        chunk = await upload.read(CHUNK_BYTES)
+        if not chunk:
+            break
+        end = total + len(chunk)
+        if end > max_bytes:
+            raise too_large
+        buffer[total:end] = chunk  # écrit en place tant que la taille annoncée est respectée
+        if hasher is not None:
+            hasher.update(chunk)
+        total = end
+
+    return memoryview(buffer)[:total]
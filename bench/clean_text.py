@@ -0,0 +1,74 @@
+"""
+Benchmark de `clean_text` (1 Ko, 100 Ko, 5 Mo) contre l'ancienne implémentation.
+
+Vérifie aussi que la sortie est identique à l'ancienne version sur un corpus
+de textes type PDF (lignes, tableaux, longues suites d'espaces), puis que les
+espaces Unicode (insécables, fines, tabulations) sont bien normalisés.
+
+Usage :
+    python -m bench.clean_text
+"""
+from __future__ import annotations
+
+import random
+import timeit
+
+from backend.parse_cv import clean_text
+
+WORDS = (
+    "Développeur Python senior FastAPI PostgreSQL Docker Kubernetes AWS "
+    "gestion de projet agile Scrum équipe de 6 personnes 2019-2024 Paris "
+    "Compétences Expériences Formation Master Informatique Langues anglais"
+).split()
+
+
+def legacy_clean_text(text: str) -> str:
+    """Implémentation d'origine (boucle de remplacement des doubles espaces)."""
+    if not text:
+        return ""
+    lines = [line.strip() for line in text.splitlines()]
+    joined = " ".join(line for line in lines if line)
+    while "  " in joined:
+        joined = joined.replace("  ", " ")
+    return joined.strip()
+
+
+def make_text(size: int, seed: int = 0) -> str:
+    """Texte type extraction PDF/OCR : lignes courtes, colonnes alignées, blancs en rafale."""
+    rng = random.Random(seed)
+    parts: list[str] = []
+    total = 0
+    while total < size:
+        line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 12)))
+        if rng.random() < 0.3:  # colonnes de tableau alignées à l'espace
+            line = (" " * rng.randint(2, 60)).join(line.split(" "))
+        line = " " * rng.randint(0, 8) + line + " " * rng.randint(0, 40)
+        parts.append(line)
+        parts.append("\n" * rng.randint(1, 4) if rng.random() < 0.9 else "\r\n")
+        total += len(line) + 1
+    return "".join(parts)[:size]
+
+
+def check_corpus() -> None:
+    for seed in range(200):
+        text = make_text(random.Random(seed).randint(0, 4000), seed)
+        assert clean_text(text) == legacy_clean_text(text), f"divergence (seed={seed})"
+
+    unicode_text = "Jean\u00a0Dupont\t– Développeur Python\u2009\u3000\n\n  Paris"
+    assert clean_text(unicode_text) == "Jean Dupont – Développeur Python Paris"
+    print("corpus : sortie identique à l'ancienne version (200 textes), espaces Unicode normalisés")
+
+
+def main() -> None:
+    check_corpus()
+    print(f"{'taille':<8} {'ancienne (ms)':>14} {'nouvelle (ms)':>14} {'gain':>7}")
+    for label, size in (("1 Ko", 1024), ("100 Ko", 100 * 1024), ("5 Mo", 5 * 1024 * 1024)):
+        text = make_text(size)
+        number = max(1, 2_000_000 // size)
+        legacy = min(timeit.repeat(lambda: legacy_clean_text(text), number=number, repeat=3)) / number
+        new = min(timeit.repeat(lambda: clean_text(text), number=number, repeat=3)) / number
+        print(f"{label:<8} {legacy * 1000:>14.3f} {new * 1000:>14.3f} {legacy / new:>6.1f}x")
+
+
+if __name__ == "__main__":
+    main()
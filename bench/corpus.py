@@ -0,0 +1,125 @@
+"""
+Corpus de CV synthétiques (PDF et DOCX, de 1 à 10 pages) pour les benchmarks de charge.
+
+Les CV sont générés de façon déterministe (graine) : deux runs sur deux commits
+mesurent exactement les mêmes fichiers.
+
+Usage :
+    python -m bench.corpus --out bench/corpus
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import random
+from dataclasses import dataclass
+from pathlib import Path
+
+import docx
+import fitz
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# (nom, pages) : un CV court, un CV standard, un long CV de consultant
+SIZES = (("small", 1), ("medium", 3), ("large", 10))
+
+SKILLS = (
+    "Python", "FastAPI", "Django", "PostgreSQL", "Docker", "Kubernetes", "AWS", "Terraform",
+    "React", "TypeScript", "Java", "Spring", "Kafka", "Airflow", "Scrum", "CI/CD", "Linux",
+)
+VERBS = ("Conçu", "Développé", "Migré", "Piloté", "Optimisé", "Automatisé", "Encadré", "Déployé")
+OBJECTS = (
+    "une API de facturation utilisée par 40 000 clients",
+    "la plateforme de données de l'équipe marketing",
+    "le pipeline de déploiement continu",
+    "un moteur de recommandation produit",
+    "l'outil interne de suivi des incidents",
+    "la migration vers le cloud de 30 services",
+)
+OFFERS = (
+    "Développeur backend Python H/F. Vous concevez des API FastAPI, maintenez une base "
+    "PostgreSQL et déployez sur AWS avec Docker et Terraform. Méthodes agiles (Scrum).",
+    "Data engineer. Pipelines Airflow et Kafka, entrepôt PostgreSQL, scripts Python, "
+    "infrastructure Kubernetes. Anglais professionnel requis.",
+    "Développeur fullstack React / TypeScript et Java Spring. CI/CD, tests automatisés, "
+    "travail en équipe produit de 8 personnes.",
+)
+
+
+@dataclass
+class CorpusFile:
+    name: str
+    content_type: str
+    data: bytes
+    pages: int
+
+
+def _lines(rng: random.Random, pages: int) -> list[str]:
+    lines = [
+        f"Candidat {rng.randint(1, 9999)} - Développeur {rng.choice(SKILLS)}",
+        "Paris - candidat@example.com - 06 00 00 00 00",
+        "PROFIL",
+        "Développeur avec " + str(rng.randint(2, 15)) + " ans d'expérience, "
+        + ", ".join(rng.sample(SKILLS, 5)) + ".",
+        "EXPÉRIENCES PROFESSIONNELLES",
+    ]
+    # ≈ 45 lignes par page A4 en police 10
+    while len(lines) < pages * 45:
+        lines.append(f"Entreprise {rng.randint(1, 500)} - {rng.randint(2008, 2024)}")
+        for _ in range(rng.randint(3, 6)):
+            lines.append(
+                f"- {rng.choice(VERBS)} {rng.choice(OBJECTS)} ({', '.join(rng.sample(SKILLS, 3))})."
+            )
+    lines += ["FORMATION", "Master informatique", "COMPÉTENCES", ", ".join(SKILLS)]
+    return lines
+
+
+def make_pdf(pages: int, seed: int = 0) -> bytes:
+    lines = _lines(random.Random(seed), pages)
+    document = fitz.open()
+    per_page = 45
+    for start in range(0, len(lines), per_page):
+        page = document.new_page()
+        page.insert_text((40, 50), "\n".join(lines[start : start + per_page]), fontsize=10)
+    data = document.tobytes()
+    document.close()
+    return data
+
+
+def make_docx(pages: int, seed: int = 0) -> bytes:
+    document = docx.Document()
+    for line in _lines(random.Random(seed), pages):
+        document.add_paragraph(line)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def build_corpus(variants: int = 3) -> list[CorpusFile]:
+    """`variants` CV différents par format et par taille."""
+    files: list[CorpusFile] = []
+    for label, pages in SIZES:
+        for variant in range(variants):
+            seed = pages * 1000 + variant
+            files.append(CorpusFile(f"{label}-{variant}.pdf", PDF_MIME, make_pdf(pages, seed), pages))
+            files.append(
+                CorpusFile(f"{label}-{variant}.docx", DOCX_MIME, make_docx(pages, seed), pages)
+            )
+    return files
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--out", type=Path, default=Path("bench/corpus"))
+    parser.add_argument("--variants", type=int, default=3)
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    for corpus_file in build_corpus(args.variants):
+        (args.out / corpus_file.name).write_bytes(corpus_file.data)
+        print(f"{corpus_file.name:<16} {len(corpus_file.data) / 1024:>7.1f} Ko")
+
+
+if __name__ == "__main__":
+    main()
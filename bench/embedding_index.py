@@ -0,0 +1,77 @@
+"""
+Benchmark de l'index d'embeddings : ajouts incrémentaux puis recherche top-k sur
+100 000 documents (vecteurs aléatoires normalisés, dans un dossier temporaire).
+
+Mesure le temps d'ajout par lot (sans reconstruction), la latence d'une recherche
+(une requête, avec et sans filtre par type) et d'un lot de requêtes, et vérifie le
+top-k contre un tri complet.
+
+Usage :
+    python -m bench.embedding_index --documents 100000 --dimensions 256
+"""
+from __future__ import annotations
+
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from backend.embedding_index import CV, JOB, EmbeddingIndex
+
+APPEND_BATCH = 10_000
+
+
+def _timed(function, runs: int) -> float:
+    """Latence médiane en ms."""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--dimensions", type=int, default=256)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as directory:
+        index = EmbeddingIndex(directory, args.dimensions)
+        append_ms: list[float] = []
+        for start in range(0, args.documents, APPEND_BATCH):
+            size = min(APPEND_BATCH, args.documents - start)
+            vectors = rng.standard_normal((size, args.dimensions), dtype=np.float32)
+            entries = [(f"doc{start + row}", CV if (start + row) % 4 else JOB, "") for row in range(size)]
+            started = time.perf_counter()
+            index.add(entries, vectors)
+            append_ms.append((time.perf_counter() - started) * 1000)
+
+        size_mb = index.stats()["size_mb"]
+        print(f"index : {len(index)} documents × {args.dimensions} dimensions ({size_mb} Mo)")
+        print(f"ajout d'un lot de {APPEND_BATCH} : {statistics.median(append_ms):.1f} ms (médiane)")
+
+        query = rng.standard_normal(args.dimensions, dtype=np.float32)
+        queries = rng.standard_normal((64, args.dimensions), dtype=np.float32)
+        index.search(query, args.k)  # premier accès : pages du fichier mappées en mémoire
+
+        print(f"{'recherche top-' + str(args.k):<28} {'ms':>8}")
+        print(f"{'1 requête':<28} {_timed(lambda: index.search(query, args.k), args.runs):>8.2f}")
+        print(f"{'1 requête, type = job':<28} {_timed(lambda: index.search(query, args.k, JOB), args.runs):>8.2f}")
+        batch_ms = _timed(lambda: index.search(queries, args.k), max(args.runs // 4, 1))
+        print(f"{'64 requêtes (un lot)':<28} {batch_ms:>8.2f}")
+
+        matrix = np.fromfile(index.vectors_path, dtype=np.float32).reshape(-1, args.dimensions)
+        expected = np.argsort(-(matrix @ (query / np.linalg.norm(query))))[: args.k]
+        found = [int(match.id[3:]) for match in index.search(query, args.k)[0]]
+        print(f"top-k identique au tri complet : {found == expected.tolist()}")
+
+
+if __name__ == "__main__":
+    main()
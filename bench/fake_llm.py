@@ -0,0 +1,196 @@
+"""
+Faux serveur LLM compatible OpenAI (POST /chat/completions, avec ou sans streaming),
+pour mesurer l'app sous charge sans appeler (ni payer) un vrai provider.
+
+- latence avant le premier token, puis débit de tokens configurable
+- injection d'erreurs : 500 et 429 (avec Retry-After), en proportion des requêtes
+- réponse au format d'une vraie analyse ("Score global : XX/100", sections markdown)
+
+Se branche sur l'app via OPENROUTER_BASE_URL :
+    python -m bench.fake_llm --port 8900 --latency-ms 800 --tokens-per-second 80
+    OPENAI_API_KEY=bench OPENROUTER_BASE_URL=http://127.0.0.1:8900 uvicorn backend.main:app
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+SECTIONS = (
+    "Résumé du fit global",
+    "Forces principales",
+    "Points faibles / écarts",
+    "Mots-clés à ajouter",
+    "Plan d'action",
+)
+BULLETS = (
+    "Ton expérience en développement backend correspond bien aux missions du poste.",
+    "Mets en avant les résultats chiffrés de tes projets récents.",
+    "L'offre insiste sur le travail en équipe agile : donne un exemple concret.",
+    "Ajoute les outils cités dans l'offre que tu maîtrises déjà.",
+    "Reformule ton accroche pour reprendre l'intitulé exact du poste.",
+)
+
+
+@dataclass
+class FakeLLMConfig:
+    latency_ms: float = 500.0  # avant le premier token
+    tokens_per_second: float = 100.0  # 0 = réponse instantanée
+    error_rate: float = 0.0  # proportion de 500
+    rate_limit_rate: float = 0.0  # proportion de 429
+    completion_tokens: int = 700
+    seed: int | None = None
+
+
+def make_answer(rng: random.Random, target_tokens: int) -> str:
+    lines = [f"Score global : {rng.randint(35, 92)}/100", ""]
+    while len(" ".join(lines)) < target_tokens * 4:
+        for number, title in enumerate(SECTIONS, start=1):
+            lines += [f"## {number}. {title}", ""]
+            lines += [f"- {rng.choice(BULLETS)}" for _ in range(rng.randint(3, 5))]
+            lines.append("")
+    return "\n".join(lines)
+
+
+def _chunks(text: str, size: int = 4) -> list[str]:
+    """Découpe en morceaux d'environ un token (≈ 4 caractères), comme un vrai flux."""
+    return [text[index : index + size] for index in range(0, len(text), size)]
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    rng = random.Random(config.seed)
+    counters = {"requests": 0, "errors": 0, "rate_limited": 0}
+
+    @app.head("/")
+    @app.head("/{path:path}")
+    async def head(path: str = "") -> Response:
+        # Préchauffage de la connexion par l'app (llm_transport.warm_up)
+        return Response()
+
+    @app.get("/stats")
+    async def stats() -> JSONResponse:
+        return JSONResponse(counters)
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request) -> Response:
+        body = await request.json()
+        counters["requests"] += 1
+
+        draw = rng.random()
+        if draw < config.rate_limit_rate:
+            counters["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+        if draw < config.rate_limit_rate + config.error_rate:
+            counters["errors"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected failure", "type": "server_error"}},
+                status_code=500,
+            )
+
+        model = body.get("model", "fake")
+        max_tokens = int(body.get("max_tokens") or config.completion_tokens)
+        text = make_answer(rng, min(config.completion_tokens, max_tokens))
+        prompt_tokens = sum(len(message.get("content", "")) for message in body["messages"]) // 4
+        completion_tokens = len(text) // 4
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        delay = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+
+        await asyncio.sleep(config.latency_ms / 1000)
+
+        if not body.get("stream"):
+            await asyncio.sleep(delay * completion_tokens)
+            return JSONResponse(
+                {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": text},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                }
+            )
+
+        async def events():
+            for piece in _chunks(text):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                if delay:
+                    await asyncio.sleep(delay)
+            done = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency-ms", type=float, default=500.0)
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--completion-tokens", type=int, default=700)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        latency_ms=args.latency_ms,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        completion_tokens=args.completion_tokens,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_arguments(parser)
+    args = parser.parse_args()
+    uvicorn.run(create_app(config_from_args(args)), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
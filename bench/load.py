@@ -0,0 +1,310 @@
+"""
+Test de charge de /analyze et /pro/rewrite, contre un faux LLM local.
+
+Lance le faux serveur LLM (bench.fake_llm) et l'app (uvicorn, N workers) en sous-processus,
+puis envoie des CV du corpus synthétique (bench.corpus) avec une concurrence donnée.
+Pour chaque endpoint : req/s, latences p50 / p95 / p99, codes HTTP, et mémoire (RSS max)
+de chaque worker uvicorn. Les résultats sont écrits en JSON (commit, paramètres, mesures)
+pour comparer deux commits :
+
+    python -m bench.load --requests 200 --concurrency 16 --workers 2
+    python -m bench.load --compare bench/results/<avant>.json bench/results/<après>.json
+
+Par défaut le cache LLM est désactivé dans l'app : chaque requête va jusqu'au faux LLM.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator
+
+import httpx
+
+from bench import fake_llm
+from bench.corpus import OFFERS, CorpusFile, build_corpus
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "bench" / "results"
+ENDPOINTS = ("/analyze", "/pro/rewrite")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_http(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} ne répond pas après {timeout:.0f} s")
+
+
+@contextmanager
+def _process(command: list[str], env: dict[str, str], ready_url: str) -> Iterator[subprocess.Popen]:
+    process = subprocess.Popen(command, cwd=ROOT, env=env)
+    try:
+        _wait_http(ready_url)
+        yield process
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def _children(pid: int) -> list[int]:
+    try:
+        return [int(child) for child in Path(f"/proc/{pid}/task/{pid}/children").read_text().split()]
+    except OSError:
+        return []
+
+
+def _rss_mb(pid: int) -> float | None:
+    """RSS d'un process (Linux, /proc) ; None si indisponible."""
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+class MemorySampler:
+    """RSS max de chaque worker uvicorn (enfants du process maître, ou le maître seul)."""
+
+    def __init__(self, master_pid: int, interval: float = 0.25) -> None:
+        self.master_pid = master_pid
+        self.interval = interval
+        self.peaks: dict[int, float] = {}
+
+    def _workers(self) -> list[int]:
+        return _children(self.master_pid) or [self.master_pid]
+
+    def sample(self) -> None:
+        for pid in self._workers():
+            rss = _rss_mb(pid)
+            if rss is not None:
+                self.peaks[pid] = max(self.peaks.get(pid, 0.0), rss)
+
+    async def run(self) -> None:
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def report(self) -> dict[str, Any]:
+        values = list(self.peaks.values())
+        return {
+            "workers": len(values),
+            "rss_max_mb": [round(value, 1) for value in values],
+            "rss_max_mb_per_worker": round(max(values), 1) if values else None,
+        }
+
+
+def _percentile(sorted_values: list[float], percentile: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(percentile / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+async def run_endpoint(
+    base_url: str,
+    endpoint: str,
+    corpus: list[CorpusFile],
+    requests: int,
+    concurrency: int,
+    master_pid: int,
+) -> dict[str, Any]:
+    latencies: list[float] = []
+    statuses: Counter[str] = Counter()
+    counter = iter(range(requests))
+    sampler = MemorySampler(master_pid)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+
+        async def send(index: int) -> None:
+            cv = corpus[index % len(corpus)]
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    endpoint,
+                    files={"cv_file": (cv.name, cv.data, cv.content_type)},
+                    data={"job_offer": OFFERS[index % len(OFFERS)]},
+                )
+                statuses[str(response.status_code)] += 1
+            except httpx.HTTPError as exc:
+                statuses[type(exc).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+        async def worker() -> None:
+            for index in counter:
+                await send(index)
+
+        sampling = asyncio.create_task(sampler.run())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        sampling.cancel()
+        sampler.sample()
+
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(requests / elapsed, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(_percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+        "status": dict(statuses),
+        "memory": sampler.report(),
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _app_env(args: argparse.Namespace, llm_url: str) -> dict[str, str]:
+    return {
+        **os.environ,
+        "OPENAI_API_KEY": "bench",
+        "OPENROUTER_BASE_URL": llm_url,
+        "USE_FAKE_CHECKOUT": "true",
+        "LLM_STREAMING": "false",
+        "LLM_CACHE_ENABLED": "true" if args.llm_cache else "false",
+        # On mesure l'app, pas le rate limit
+        "RATE_LIMIT_PER_MIN": "100000000",
+        "RATE_LIMIT_BURST": "100000000",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, Any]:
+    corpus = build_corpus(args.variants)
+    llm_port, app_port = _free_port(), _free_port()
+    llm_url = f"http://127.0.0.1:{llm_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+
+    llm_command = [sys.executable, "-m", "bench.fake_llm", "--port", str(llm_port), "--seed", "0"]
+    for option in ("latency_ms", "tokens_per_second", "error_rate", "rate_limit_rate", "completion_tokens"):
+        llm_command += ["--" + option.replace("_", "-"), str(getattr(args, option))]
+    app_command = [sys.executable, "-m", "uvicorn", "backend.main:app", "--log-level", "warning"]
+    app_command += ["--host", "127.0.0.1", "--port", str(app_port), "--workers", str(args.workers)]
+
+    results: dict[str, Any] = {}
+    with _process(llm_command, dict(os.environ), f"{llm_url}/stats"):
+        with _process(app_command, _app_env(args, llm_url), f"{app_url}/health") as app:
+            for endpoint in args.endpoints:
+                print(f"{endpoint} : {args.requests} requêtes, concurrence {args.concurrency}…")
+                results[endpoint] = await run_endpoint(
+                    app_url, endpoint, corpus, args.requests, args.concurrency, app.pid
+                )
+        llm_stats = httpx.get(f"{llm_url}/stats").json()
+
+    return {
+        "commit": _git_commit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "params": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "workers": args.workers,
+            "corpus_files": len(corpus),
+            "llm_cache": args.llm_cache,
+            "fake_llm": {
+                "latency_ms": args.latency_ms,
+                "tokens_per_second": args.tokens_per_second,
+                "error_rate": args.error_rate,
+                "rate_limit_rate": args.rate_limit_rate,
+                "completion_tokens": args.completion_tokens,
+            },
+        },
+        "fake_llm_stats": llm_stats,
+        "endpoints": results,
+    }
+
+
+def print_report(report: dict[str, Any]) -> None:
+    print(f"{'endpoint':<14} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'RSS max Mo':>11}  statuts")
+    for endpoint, result in report["endpoints"].items():
+        rss = result["memory"]["rss_max_mb_per_worker"]
+        print(
+            f"{endpoint:<14} {result['rps']:>8.2f} {result['p50_ms']:>9.1f} {result['p95_ms']:>9.1f} "
+            f"{result['p99_ms']:>9.1f} {rss if rss is not None else '-':>11}  {result['status']}"
+        )
+
+
+def compare(before_path: Path, after_path: Path) -> None:
+    """Écart entre deux fichiers de résultats (avant -> après), par endpoint."""
+    before = json.loads(before_path.read_text())
+    after = json.loads(after_path.read_text())
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(f"{'endpoint':<14} {'mesure':<8} {'avant':>10} {'après':>10} {'écart':>8}")
+    for endpoint, result in after["endpoints"].items():
+        previous = before["endpoints"].get(endpoint)
+        if previous is None:
+            continue
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            old, new = previous[metric], result[metric]
+            delta = f"{(new - old) / old * 100:+.1f}%" if old else "-"
+            print(f"{endpoint:<14} {metric:<8} {old:>10.1f} {new:>10.1f} {delta:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--endpoints", nargs="+", default=list(ENDPOINTS))
+    parser.add_argument("--variants", type=int, default=3, help="CV différents par format et taille")
+    parser.add_argument("--llm-cache", action="store_true", help="garder le cache LLM de l'app actif")
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("AVANT", "APRES"))
+    fake_llm.add_arguments(parser)
+    parser.set_defaults(latency_ms=300.0, tokens_per_second=400.0)
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    report = asyncio.run(run(args))
+    print_report(report)
+
+    output = args.output or RESULTS_DIR / f"{time.strftime('%Y%m%d-%H%M%S')}-{report['commit'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"Résultats : {output}")
+
+
+if __name__ == "__main__":
+    main()
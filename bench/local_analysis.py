@@ -0,0 +1,41 @@
+"""
+Benchmark du moteur d'analyse local (sans IA) : temps d'`analyze_locally` par taille
+de CV (1, 3 et 10 pages du corpus synthétique) et par offre, à comparer à l'objectif
+de quelques dizaines de millisecondes au plus pour servir le mode mock / dégradé.
+
+Usage :
+    python -m bench.local_analysis
+"""
+from __future__ import annotations
+
+import random
+import statistics
+import time
+
+from backend.local_analysis import analyze_locally
+from backend.skill_matcher import get_skill_matcher
+from bench.corpus import OFFERS, SIZES, _lines
+
+RUNS = 20
+TARGET_MS = 50.0
+
+
+def main() -> None:
+    get_skill_matcher()  # compilation du dictionnaire hors mesure, comme au démarrage de l'app
+    print(f"{'CV':<8} {'caractères':>10} {'p50 ms':>8} {'max ms':>8}")
+    worst = 0.0
+    for label, pages in SIZES:
+        cv_text = "\n".join(_lines(random.Random(pages), pages))
+        samples: list[float] = []
+        for run in range(RUNS):
+            job_text = OFFERS[run % len(OFFERS)]
+            started = time.perf_counter()
+            analyze_locally(cv_text, job_text)
+            samples.append((time.perf_counter() - started) * 1000)
+        worst = max(worst, max(samples))
+        print(f"{label:<8} {len(cv_text):>10} {statistics.median(samples):>8.1f} {max(samples):>8.1f}")
+    print(f"pire cas : {worst:.1f} ms ({'sous les' if worst < TARGET_MS else 'au-delà des'} {TARGET_MS:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark du rendu markdown des réponses du modèle : `markdown.markdown(...)` à chaque
+appel (ancien chemin) contre `MarkdownRenderer` (instances réutilisées + mémoïsation).
+
+Les textes imitent une analyse réelle (≈ 900 tokens : score, titres, puces, gras,
+tableau). Trois cas sont mesurés :
+- ancien chemin : une instance Markdown neuve par rendu
+- renderer, textes tous différents : seul le pool d'instances joue
+- renderer, textes répétés : le HTML vient du cache
+
+Vérifie aussi que le HTML produit est identique à l'ancien chemin sur ce corpus
+(le texte ne contient pas de HTML brut, donc la sanitisation ne change rien).
+
+Usage :
+    python -m bench.markdown_render
+"""
+from __future__ import annotations
+
+import random
+import time
+
+import markdown
+
+from backend.markdown_render import MarkdownRenderer
+from backend.prompt_compaction import count_tokens
+
+RENDERS = 300
+
+PHRASES = (
+    "Ton expérience en développement Python correspond bien au poste",
+    "La maîtrise de **Docker** et de **Kubernetes** est un vrai plus",
+    "Mets en avant tes résultats chiffrés (réduction des coûts de 30 %)",
+    "L'offre insiste sur la gestion de projet agile et le travail en équipe",
+    "Ajoute une ligne sur ton niveau d'anglais professionnel",
+    "Les missions de l'offre recoupent ton poste actuel chez un éditeur SaaS",
+    "Reformule ton accroche pour reprendre le titre exact du poste",
+    "Précise la taille des équipes encadrées et le périmètre budgétaire",
+)
+SECTIONS = (
+    "Résumé du fit global",
+    "Forces principales",
+    "Points faibles / écarts",
+    "Mots-clés à ajouter",
+    "Plan d'action",
+)
+
+
+def make_analysis(seed: int) -> str:
+    """Analyse type, dans le format demandé au modèle (≈ 900 tokens)."""
+    rng = random.Random(seed)
+    lines = [f"Score global : {rng.randint(30, 95)}/100", ""]
+    for number, title in enumerate(SECTIONS, start=1):
+        lines += [f"## {number}. {title}", ""]
+        for _ in range(rng.randint(5, 7)):
+            lines.append(f"- {rng.choice(PHRASES)}, en particulier sur le projet n°{rng.randint(1, 99)}.")
+        lines.append("")
+    lines += ["| Compétence | CV | Offre |", "|---|---|---|"]
+    for _ in range(6):
+        lines.append(f"| {rng.choice(('Python', 'SQL', 'AWS', 'Scrum'))} | oui | {rng.choice(('oui', 'non'))} |")
+    return "\n".join(lines)
+
+
+def legacy_render(text: str) -> str:
+    return markdown.markdown(text, extensions=["extra"])
+
+
+def timed(render, texts: list[str], repeat: int = 5) -> float:
+    """Meilleur temps moyen par rendu sur `repeat` passages (limite le bruit du GC / CPU)."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in texts:
+            render(text)
+        best = min(best, (time.perf_counter() - started) / len(texts))
+    return best
+
+
+def main() -> None:
+    unique = [make_analysis(seed) for seed in range(RENDERS)]
+    repeated = [unique[index % 10] for index in range(RENDERS)]
+    tokens = sum(count_tokens(text) for text in unique) / len(unique)
+
+    renderer = MarkdownRenderer(pool_size=4, cache_entries=256)
+    for text in unique[:20]:
+        assert renderer.render(text, cache=False) == legacy_render(text), "HTML différent"
+    print(f"corpus : {RENDERS} analyses de ≈ {tokens:.0f} tokens, HTML identique à l'ancien chemin")
+
+    legacy = timed(legacy_render, unique)
+    pooled = timed(lambda text: renderer.render(text, cache=False), unique)
+    cached = timed(renderer.render, repeated)
+
+    print(f"{'variante':<34} {'ms/rendu':>9} {'gain':>7}")
+    print(f"{'ancien (Markdown neuf par appel)':<34} {legacy * 1000:>9.3f} {'1.0x':>7}")
+    print(f"{'renderer, textes différents':<34} {pooled * 1000:>9.3f} {legacy / pooled:>6.1f}x")
+    print(f"{'renderer, textes répétés':<34} {cached * 1000:>9.3f} {legacy / cached:>6.1f}x")
+    print(f"cache : {renderer.stats()}")
+
+
+if __name__ == "__main__":
+    main()
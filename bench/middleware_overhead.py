@@ -0,0 +1,124 @@
+"""
+Micro-benchmark du coût des middlewares (session + rate limit) sur /health et un fichier statique.
+
+Les requêtes passent directement par l'app ASGI (httpx.ASGITransport, sans réseau),
+pour ne mesurer que la pile applicative. Trois variantes sont comparées :
+
+- "nu" : aucun middleware
+- "base_http" : rate limit via BaseHTTPMiddleware (ancienne implémentation) + session
+- "asgi" : pile actuelle (RateLimitMiddleware ASGI pur + session)
+
+Usage :
+    python -m bench.middleware_overhead --requests 5000 --concurrency 32
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import statistics
+import time
+from pathlib import Path
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import PlainTextResponse
+
+from backend.rate_limit import MemoryRateLimiter, RateLimitMiddleware
+
+ROOT = Path(__file__).resolve().parent.parent
+# Limites très hautes : on mesure le coût du middleware, pas des 429
+RATE_PER_MINUTE = 10_000_000
+BURST = 10_000_000
+
+
+class BaseHTTPRateLimitMiddleware(BaseHTTPMiddleware):
+    """Reproduction de l'ancien middleware (BaseHTTPMiddleware, sans exclusion)."""
+
+    def __init__(self, app) -> None:
+        super().__init__(app)
+        self.limiter = MemoryRateLimiter(RATE_PER_MINUTE, BURST)
+
+    async def dispatch(self, request, call_next):
+        client_ip = request.client.host if request.client else "unknown"
+        if not self.limiter.allow_sync(client_ip):
+            return PlainTextResponse("Trop de requêtes.", status_code=429)
+        return await call_next(request)
+
+
+def build_app(variant: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return JSONResponse({"status": "ok"})
+
+    app.mount("/static", StaticFiles(directory=ROOT / "static"), name="static")
+
+    if variant == "base_http":
+        app.add_middleware(SessionMiddleware, secret_key="bench")
+        app.add_middleware(BaseHTTPRateLimitMiddleware)
+    elif variant == "asgi":
+        app.add_middleware(SessionMiddleware, secret_key="bench")
+        app.add_middleware(
+            RateLimitMiddleware,
+            rate_per_minute=RATE_PER_MINUTE,
+            burst=BURST,
+            exclude_paths=(),  # on mesure le pire cas : toutes les requêtes sont comptées
+        )
+    return app
+
+
+async def run(app: FastAPI, path: str, requests: int, concurrency: int) -> dict[str, float]:
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for i in range(requests):
+            queue.put_nowait(i)
+
+        async def worker() -> None:
+            while not queue.empty():
+                queue.get_nowait()
+                start = time.perf_counter()
+                response = await client.get(path)
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 200, response.status_code
+
+        # chauffe
+        for _ in range(50):
+            await client.get(path)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=3000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    print(f"{'variante':<10} {'route':<18} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8}")
+    for path in ("/health", "/static/style.css"):
+        for variant in ("nu", "base_http", "asgi"):
+            result = await run(build_app(variant), path, args.requests, args.concurrency)
+            print(
+                f"{variant:<10} {path:<18} {result['rps']:>9.0f} "
+                f"{result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Benchmark de `compact_inputs` sur des CV / offres longs, avec et sans ponctuation.
+
+Vérifie d'abord que la compaction ne vide jamais un texte : un CV ou une offre sans
+ponctuation (un seul segment géant) est coupé au budget au lieu d'être abandonné.
+Vérifie aussi que la déduplication ne retire que les en-têtes / pieds de page
+(répétés sur chaque page) et pas une phrase citée dans deux expériences.
+
+Usage :
+    python -m bench.prompt_compaction
+"""
+from __future__ import annotations
+
+import random
+import timeit
+
+from backend.prompt_compaction import compact_inputs, count_tokens, dedupe_segments, token_budget
+
+MODEL = "openai/gpt-4o-mini"
+WORDS = (
+    "Développeur Python senior FastAPI PostgreSQL Docker Kubernetes AWS "
+    "gestion de projet agile Scrum équipe de 6 personnes 2019-2024 Paris "
+    "Compétences Expériences Formation Master Informatique Langues anglais"
+).split()
+
+
+def make_text(size: int, separator: str, seed: int = 0) -> str:
+    """Suite de courtes phrases séparées par `separator` ("." ou " - " sans ponctuation)."""
+    rng = random.Random(seed)
+    parts: list[str] = []
+    total = 0
+    while total < size:
+        part = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 14)))
+        parts.append(part)
+        total += len(part) + len(separator)
+    return separator.join(parts)[:size]
+
+
+def check_corpus() -> None:
+    budget = token_budget(MODEL)
+    for label, cv_size, job_size, separator in (
+        ("sans ponctuation", 35_000, 84_000, " - "),
+        ("ponctué", 35_000, 84_000, ". "),
+    ):
+        cv = make_text(cv_size, separator, seed=1)
+        job = make_text(job_size, separator, seed=2)
+        compacted_cv, compacted_job = compact_inputs(cv, job, MODEL)
+        assert compacted_cv and compacted_job, f"texte vidé ({label})"
+        total = count_tokens(compacted_cv, MODEL) + count_tokens(compacted_job, MODEL)
+        assert total <= budget, f"budget dépassé ({label}) : {total} > {budget}"
+        if separator == " - ":
+            # Un seul segment géant : on garde le début du texte, coupé au budget
+            assert cv.startswith(compacted_cv) and job.startswith(compacted_job), label
+    # Offre seule, sans ponctuation, plus grande que tout le budget
+    _, job_only = compact_inputs("Jean Dupont", make_text(200_000, " ", seed=3), MODEL)
+    assert job_only, "offre vidée"
+
+    segments = [
+        "EXPÉRIENCES", "Acme 2020-2024.", "Développement d'API REST.", "Encadrement de 3 personnes.",
+        "Page 1 sur 2", "Jean Dupont - CV", "Globex 2016-2020.", "Développement d'API REST.",
+        "Encadrement de 3 personnes.", "2/2", "Jean Dupont - CV", "FORMATION", "Jean Dupont - CV",
+    ]
+    kept = dedupe_segments(segments)
+    assert kept.count("Développement d'API REST.") == 2 and kept.count("Encadrement de 3 personnes.") == 2
+    assert kept.count("Jean Dupont - CV") == 1, "en-tête répété sur chaque page non retiré"
+    assert "2/2" not in kept and "Page 1 sur 2" not in kept
+    print("corpus : CV / offres sans ponctuation compactés sans être vidés, phrases répétées 2 fois conservées")
+
+
+def main() -> None:
+    check_corpus()
+    print(f"{'cas':<20} {'entrée (tokens)':>16} {'sortie (tokens)':>16} {'temps (ms)':>11}")
+    for label, separator in (("ponctué", ". "), ("sans ponctuation", " - ")):
+        cv = make_text(35_000, separator, seed=1)
+        job = make_text(84_000, separator, seed=2)
+        compacted_cv, compacted_job = compact_inputs(cv, job, MODEL)
+        before = count_tokens(cv, MODEL) + count_tokens(job, MODEL)
+        after = count_tokens(compacted_cv, MODEL) + count_tokens(compacted_job, MODEL)
+        elapsed = min(timeit.repeat(lambda: compact_inputs(cv, job, MODEL), number=3, repeat=3)) / 3
+        print(f"{label:<20} {before:>16} {after:>16} {elapsed * 1000:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()